@@ -9,6 +9,36 @@ const Dashboard = () => {
 
   useEffect(() => {
     fetchStats();
+
+    // Live counters over server-sent events. EventSource cannot send the
+    // Authorization header, so it connects with a short-lived stream token.
+    let source = null;
+    let retry = null;
+    let stopped = false;
+    const connect = async () => {
+      try {
+        const response = await axios.post('/dashboard/stream-token');
+        if (stopped) return;
+        const token = encodeURIComponent(response.data.token);
+        source = new EventSource(`${axios.defaults.baseURL}/dashboard/stream?token=${token}`);
+        source.onmessage = (event) => setStats(JSON.parse(event.data));
+        source.onerror = () => {
+          // The token has expired by the time EventSource reconnects on
+          // its own, so reconnect with a fresh one
+          source.close();
+          retry = setTimeout(connect, 5000);
+        };
+      } catch (error) {
+        retry = setTimeout(connect, 30000);
+      }
+    };
+    connect();
+
+    return () => {
+      stopped = true;
+      clearTimeout(retry);
+      if (source) source.close();
+    };
   }, []);
 
   const fetchStats = async () => {
@@ -22,7 +22,7 @@ const Invoices = () => {
       if (filter !== 'all') {
         params.invoice_type = filter;
       }
-      const response = await axios.get('/invoices', { params });
+      const response = await axios.get('/invoices/summary', { params });
       setInvoices(response.data);
     } catch (error) {
       toast.error('فشل تحميل الفواتير');
@@ -0,0 +1,141 @@
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import insert
+
+from database import SessionLocal
+from models import AuditLog
+
+# Audit events are queued in process and written to audit_logs by a
+# background thread in bulk inserts, whenever AUDIT_FLUSH_SIZE events are
+# waiting or AUDIT_FLUSH_INTERVAL_SECONDS have passed, so recording an event
+# never adds a commit to the request. When the queue is full new events are
+# dropped (and counted) rather than blocking the request. stop() drains the
+# queue on graceful shutdown.
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_FLUSH_SIZE = int(os.getenv("AUDIT_FLUSH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1"))
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+_stop = threading.Event()
+_worker = None
+_lock = threading.Lock()
+_counts = {"written": 0, "dropped": 0, "failed": 0, "flushes": 0}
+
+def _count(name: str, amount: int = 1):
+    with _lock:
+        _counts[name] += amount
+
+def record(
+    user_id: str,
+    action: str,
+    entity_type: str,
+    entity_id: Optional[str] = None,
+    details: Optional[str] = None,
+    ip_address: Optional[str] = None
+):
+    event = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "details": details,
+        "ip_address": ip_address,
+        "created_at": datetime.now(timezone.utc),
+    }
+    try:
+        _queue.put_nowait(event)
+    except queue.Full:
+        _count("dropped")
+
+def _insert(rows: list):
+    db = SessionLocal()
+    try:
+        db.execute(insert(AuditLog), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _write(rows: list):
+    if not rows:
+        return
+    try:
+        _insert(rows)
+        _count("written", len(rows))
+    except Exception:
+        # One bad row (say, a user deleted in the meantime) must not lose
+        # the whole batch
+        logger.exception("Bulk audit insert failed, writing %d events one by one", len(rows))
+        for row in rows:
+            try:
+                _insert([row])
+                _count("written")
+            except Exception:
+                _count("failed")
+    _count("flushes")
+
+def _drain(limit: int) -> list:
+    rows = []
+    while len(rows) < limit:
+        try:
+            rows.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return rows
+
+def _run():
+    while not _stop.is_set():
+        deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL_SECONDS
+        rows = []
+        while len(rows) < AUDIT_FLUSH_SIZE and not _stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            rows.extend(_drain(AUDIT_FLUSH_SIZE - len(rows)))
+        _write(rows)
+    # Shutting down: write whatever is left
+    flush()
+
+def flush():
+    # Write everything queued so far from the calling thread
+    while True:
+        rows = _drain(AUDIT_FLUSH_SIZE)
+        if not rows:
+            return
+        _write(rows)
+
+def start_worker():
+    global _worker
+    if _worker is not None:
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_run, name="audit-writer", daemon=True)
+    _worker.start()
+
+def stop(timeout: float = 10):
+    global _worker
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout)
+        _worker = None
+    flush()
+
+def stats() -> dict:
+    with _lock:
+        return {"depth": _queue.qsize(), "max_depth": AUDIT_QUEUE_SIZE, **_counts}
@@ -1,31 +1,35 @@
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
 
-from database import get_db
-from models import User
+from database import get_async_db, run_db
+from models import User, UserRole
 import schemas
+import cache
+import passwords
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production-min-32-chars-long")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "10080"))
+# Browser EventSource cannot send an Authorization header, so the dashboard
+# stream is opened with a short-lived token in its URL instead
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.getenv("STREAM_TOKEN_EXPIRE_SECONDS", "60"))
+STREAM_SCOPE = "stream"
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return passwords.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return passwords.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -37,7 +41,59 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+class Principal:
+    # The authenticated user as seen by the routes, built from verified token
+    # claims. Use the database for anything beyond id, username, role and
+    # active flag.
+    def __init__(self, id: str, username: str, role: UserRole, is_active: bool, token_version: int = 0):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.is_active = is_active
+        self.token_version = token_version
+
+def token_claims(user: User) -> dict:
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "ver": user.token_version or 0,
+        "role": user.role.value,
+        "active": bool(user.is_active)
+    }
+
+def load_token_version(db: Session, user_id: str) -> Optional[int]:
+    # Cached per user id; update_user / delete_user invalidate the entry
+    generation = cache.principal_cache.generation
+    version = db.query(User.token_version).filter(User.id == user_id).scalar()
+    if version is not None:
+        cache.principal_cache.set(user_id, version, generation=generation)
+    return version
+
+def load_principal(db: Session, username: str) -> Optional[Principal]:
+    user = db.query(User).filter(User.username == username).first()
+    if user is None:
+        return None
+    return Principal(user.id, user.username, user.role, user.is_active, user.token_version or 0)
+
+def create_stream_token(principal: Principal) -> str:
+    # Good only for opening a stream, and only for a minute; revoked along
+    # with the user's other tokens
+    return create_access_token(
+        data={
+            "sub": principal.username,
+            "uid": principal.id,
+            "ver": principal.token_version,
+            "role": principal.role.value,
+            "active": bool(principal.is_active),
+            "scope": STREAM_SCOPE
+        },
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    )
+
+async def authenticate(token: str, db, scope: Optional[str] = None) -> Principal:
+    # Async so the common case (claims plus a cached token version) is
+    # answered on the event loop without a database round trip. Tokens
+    # issued for a scope are only accepted where that scope is asked for.
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -50,13 +106,38 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    if payload.get("scope") != scope:
+        raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    if "uid" in payload:
+        # The claims are current as long as the token's version is
+        try:
+            principal = Principal(payload["uid"], username, UserRole(payload["role"]), bool(payload["active"]), payload.get("ver"))
+        except (KeyError, ValueError):
+            raise credentials_exception
+        version = cache.principal_cache.get(principal.id)
+        if version is None:
+            version = await run_db(db, load_token_version, principal.id)
+        if version != payload.get("ver"):
+            raise credentials_exception
+        return principal
+    
+    # Tokens issued before the claims existed
+    principal = await run_db(db, load_principal, username)
+    if principal is None:
         raise credentials_exception
-    return user
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db=Depends(get_async_db)) -> Principal:
+    return await authenticate(token, db)
+
+async def get_stream_user(token: str = Query(...), db=Depends(get_async_db)) -> Principal:
+    principal = await authenticate(token, db, scope=STREAM_SCOPE)
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+import notify
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        # ttl: seconds an entry stays valid, None to keep it until evicted
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Bumped on every invalidation; a reader that started before an
+        # invalidation must not store the (possibly stale) value it loaded
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires_at = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl if self.ttl is not None else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self.generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def invalidate(self, keys=None):
+        if keys is None:
+            self.clear()
+            return
+        for key in keys:
+            self.delete(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+# Serialized schemas.Product JSON keyed by barcode, for the POS scanner
+barcode_cache = LRUCache(maxsize=int(os.getenv("BARCODE_CACHE_SIZE", "10000")))
+notify.subscribe("barcode", barcode_cache.invalidate)
+
+def invalidate_barcodes(db: Session, barcodes: Iterable[str]):
+    notify.publish(db, "barcode", [barcode for barcode in barcodes if barcode])
+
+# Serialized schemas.Customer JSON keyed by normalized phone number, for the
+# POS customer lookup. The TTL bounds staleness of fields changed outside the
+# customer routes (such as loyalty points).
+customer_phone_cache = LRUCache(
+    maxsize=int(os.getenv("CUSTOMER_PHONE_CACHE_SIZE", "2000")),
+    ttl=float(os.getenv("CUSTOMER_PHONE_CACHE_TTL_SECONDS", "60"))
+)
+notify.subscribe("customer_phone", customer_phone_cache.invalidate)
+
+def invalidate_customer_phones(db: Session, phones: Iterable[str]):
+    notify.publish(db, "customer_phone", [phone for phone in phones if phone])
+
+# Current token_version per user id, so authenticated requests can trust the
+# role and active claims of a token without loading the user
+principal_cache = LRUCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+)
+notify.subscribe("principal", principal_cache.invalidate)
+
+def invalidate_principals(db: Session, user_ids: Iterable[str]):
+    notify.publish(db, "principal", list(user_ids))
+
+# The open shift per user id (schemas.Shift, or False when the user has
+# none), so checkout and the POS shift check skip the shifts query.
+# open_shift / close_shift invalidate the entry; the TTL bounds staleness
+# should an invalidation be missed.
+open_shift_cache = LRUCache(
+    maxsize=int(os.getenv("OPEN_SHIFT_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("OPEN_SHIFT_CACHE_TTL_SECONDS", "300"))
+)
+notify.subscribe("open_shift", open_shift_cache.invalidate)
+
+def invalidate_open_shifts(db: Session, user_ids: Iterable[str]):
+    notify.publish(db, "open_shift", list(user_ids))
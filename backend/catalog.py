@@ -0,0 +1,133 @@
+import base64
+import json
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Product, Category
+
+# Compact row layout for POS terminals; soft-deleted rows are sent with
+# is_active=False so terminals can drop them from their local mirror
+SYNC_COLUMNS = [
+    Product.id,
+    Product.barcode,
+    Product.name,
+    Product.name_en,
+    Product.category_id,
+    Product.selling_price,
+    Product.tax_rate,
+    Product.stock_quantity,
+    Product.unit,
+    Product.is_active,
+    Product.updated_at,
+]
+
+# Transactions stamp updated_at before they commit, so a row can become
+# visible with a timestamp slightly older than a cursor already handed out.
+# Cursors therefore never move past now() minus this window, and rows inside
+# it are re-sent on the next pull (clients upsert by id).
+SYNC_SAFETY_WINDOW = timedelta(seconds=int(os.getenv("CATALOG_SYNC_SAFETY_WINDOW", "5")))
+
+EXPORT_COLUMNS = [
+    Product.id,
+    Product.barcode,
+    Product.name,
+    Product.name_en,
+    Product.description,
+    Product.category_id,
+    Category.name.label("category_name"),
+    Product.cost_price,
+    Product.selling_price,
+    Product.stock_quantity,
+    Product.min_stock_level,
+    Product.unit,
+    Product.tax_rate,
+    Product.image_url,
+    Product.is_active,
+    Product.created_at,
+    Product.updated_at,
+]
+
+EXPORT_BATCH_SIZE = int(os.getenv("CATALOG_EXPORT_BATCH_SIZE", "2000"))
+
+def encode_cursor(updated_at: datetime, product_id: str) -> str:
+    raw = f"{updated_at.isoformat()}|{product_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        updated_at, product_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(updated_at), product_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+
+def _compact(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def changes_since(db: Session, cursor: Optional[str], limit: int) -> dict:
+    query = select(*SYNC_COLUMNS).order_by(Product.updated_at, Product.id).limit(limit)
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        query = query.where(tuple_(Product.updated_at, Product.id) > tuple_(*position))
+
+    rows = db.execute(query).all()
+    next_position = position
+    has_more = False
+    if rows:
+        last = (rows[-1].updated_at, rows[-1].id)
+        horizon = (datetime.now(timezone.utc).replace(tzinfo=None) - SYNC_SAFETY_WINDOW, "")
+        next_position = min(last, horizon)
+        if position and next_position < position:
+            next_position = position
+        has_more = len(rows) == limit and next_position == last
+
+    return {
+        "columns": [column.key for column in SYNC_COLUMNS],
+        "rows": [[_compact(value) for value in row] for row in rows],
+        "cursor": encode_cursor(*next_position) if next_position else None,
+        "has_more": has_more
+    }
+
+def current_cursor() -> str:
+    # Where a terminal that just loaded a full export should resume delta sync
+    horizon = datetime.now(timezone.utc).replace(tzinfo=None) - SYNC_SAFETY_WINDOW
+    return encode_cursor(horizon, "")
+
+def export_ndjson_gzip():
+    # Runs as a StreamingResponse body, after the request's own session has
+    # been closed, so it owns its session. Rows are fetched as plain tuples
+    # through a server-side cursor and compressed batch by batch; memory use
+    # does not depend on the size of the catalog.
+    db = SessionLocal()
+    try:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip container
+        query = (
+            select(*EXPORT_COLUMNS)
+            .outerjoin(Category, Product.category_id == Category.id)
+            .order_by(Product.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        result = db.execute(query)
+        keys = list(result.keys())
+        for rows in result.partitions():
+            lines = "".join(
+                json.dumps(dict(zip(keys, map(_compact, row))), ensure_ascii=False) + "\n"
+                for row in rows
+            )
+            chunk = compressor.compress(lines.encode())
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+    finally:
+        db.close()
@@ -0,0 +1,250 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Product, Invoice, InvoiceItem, InventoryMovement, Payment, Shift, ShiftStatus
+import schemas
+import sequencer
+import cache
+import response_cache
+import stats
+import shift_ledger
+
+def lock_products(db: Session, product_ids: Iterable[str]) -> Dict[str, Product]:
+    # Load the whole basket in one round trip. Rows are locked in id order so
+    # two tills selling overlapping baskets cannot deadlock each other.
+    products = (
+        db.query(Product)
+        .filter(Product.id.in_(set(product_ids)))
+        .order_by(Product.id)
+        .with_for_update()
+        .all()
+    )
+    return {product.id: product for product in products}
+
+def load_open_shift(db: Session, user_id: str) -> Optional[schemas.Shift]:
+    # Cached per user id, including "no open shift"
+    cached = cache.open_shift_cache.get(user_id)
+    if cached is not None:
+        return cached or None
+    generation = cache.open_shift_cache.generation
+    shift = db.query(Shift).filter(Shift.user_id == user_id, Shift.status == ShiftStatus.OPEN).first()
+    loaded = schemas.Shift.model_validate(shift) if shift else None
+    cache.open_shift_cache.set(user_id, loaded or False, generation=generation)
+    return loaded
+
+def line_totals(item: schemas.InvoiceItemCreate):
+    item_total = item.unit_price * item.quantity
+    item_tax = (item_total * item.tax_rate) / Decimal("100")
+    return item_total, item_tax, item_total + item_tax - item.discount
+
+def check_stock(items, products: Dict[str, Product]):
+    requested = defaultdict(Decimal)
+    for item in items:
+        if item.product_id not in products:
+            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
+        requested[item.product_id] += item.quantity
+
+    for product_id, quantity in requested.items():
+        product = products[product_id]
+        if product.stock_quantity < float(quantity):
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product.name}")
+
+def sale_time(created_at: Optional[datetime]) -> datetime:
+    # Till clocks are trusted for the past but never for the future
+    now = datetime.now(timezone.utc)
+    if created_at is None:
+        return now
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return min(created_at.astimezone(timezone.utc), now)
+
+def create_invoice(
+    db: Session,
+    invoice_data: schemas.InvoiceCreate,
+    user_id: str,
+    shift_id: Optional[str],
+    products: Optional[Dict[str, Product]] = None,
+    created_at: Optional[datetime] = None
+) -> Invoice:
+    # products: rows already locked by the caller (batch uploads)
+    if products is None:
+        products = lock_products(db, [item.product_id for item in invoice_data.items])
+    check_stock(invoice_data.items, products)
+
+    # Calculate totals
+    subtotal = Decimal("0.00")
+    tax_amount = Decimal("0.00")
+    for item in invoice_data.items:
+        item_total, item_tax, _ = line_totals(item)
+        subtotal += item_total
+        tax_amount += item_tax
+
+    total_amount = subtotal + tax_amount - invoice_data.discount_amount
+    change_amount = invoice_data.paid_amount - total_amount
+    shift_ledger.validate_payments(invoice_data, change_amount)
+
+    # Number the invoice only once it is known to be valid, so rejected
+    # baskets do not leave gaps in the day's sequence
+    invoice_number = invoice_data.invoice_number or sequencer.next_invoice_number()
+
+    db_invoice = Invoice(
+        invoice_number=invoice_number,
+        invoice_type=invoice_data.invoice_type,
+        user_id=user_id,
+        customer_id=invoice_data.customer_id,
+        shift_id=shift_id,
+        subtotal=subtotal,
+        tax_amount=tax_amount,
+        discount_amount=invoice_data.discount_amount,
+        total_amount=total_amount,
+        payment_method=invoice_data.payment_method,
+        paid_amount=invoice_data.paid_amount,
+        change_amount=change_amount,
+        notes=invoice_data.notes,
+        idempotency_key=invoice_data.idempotency_key,
+        created_at=sale_time(created_at)
+    )
+    db.add(db_invoice)
+    db.flush()
+
+    flags_before = {product_id: stats.product_flags(product) for product_id, product in products.items()}
+
+    # Build invoice items and inventory movements, then insert each set in bulk
+    item_rows = []
+    movement_rows = []
+    for item in invoice_data.items:
+        product = products[item.product_id]
+        _, _, item_total_price = line_totals(item)
+
+        item_rows.append({
+            "invoice_id": db_invoice.id,
+            "product_id": product.id,
+            "product_name": product.name,
+            "quantity": item.quantity,
+            "unit_price": item.unit_price,
+            "tax_rate": item.tax_rate,
+            "discount": item.discount,
+            "total_price": item_total_price,
+        })
+
+        # Update inventory on the locked row. Stock is kept in whole units,
+        # so the movement records what was actually taken off, keeping
+        # stock equal to the sum of movements for weighed items too.
+        previous_quantity = product.stock_quantity
+        taken = int(float(item.quantity))
+        product.stock_quantity -= taken
+
+        movement_rows.append({
+            "product_id": product.id,
+            "movement_type": "sale",
+            "quantity": Decimal(-taken),
+            "previous_quantity": Decimal(str(previous_quantity)),
+            "new_quantity": Decimal(str(product.stock_quantity)),
+            "notes": f"Sale invoice {invoice_number}",
+        })
+
+    if item_rows:
+        db.execute(insert(InvoiceItem), item_rows)
+        db.execute(insert(InventoryMovement), movement_rows)
+    if invoice_data.payments:
+        db.execute(insert(Payment), [
+            {
+                "invoice_id": db_invoice.id,
+                "payment_method": payment.payment_method,
+                "amount": payment.amount,
+                "reference_number": payment.reference_number,
+            }
+            for payment in invoice_data.payments
+        ])
+    shift_ledger.record_invoice(db, db_invoice, invoice_data.payments)
+    cache.invalidate_barcodes(db, [product.barcode for product in products.values()])
+    response_cache.invalidate(db, [f"product:{product_id}" for product_id in products])
+    for product_id, product in products.items():
+        stats.track_product(db, flags_before[product_id], product)
+    stats.record_sale(db, db_invoice)
+    return db_invoice
+
+def _result(key: str, status: str, invoice_id=None, invoice_number=None, error=None) -> dict:
+    return {
+        "idempotency_key": key,
+        "status": status,
+        "invoice_id": invoice_id,
+        "invoice_number": invoice_number,
+        "error": error
+    }
+
+def ingest_batch(db: Session, sales: List[schemas.OfflineSale], user_id: str) -> List[dict]:
+    # Sales queued by a till while it was offline. The whole batch runs in
+    # the caller's transaction with a savepoint per sale, so a rejected sale
+    # is reported without affecting the others; sales whose idempotency key
+    # is already known are reported as duplicates and not applied again.
+    # Sales made in a shift that has since been closed are rejected.
+    keys = {sale.idempotency_key for sale in sales}
+    known = {
+        key: (invoice_id, invoice_number)
+        for key, invoice_id, invoice_number in db.query(Invoice.idempotency_key, Invoice.id, Invoice.invoice_number)
+        .filter(Invoice.idempotency_key.in_(keys))
+    }
+    # One locking query for every product in the batch
+    products = lock_products(db, [item.product_id for sale in sales for item in sale.items])
+    open_shift = load_open_shift(db, user_id)
+    open_shift_id = open_shift.id if open_shift else None
+    # The user's own shifts named by the batch, locked so none of them can
+    # be closed (and its expected cash fixed) while these sales go in
+    own_shifts = dict(
+        db.query(Shift.id, Shift.status).filter(
+            Shift.id.in_({sale.shift_id for sale in sales if sale.shift_id}),
+            Shift.user_id == user_id
+        ).order_by(Shift.id).with_for_update().all()
+    )
+
+    # Reserve numbers for the whole batch in one round trip, before this
+    # transaction writes anything. They are handed out only to sales that
+    # succeed, so rejected sales can leave unused numbers at the end of the
+    # block but not in the middle.
+    day = sequencer.today_key()
+    unnumbered = len({sale.idempotency_key for sale in sales if not sale.invoice_number and sale.idempotency_key not in known})
+    next_value = sequencer.reserve(day, unnumbered) - unnumbered + 1 if unnumbered else None
+
+    results = []
+    for sale in sales:
+        key = sale.idempotency_key
+        if key in known:
+            results.append(_result(key, "duplicate", *known[key]))
+            continue
+        from_block = not sale.invoice_number
+        try:
+            with db.begin_nested():
+                if from_block:
+                    sale = sale.model_copy(update={"invoice_number": sequencer.format_invoice_number(day, next_value)})
+                elif not sequencer.is_reserved(db, sale.invoice_number, user_id):
+                    raise HTTPException(status_code=400, detail="Invoice number was not reserved")
+                if own_shifts.get(sale.shift_id, ShiftStatus.OPEN) != ShiftStatus.OPEN:
+                    # Its cash was counted at close; the sale is left to a manager
+                    raise HTTPException(status_code=400, detail="Shift already closed")
+                shift_id = sale.shift_id if sale.shift_id in own_shifts else open_shift_id
+                invoice = create_invoice(db, sale, user_id, shift_id, products=products, created_at=sale.created_at)
+        except HTTPException as error:
+            results.append(_result(key, "error", error=error.detail))
+            continue
+        except IntegrityError:
+            # Another upload of the same sale got in first, or the invoice
+            # number is already taken
+            existing = db.query(Invoice.id, Invoice.invoice_number).filter(Invoice.idempotency_key == key).first()
+            if existing:
+                results.append(_result(key, "duplicate", *existing))
+            else:
+                results.append(_result(key, "error", error="Invoice number already used"))
+            continue
+        if from_block:
+            next_value += 1
+        known[key] = (invoice.id, invoice.invoice_number)
+        results.append(_result(key, "created", invoice.id, invoice.invoice_number))
+    return results
@@ -0,0 +1,94 @@
+import logging
+import os
+import re
+
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+
+from models import Customer
+
+# Customer lookup by phone at the POS. Every customer keeps phone_normalized
+# (digits only, without the international or trunk prefix) so "+962 79 123
+# 4567", "00962791234567" and "079-123-4567" all find the same customer
+# through one unique index. That needs the store's own country code (Jordan
+# unless configured), since "+962 7..." and "07..." only meet once it is
+# stripped; numbers from other countries keep their country code.
+PHONE_COUNTRY_CODE = os.getenv("CUSTOMER_PHONE_COUNTRY_CODE", "962")
+DIGITS = str.maketrans({
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)},  # Persian digits
+})
+NON_DIGITS = re.compile(r"\D")
+
+logger = logging.getLogger(__name__)
+
+def normalize_phone(phone) -> str:
+    if not phone:
+        return ""
+    phone = phone.strip().translate(DIGITS)
+    international = phone.startswith("+")
+    digits = NON_DIGITS.sub("", phone)
+    if digits.startswith("00"):
+        international = True
+        digits = digits[2:]
+    if international:
+        if not digits.startswith(PHONE_COUNTRY_CODE):
+            return digits
+        digits = digits[len(PHONE_COUNTRY_CODE):]
+    return digits.lstrip("0")
+
+@event.listens_for(Customer, "before_insert")
+def _set_phone_normalized(mapper, connection, customer):
+    customer.phone_normalized = normalize_phone(customer.phone) or None
+
+@event.listens_for(Customer, "before_update")
+def _update_phone_normalized(mapper, connection, customer):
+    if inspect(customer).attrs.phone.history.has_changes():
+        customer.phone_normalized = normalize_phone(customer.phone) or None
+
+def backfill(db: Session, batch_size: int = 1000):
+    # Customers written before phone_normalized existed, or normalized
+    # while the country code was not stripped (values still starting with
+    # it). Phones that only differ in formatting from another customer's
+    # are left unset (and logged) rather than breaking the unique index.
+    stale = Customer.phone_normalized == None
+    if PHONE_COUNTRY_CODE:
+        stale = or_(stale, Customer.phone_normalized.startswith(PHONE_COUNTRY_CODE))
+    last_id = ""
+    while True:
+        batch = db.query(Customer).filter(
+            stale,
+            Customer.phone != None,
+            Customer.id > last_id
+        ).order_by(Customer.id).limit(batch_size).all()
+        if not batch:
+            return
+        for customer in batch:
+            normalized = normalize_phone(customer.phone) or None
+            if normalized == customer.phone_normalized:
+                continue
+            if normalized and db.query(Customer.id).filter(Customer.phone_normalized == normalized).first():
+                logger.warning("Customer %s has the same phone as another customer: %s", customer.id, customer.phone)
+                continue
+            customer.phone_normalized = normalized
+            db.flush()
+        last_id = batch[-1].id
+        db.commit()
+
+def find_by_phone(db: Session, phone: str):
+    normalized = normalize_phone(phone)
+    if not normalized:
+        return None
+    return db.query(Customer).filter(Customer.phone_normalized == normalized, Customer.is_active == True).first()
+
+def phone_prefix_matches(db: Session, prefix: str, limit: int):
+    normalized = normalize_phone(prefix)
+    if not normalized:
+        return []
+    return (
+        db.query(Customer)
+        .filter(Customer.phone_normalized.startswith(normalized, autoescape=True), Customer.is_active == True)
+        .order_by(Customer.phone_normalized)
+        .limit(limit)
+        .all()
+    )
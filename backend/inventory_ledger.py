@@ -0,0 +1,251 @@
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Date, DateTime, Index, MetaData, Numeric, String, Table, Text, func, insert, literal, select, text, union_all
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, dialect_insert
+from models import Product, InventoryMovement, StockSnapshot, InventoryArchive, RollupState
+from rollups import closed_until, day_start
+
+# Stock history. Every stock change is an inventory_movements row; once a day
+# is closed, stock_snapshots records the stock at the end of that day for
+# each product that moved, so "stock of X at time T" is the nearest snapshot
+# plus the movements between it and T rather than a walk over the whole
+# history. Whole months of movements older than INVENTORY_ARCHIVE_AFTER_DAYS
+# (0 keeps everything in place) are moved to one inventory_movements_YYYYMM
+# table per month, which point-in-time lookups still read.
+INVENTORY_SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("INVENTORY_SNAPSHOT_INTERVAL_SECONDS", "3600"))
+INVENTORY_ARCHIVE_AFTER_DAYS = int(os.getenv("INVENTORY_ARCHIVE_AFTER_DAYS", "0"))
+SNAPSHOT_LOCK_ID = 7_300_002
+STATE_NAME = "stock_snapshots"
+
+logger = logging.getLogger(__name__)
+
+_worker = None
+_archive_metadata = MetaData()
+_archive_tables: Dict[str, Table] = {}
+_archive_lock = threading.Lock()
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _naive_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+def record_adjustment(db: Session, product: Product, previous_quantity, notes: Optional[str] = None):
+    # Stock set directly (product create / update) rather than by a sale.
+    # ProductUpdate allows clearing the stock, which is not a movement.
+    if previous_quantity is None or product.stock_quantity is None or previous_quantity == product.stock_quantity:
+        return
+    db.add(InventoryMovement(
+        product_id=product.id,
+        movement_type="adjustment",
+        quantity=Decimal(str(product.stock_quantity)) - Decimal(str(previous_quantity)),
+        previous_quantity=Decimal(str(previous_quantity)),
+        new_quantity=Decimal(str(product.stock_quantity)),
+        notes=notes
+    ))
+
+# ============= ARCHIVE TABLES =============
+def month_bounds(month: str):
+    start = datetime(int(month[:4]), int(month[4:]), 1)
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+def archive_table(month: str) -> Table:
+    with _archive_lock:
+        table = _archive_tables.get(month)
+        if table is None:
+            name = f"inventory_movements_{month}"
+            table = Table(
+                name, _archive_metadata,
+                Column("id", String, primary_key=True),
+                Column("product_id", String, nullable=False),
+                Column("movement_type", String, nullable=False),
+                Column("quantity", Numeric(10, 3), nullable=False),
+                Column("previous_quantity", Numeric(10, 3), nullable=False),
+                Column("new_quantity", Numeric(10, 3), nullable=False),
+                Column("notes", Text),
+                Column("created_at", DateTime),
+                Index(f"ix_{name}_product_created", "product_id", "created_at"),
+                Index(f"ix_{name}_created_id", "created_at", "id"),
+            )
+            _archive_tables[month] = table
+        return table
+
+def _archived_months(db: Session, start: Optional[datetime], end: Optional[datetime]) -> List[str]:
+    # Archived months overlapping [start, end]
+    months = []
+    for (month,) in db.query(InventoryArchive.month).order_by(InventoryArchive.month):
+        month_start, month_end = month_bounds(month)
+        if (start is None or month_end > start) and (end is None or month_start <= end):
+            months.append(month)
+    return months
+
+def movement_history(db: Session, product_id: Optional[str] = None):
+    # The live table and every archived month as one subquery with the
+    # columns of inventory_movements, so listings keep archived history
+    live = InventoryMovement.__table__
+    selects = []
+    for table in [live] + [archive_table(month) for month in _archived_months(db, None, None)]:
+        query = select(*[table.c[column.name] for column in live.columns])
+        if product_id:
+            query = query.where(table.c.product_id == product_id)
+        selects.append(query)
+    return (union_all(*selects) if len(selects) > 1 else selects[0]).subquery("movements")
+
+# ============= POINT-IN-TIME STOCK =============
+def _movement_sum(db: Session, product_id: str, start: Optional[datetime], end: Optional[datetime], include_start: bool) -> Decimal:
+    # Net quantity moved in (start, end], or [start, end] with include_start,
+    # from the live table and any archived month in range
+    def bounded(table):
+        conditions = [table.c.product_id == product_id]
+        if start is not None:
+            conditions.append(table.c.created_at >= start if include_start else table.c.created_at > start)
+        if end is not None:
+            conditions.append(table.c.created_at <= end)
+        return select(func.coalesce(func.sum(table.c.quantity), 0)).where(*conditions)
+
+    total = Decimal(str(db.execute(bounded(InventoryMovement.__table__)).scalar()))
+    for month in _archived_months(db, start, end):
+        total += Decimal(str(db.execute(bounded(archive_table(month))).scalar()))
+    return total
+
+def stock_at(db: Session, product: Product, at: datetime) -> Decimal:
+    # Stock after every movement made up to and including `at`. A snapshot
+    # for day D holds the stock after every movement before D + 1 day.
+    at = _naive_utc(at)
+    previous = db.query(StockSnapshot).filter(
+        StockSnapshot.product_id == product.id,
+        StockSnapshot.day < at.date()
+    ).order_by(StockSnapshot.day.desc()).first()
+    if previous is not None:
+        taken_at = day_start(previous.day + timedelta(days=1))
+        return previous.quantity + _movement_sum(db, product.id, taken_at, at, include_start=True)
+
+    following = db.query(StockSnapshot).filter(
+        StockSnapshot.product_id == product.id,
+        StockSnapshot.day >= at.date()
+    ).order_by(StockSnapshot.day).first()
+    if following is not None:
+        taken_at = day_start(following.day + timedelta(days=1))
+        return following.quantity - _movement_sum(db, product.id, at, taken_at - timedelta(microseconds=1), include_start=False)
+
+    # Nothing snapshotted yet: count back from the current stock
+    return Decimal(str(product.stock_quantity)) - _movement_sum(db, product.id, at, None, include_start=False)
+
+# ============= SNAPSHOTS AND ARCHIVING =============
+def _snapshot_day(db: Session, day: date):
+    start = day_start(day)
+    end = start + timedelta(days=1)
+    # Current stock less everything moved since the end of the day, in one
+    # statement so both are read from the same database snapshot
+    moved_since = (
+        select(func.coalesce(func.sum(InventoryMovement.quantity), 0))
+        .where(InventoryMovement.product_id == Product.id, InventoryMovement.created_at >= end)
+        .scalar_subquery()
+    )
+    moved_that_day = select(InventoryMovement.product_id).where(
+        InventoryMovement.created_at >= start,
+        InventoryMovement.created_at < end
+    )
+    db.query(StockSnapshot).filter(StockSnapshot.day == day).delete(synchronize_session=False)
+    db.execute(insert(StockSnapshot).from_select(
+        ["product_id", "day", "quantity"],
+        select(Product.id, literal(day, Date), Product.stock_quantity - moved_since).where(Product.id.in_(moved_that_day))
+    ))
+
+def _archive_month(db: Session, limit: datetime) -> Optional[str]:
+    # The oldest month of live movements, if it ended before `limit`
+    oldest = db.query(func.min(InventoryMovement.created_at)).scalar()
+    if oldest is None:
+        return None
+    month = oldest.strftime("%Y%m")
+    start, end = month_bounds(month)
+    if end > limit:
+        return None
+
+    table = archive_table(month)
+    table.create(bind=db.connection(), checkfirst=True)
+    live = InventoryMovement.__table__
+    in_month = [live.c.created_at >= start, live.c.created_at < end]
+    columns = [column.name for column in table.columns]
+    db.execute(insert(table).from_select(columns, select(*[live.c[name] for name in columns]).where(*in_month)))
+    moved = db.execute(live.delete().where(*in_month)).rowcount
+
+    stmt = dialect_insert(db)(InventoryArchive).values(month=month, table_name=table.name, row_count=moved, archived_at=_utcnow())
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[InventoryArchive.month],
+        set_={"row_count": InventoryArchive.row_count + moved, "archived_at": _utcnow()}
+    ))
+    return month
+
+def _next_step(db: Session) -> Optional[str]:
+    # One day's snapshot or one month's archive per transaction. On
+    # PostgreSQL the transaction-scoped advisory lock keeps several workers
+    # from doing the same step at once.
+    if db.bind.dialect.name == "postgresql":
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": SNAPSHOT_LOCK_ID}).scalar():
+            return None
+
+    limit = closed_until()
+    state = db.get(RollupState, STATE_NAME)
+    if state is None:
+        # History before the first run is reached from later snapshots
+        state = RollupState(name=STATE_NAME, high_water=limit - timedelta(days=1))
+        db.add(state)
+
+    if state.high_water < limit:
+        day = state.high_water
+        _snapshot_day(db, day)
+        state.high_water = day + timedelta(days=1)
+        return f"snapshot {day.isoformat()}"
+
+    if INVENTORY_ARCHIVE_AFTER_DAYS > 0:
+        # Only months that are already covered by snapshots
+        cutoff = min(_utcnow() - timedelta(days=INVENTORY_ARCHIVE_AFTER_DAYS), day_start(state.high_water))
+        month = _archive_month(db, cutoff)
+        if month is not None:
+            return f"archive {month}"
+    return None
+
+def refresh() -> list:
+    done = []
+    while True:
+        db = SessionLocal()
+        try:
+            step = _next_step(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        if step is None:
+            return done
+        done.append(step)
+
+def _run_forever():
+    while True:
+        time.sleep(INVENTORY_SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            done = refresh()
+            if done:
+                logger.info("Inventory ledger: %s", ", ".join(done))
+        except Exception:
+            logger.exception("Inventory snapshot failed")
+
+def start_worker():
+    global _worker
+    if _worker is not None or INVENTORY_SNAPSHOT_INTERVAL_SECONDS <= 0:
+        return
+    _worker = threading.Thread(target=_run_forever, name="inventory-snapshots", daemon=True)
+    _worker.start()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text, Enum as SQLEnum, Table, Numeric
+from sqlalchemy import Column, String, Integer, Float, Boolean, Date, DateTime, ForeignKey, Text, Enum as SQLEnum, Table, Numeric, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime, timezone
@@ -46,6 +46,9 @@ class User(Base):
     full_name = Column(String, nullable=False)
     role = Column(SQLEnum(UserRole), nullable=False, default=UserRole.CASHIER)
     is_active = Column(Boolean, default=True)
+    # Bumped whenever role, active flag or password change; tokens carrying
+    # an older version are rejected
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
@@ -84,6 +87,7 @@ class Product(Base):
     tax_rate = Column(Numeric(5, 2), default=0)  # percentage
     image_url = Column(String)
     is_active = Column(Boolean, default=True)
+    search_text = Column(Text)  # normalized name, name_en and barcode, kept up to date by product_search.py
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
@@ -91,6 +95,21 @@ class Product(Base):
     category = relationship("Category", back_populates="products")
     invoice_items = relationship("InvoiceItem", back_populates="product")
     inventory_movements = relationship("InventoryMovement", back_populates="product")
+    
+    __table_args__ = (
+        # Keyset order for the POS catalog delta sync
+        Index("ix_products_updated_at_id", "updated_at", "id"),
+        # Product search: trigram matching on the normalized text and
+        # barcode prefix lookups (PostgreSQL only)
+        Index(
+            "ix_products_search_trgm", "search_text",
+            postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_products_barcode_prefix", "barcode",
+            postgresql_ops={"barcode": "text_pattern_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
 
 class ProductBundle(Base):
     __tablename__ = "product_bundles"
@@ -124,6 +143,7 @@ class Customer(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String, nullable=False, index=True)
     phone = Column(String, unique=True, index=True)
+    phone_normalized = Column(String, unique=True, index=True)  # digits only, kept up to date by customers.py
     email = Column(String)
     address = Column(Text)
     loyalty_points = Column(Integer, default=0)
@@ -132,6 +152,14 @@ class Customer(Base):
     
     # Relationships
     invoices = relationship("Invoice", back_populates="customer")
+    
+    __table_args__ = (
+        # Phone prefix lookups at the POS (PostgreSQL only)
+        Index(
+            "ix_customers_phone_prefix", "phone_normalized",
+            postgresql_ops={"phone_normalized": "text_pattern_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
 
 class Invoice(Base):
     __tablename__ = "invoices"
@@ -141,6 +169,7 @@ class Invoice(Base):
     invoice_type = Column(SQLEnum(InvoiceType), nullable=False, default=InvoiceType.SALE)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     customer_id = Column(String, ForeignKey("customers.id"))
+    supplier_id = Column(String, ForeignKey("suppliers.id"), index=True)  # purchase invoices
     shift_id = Column(String, ForeignKey("shifts.id"))
     subtotal = Column(Numeric(10, 2), nullable=False)
     tax_amount = Column(Numeric(10, 2), default=0)
@@ -151,6 +180,7 @@ class Invoice(Base):
     change_amount = Column(Numeric(10, 2), default=0)
     notes = Column(Text)
     is_void = Column(Boolean, default=False)
+    idempotency_key = Column(String, unique=True, index=True)  # set by the till, see POST /api/invoices/batch
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
     
     # Relationships
@@ -159,6 +189,41 @@ class Invoice(Base):
     shift = relationship("Shift", back_populates="invoices")
     items = relationship("InvoiceItem", back_populates="invoice", cascade="all, delete-orphan")
     payments = relationship("Payment", back_populates="invoice")
+    
+    __table_args__ = (
+        # Date-range scans for sales reports
+        Index("ix_invoices_type_created_at", "invoice_type", "created_at"),
+        # Keyset pagination of invoice lists
+        Index("ix_invoices_created_at_id", "created_at", "id"),
+    )
+
+class InvoiceSequence(Base):
+    __tablename__ = "invoice_sequences"
+    
+    day = Column(String, primary_key=True)  # YYYYMMDD
+    last_value = Column(Integer, nullable=False, default=0)
+
+class InvoiceNumberBlock(Base):
+    __tablename__ = "invoice_number_blocks"
+    
+    # Numbers handed to a till ahead of time; only that user may use them
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    day = Column(String, nullable=False)  # YYYYMMDD
+    first_value = Column(Integer, nullable=False)
+    last_value = Column(Integer, nullable=False)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (
+        Index("ix_invoice_number_blocks_user_day", "user_id", "day"),
+    )
+
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+    
+    key = Column(String, primary_key=True)  # e.g. sales_total:20240101, open_shifts
+    shard = Column(Integer, primary_key=True)  # -1 holds the seeded baseline
+    value = Column(Numeric(14, 2), nullable=False, default=0)
 
 class InvoiceItem(Base):
     __tablename__ = "invoice_items"
@@ -176,6 +241,12 @@ class InvoiceItem(Base):
     # Relationships
     invoice = relationship("Invoice", back_populates="items")
     product = relationship("Product", back_populates="invoice_items")
+    
+    __table_args__ = (
+        Index("ix_invoice_items_invoice_id", "invoice_id"),
+        # Per-product sales/profit aggregation
+        Index("ix_invoice_items_product_invoice", "product_id", "invoice_id"),
+    )
 
 class Payment(Base):
     __tablename__ = "payments"
@@ -210,13 +281,22 @@ class Shift(Base):
     user = relationship("User", back_populates="shifts")
     invoices = relationship("Invoice", back_populates="shift")
     cash_movements = relationship("CashRegister", back_populates="shift")
+    
+    __table_args__ = (
+        # At most one open shift per user; also serves the open shift lookup
+        Index(
+            "ux_shifts_user_open", "user_id", unique=True,
+            postgresql_where=status == ShiftStatus.OPEN,
+            sqlite_where=status == ShiftStatus.OPEN
+        ),
+    )
 
 class CashRegister(Base):
     __tablename__ = "cash_register"
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     shift_id = Column(String, ForeignKey("shifts.id"), nullable=False)
-    transaction_type = Column(String, nullable=False)  # sale, expense, deposit, withdrawal
+    transaction_type = Column(String, nullable=False)  # sale, return, purchase, expense, deposit, withdrawal
     amount = Column(Numeric(10, 2), nullable=False)
     description = Column(Text)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -224,6 +304,14 @@ class CashRegister(Base):
     # Relationships
     shift = relationship("Shift", back_populates="cash_movements")
 
+class ShiftTotal(Base):
+    __tablename__ = "shift_totals"
+    
+    shift_id = Column(String, ForeignKey("shifts.id"), primary_key=True)
+    entry = Column(String, primary_key=True)  # payment method, cash movement type or drawer
+    amount = Column(Numeric(14, 2), nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
 class InventoryMovement(Base):
     __tablename__ = "inventory_movements"
     
@@ -238,6 +326,11 @@ class InventoryMovement(Base):
     
     # Relationships
     product = relationship("Product", back_populates="inventory_movements")
+    
+    __table_args__ = (
+        # Per-product history, newest first, and point-in-time stock deltas
+        Index("ix_inventory_movements_product_created", "product_id", "created_at", "id"),
+    )
 
 class Offer(Base):
     __tablename__ = "offers"
@@ -267,3 +360,67 @@ class AuditLog(Base):
     
     # Relationships
     user = relationship("User", back_populates="audit_logs")
+
+class DailySalesRollup(Base):
+    __tablename__ = "daily_sales_rollups"
+    
+    day = Column(Date, primary_key=True)
+    user_id = Column(String, primary_key=True)
+    shift_id = Column(String, primary_key=True)  # "" for invoices outside a shift
+    payment_method = Column(SQLEnum(PaymentMethod), primary_key=True)
+    total_sales = Column(Numeric(14, 2), nullable=False, default=0)
+    invoice_count = Column(Integer, nullable=False, default=0)
+
+class DailyProductRollup(Base):
+    __tablename__ = "daily_product_rollups"
+    
+    day = Column(Date, primary_key=True)
+    product_id = Column(String, primary_key=True)
+    category_id = Column(String, index=True)
+    quantity_sold = Column(Numeric(14, 3), nullable=False, default=0)
+    total_revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    total_cost = Column(Numeric(14, 2), nullable=False, default=0)
+
+class RollupState(Base):
+    __tablename__ = "rollup_state"
+    
+    name = Column(String, primary_key=True)
+    high_water = Column(Date)  # first day that has not been rolled up yet
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    filename = Column(String)
+    status = Column(String, nullable=False, default="pending")  # pending, running, completed, failed
+    total_rows = Column(Integer)  # estimated until the job completes
+    processed_rows = Column(Integer, nullable=False, default=0)
+    created_count = Column(Integer, nullable=False, default=0)
+    updated_count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    errors = Column(Text)  # JSON list of {row, barcode, error}, capped
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime)
+
+class StockSnapshot(Base):
+    __tablename__ = "stock_snapshots"
+    
+    product_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)  # stock at the end of this day (UTC)
+    quantity = Column(Numeric(14, 3), nullable=False)
+
+class InventoryArchive(Base):
+    __tablename__ = "inventory_archives"
+    
+    month = Column(String, primary_key=True)  # YYYYMM
+    table_name = Column(String, nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    archived_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class RollupDirtyDay(Base):
+    __tablename__ = "rollup_dirty_days"
+    
+    day = Column(Date, primary_key=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
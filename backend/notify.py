@@ -0,0 +1,105 @@
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, engine
+
+# Cross-worker invalidation channel. Messages are queued on the session and
+# delivered to handlers in this process after commit; on PostgreSQL they are
+# also sent with pg_notify just before commit (NOTIFY is transactional) so
+# every other uvicorn worker listening on CHANNEL sees them as well.
+CHANNEL = "supermarket_invalidation"
+MAX_PAYLOAD = 7900  # pg_notify payloads must stay under 8000 bytes
+
+logger = logging.getLogger(__name__)
+
+_handlers = defaultdict(list)
+_listener = None
+
+def subscribe(topic: str, handler: Callable[[Optional[list]], None]):
+    # handler receives the list of invalidated keys, or None for "everything"
+    _handlers[topic].append(handler)
+
+def publish(db: Session, topic: str, keys: Optional[Iterable[str]] = None):
+    pending = db.info.setdefault("pending_notifications", {})
+    if topic in pending and pending[topic] is None:
+        return
+    if keys is None:
+        pending[topic] = None
+    else:
+        pending.setdefault(topic, set()).update(keys)
+
+def dispatch(topic: str, keys: Optional[list] = None):
+    for handler in _handlers.get(topic, []):
+        try:
+            handler(keys)
+        except Exception:
+            logger.exception("Invalidation handler for %s failed", topic)
+
+def _encode(topic, keys):
+    message = json.dumps({"topic": topic, "keys": keys})
+    if len(message) <= MAX_PAYLOAD or not keys:
+        return [message]
+    # Too many keys for one notification, split the list in half
+    middle = len(keys) // 2
+    return _encode(topic, keys[:middle]) + _encode(topic, keys[middle:])
+
+@event.listens_for(SessionLocal, "before_commit")
+def _send_pending(session):
+    # One pg_notify per topic per transaction, still inside the transaction so
+    # other workers only hear about it if the commit succeeds
+    pending = session.info.get("pending_notifications")
+    if not pending or session.bind.dialect.name != "postgresql":
+        return
+    for topic, keys in pending.items():
+        for message in _encode(topic, sorted(keys) if keys is not None else None):
+            session.execute(text("SELECT pg_notify(:channel, :message)"), {"channel": CHANNEL, "message": message})
+
+@event.listens_for(SessionLocal, "after_commit")
+def _deliver_pending(session):
+    for topic, keys in session.info.pop("pending_notifications", {}).items():
+        dispatch(topic, sorted(keys) if keys is not None else None)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_pending(session):
+    session.info.pop("pending_notifications", None)
+
+def _listen():
+    while True:
+        try:
+            connection = engine.raw_connection()
+            connection.detach()
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            dbapi_connection.cursor().execute(f"LISTEN {CHANNEL}")
+
+            # Anything published while we were disconnected is lost, so start
+            # every (re)connection by flushing all subscribers
+            for topic in list(_handlers):
+                dispatch(topic, None)
+
+            while True:
+                if select.select([dbapi_connection], [], [], 5) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    message = json.loads(notification.payload)
+                    dispatch(message["topic"], message["keys"])
+        except Exception:
+            logger.exception("Invalidation listener lost its connection, reconnecting")
+            time.sleep(1)
+
+def start_listener():
+    global _listener
+    if engine.dialect.name != "postgresql" or _listener is not None:
+        return
+    _listener = threading.Thread(target=_listen, name="invalidation-listener", daemon=True)
+    _listener.start()
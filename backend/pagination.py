@@ -0,0 +1,86 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+# Keyset pagination. Pages are ordered by a list of columns whose last entry
+# is unique (normally the id); the opaque cursor holds the sort values of the
+# last row returned and the next page starts strictly after it. The cursor
+# for the next page is sent in the X-Next-Cursor response header so list
+# bodies stay plain arrays.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_ESTIMATE_HEADER = "X-Total-Count-Estimate"
+
+def _to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def _from_json(value, column):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is Decimal:
+        return Decimal(value)
+    return value
+
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps([_to_json(value) for value in values]).encode()).decode()
+
+def decode_cursor(cursor: str, columns) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(columns):
+            raise ValueError
+        return [_from_json(value, column) for value, column in zip(values, columns)]
+    except (ValueError, TypeError, ArithmeticError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+class Explain(Executable, ClauseElement):
+    # EXPLAIN (FORMAT JSON) <statement>, compiled with the statement's own
+    # bound parameters so filter values are never inlined into the SQL
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+def estimate_count(query) -> int:
+    # On PostgreSQL ask the planner, which answers from pg_class / pg_stats
+    # statistics without touching the rows; elsewhere count exactly
+    db = query.session
+    if db.bind.dialect.name != "postgresql":
+        return query.order_by(None).count()
+    plan = db.execute(Explain(query.order_by(None).statement)).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def paginate(query, sort_columns, cursor, limit: int, response: Response, descending: bool = False, with_total: bool = False):
+    if with_total:
+        response.headers[TOTAL_ESTIMATE_HEADER] = str(estimate_count(query))
+
+    if cursor:
+        values = decode_cursor(cursor, sort_columns)
+        key = tuple_(*sort_columns)
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+
+    order = [column.desc() if descending else column.asc() for column in sort_columns]
+    # Fetch one extra row to learn whether another page exists
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(rows[-1], column.key) for column in sort_columns])
+    return rows
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+
+# Password hashing runs in a small process pool so bcrypt never holds the
+# GIL of the API process, and a burst of logins (shift change) cannot tie up
+# the request threadpool: at most PASSWORD_HASH_MAX_PENDING requests wait
+# for the pool, the rest are turned away with 429. PASSWORD_HASH_WORKERS=0
+# hashes in the calling thread instead.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(1, PASSWORD_HASH_WORKERS) * 4)))
+
+# Hashes made with fewer rounds are reported as needing an update, so they
+# are re-hashed on the next successful login after BCRYPT_ROUNDS is raised
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_desired_rounds=BCRYPT_ROUNDS
+)
+
+_executor = None
+_lock = threading.Lock()
+_pending = 0
+_completed = 0
+_rejected = 0
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+    return _executor
+
+def start():
+    # Called at startup, before the background threads exist, so the workers
+    # are forked from a quiet process rather than on the first login
+    if PASSWORD_HASH_WORKERS <= 0:
+        return
+    with _lock:
+        executor = _get_executor()
+    for future in [executor.submit(int) for _ in range(PASSWORD_HASH_WORKERS)]:
+        future.result()
+
+def _admit() -> ProcessPoolExecutor:
+    global _pending, _rejected
+    with _lock:
+        if _pending >= PASSWORD_HASH_MAX_PENDING:
+            _rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many password checks in progress, try again shortly",
+                headers={"Retry-After": "1"}
+            )
+        _pending += 1
+        return _get_executor()
+
+def _discard(executor: ProcessPoolExecutor):
+    # A worker died; start a fresh pool for the next caller
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+
+def _done():
+    global _pending, _completed
+    with _lock:
+        _pending -= 1
+        _completed += 1
+
+def _run(function, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return function(*args)
+    executor = _admit()
+    try:
+        return executor.submit(function, *args).result()
+    except BrokenProcessPool:
+        _discard(executor)
+        raise
+    finally:
+        _done()
+
+async def _run_async(function, *args):
+    # For async routes: the event loop awaits the pool's future instead of
+    # a threadpool thread blocking on it
+    if PASSWORD_HASH_WORKERS <= 0:
+        return await run_in_threadpool(function, *args)
+    executor = _admit()
+    try:
+        return await asyncio.wrap_future(executor.submit(function, *args))
+    except BrokenProcessPool:
+        _discard(executor)
+        raise
+    finally:
+        _done()
+
+def hash_password(password: str) -> str:
+    return _run(_hash, password)
+
+def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # (valid, new_hash): new_hash is set when the stored hash uses outdated
+    # parameters and should be replaced
+    return _run(_verify_and_update, password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_async(_hash, password)
+
+async def verify_and_update_async(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run_async(_verify_and_update, password, hashed_password)
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    return verify_and_update(password, hashed_password)[0]
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "workers": PASSWORD_HASH_WORKERS,
+            "pending": _pending,
+            "max_pending": PASSWORD_HASH_MAX_PENDING,
+            "completed": _completed,
+            "rejected": _rejected
+        }
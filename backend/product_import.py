@@ -0,0 +1,335 @@
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, dialect_insert
+from models import Category, Product, ImportJob, InventoryMovement
+import schemas
+import cache
+import response_cache
+import stats
+import product_search
+
+try:
+    import openpyxl
+except ImportError:  # Excel uploads are refused without it
+    openpyxl = None
+
+# Catalog imports (head office price files). The upload is saved to a
+# temporary file and a background thread reads it row by row, validates each
+# row against schemas.ProductCreate and upserts PRODUCT_IMPORT_CHUNK_SIZE rows
+# at a time with INSERT ... ON CONFLICT (barcode), committing every chunk, so
+# progress and per-row errors can be polled on the import_jobs row. Bulk
+# statements skip the Product mapper events, so search_text is set here.
+# Existing products keep their stock: stock changes go through
+# /api/inventory/receipts, which records movements.
+PRODUCT_IMPORT_CHUNK_SIZE = int(os.getenv("PRODUCT_IMPORT_CHUNK_SIZE", "500"))
+PRODUCT_IMPORT_WORKERS = int(os.getenv("PRODUCT_IMPORT_WORKERS", "1"))
+MAX_REPORTED_ERRORS = 1000
+EXTENSIONS = (".csv", ".xlsx")
+
+FIELDS = set(schemas.ProductCreate.model_fields)
+REQUIRED = {name for name, field in schemas.ProductCreate.model_fields.items() if field.is_required()}
+NOT_UPDATED = {"barcode", "stock_quantity", "created_at"}
+CATEGORY_NAME = "category"
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PRODUCT_IMPORT_WORKERS, thread_name_prefix="product-import")
+        return _executor
+
+# ============= READING =============
+def _open_rows(path: str, filename: str) -> Iterator[tuple]:
+    # Raw cell tuples, header first, without loading the whole file
+    if filename.lower().endswith(".xlsx"):
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as handle:
+            yield from csv.reader(handle)
+
+def _estimate_rows(path: str, filename: str) -> Optional[int]:
+    if filename.lower().endswith(".xlsx"):
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max_row - 1 if max_row else None
+    with open(path, "rb") as handle:
+        return max(sum(1 for _ in handle) - 1, 0)
+
+def _header(cells) -> List[Optional[str]]:
+    names = []
+    for cell in cells:
+        name = str(cell).strip().lower().replace(" ", "_") if cell is not None else ""
+        if name == "category_name":
+            name = CATEGORY_NAME
+        names.append(name if name in FIELDS or name == CATEGORY_NAME else None)
+    missing = REQUIRED - set(names)
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    return names
+
+def _record(header: List[Optional[str]], cells) -> dict:
+    record = {}
+    for name, value in zip(header, cells):
+        if name is None or value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        record[name] = value if isinstance(value, (str, bool)) else str(value)
+    return record
+
+# ============= VALIDATION =============
+def _categories(db: Session) -> Tuple[Dict[str, str], set]:
+    # One query for the whole file: {lowercased name: id}, and all ids
+    by_name = {}
+    ids = set()
+    for category_id, name in db.query(Category.id, Category.name):
+        by_name.setdefault(name.strip().lower(), category_id)
+        ids.add(category_id)
+    return by_name, ids
+
+def _validate(record: dict, categories: Dict[str, str], category_ids: set) -> dict:
+    category_name = record.pop(CATEGORY_NAME, None)
+    if category_name is not None and "category_id" not in record:
+        category_id = categories.get(category_name.lower())
+        if category_id is None:
+            raise ValueError(f"Unknown category: {category_name}")
+        record["category_id"] = category_id
+    elif record.get("category_id") and record["category_id"] not in category_ids:
+        raise ValueError(f"Unknown category id: {record['category_id']}")
+    return schemas.ProductCreate.model_validate(record).model_dump()
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}" for detail in error.errors())
+    return str(getattr(error, "orig", None) or error)
+
+# ============= WRITING =============
+def _flags(is_active, stock_quantity, min_stock_level) -> Tuple[bool, bool]:
+    # Same as stats.product_flags, from column values
+    active = bool(is_active)
+    return active, active and (stock_quantity or 0) <= (min_stock_level or 0)
+
+def _write_chunk(db: Session, chunk: List[Tuple[int, dict]], columns: set) -> Tuple[int, int]:
+    # Upserts one chunk; returns (created, updated)
+    by_barcode = {}
+    for _, values in chunk:
+        by_barcode[values["barcode"]] = values  # the last row for a barcode wins
+    existing = {
+        row.barcode: row
+        for row in db.query(Product.id, Product.barcode, Product.is_active, Product.stock_quantity, Product.min_stock_level)
+        .filter(Product.barcode.in_(list(by_barcode)))
+        .order_by(Product.id)
+        .with_for_update()
+    }
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    movement_rows = []
+    active_delta = 0
+    low_stock_delta = 0
+    for barcode, values in by_barcode.items():
+        current = existing.get(barcode)
+        row = {
+            **values,
+            "id": current.id if current else str(uuid.uuid4()),
+            "search_text": product_search.product_search_text(SimpleNamespace(**values)),
+            "created_at": now,  # kept by existing products, see NOT_UPDATED
+            "updated_at": now,
+        }
+        rows.append(row)
+        if current is None:
+            before = (False, False)
+            after = _flags(values["is_active"], values["stock_quantity"], values["min_stock_level"])
+            if values["stock_quantity"]:
+                movement_rows.append({
+                    "product_id": row["id"],
+                    "movement_type": "adjustment",
+                    "quantity": Decimal(values["stock_quantity"]),
+                    "previous_quantity": Decimal(0),
+                    "new_quantity": Decimal(values["stock_quantity"]),
+                    "notes": "Opening stock",
+                    "created_at": now,
+                })
+        else:
+            before = _flags(current.is_active, current.stock_quantity, current.min_stock_level)
+            after = _flags(
+                values["is_active"] if "is_active" in columns else current.is_active,
+                current.stock_quantity,
+                values["min_stock_level"] if "min_stock_level" in columns else current.min_stock_level
+            )
+        active_delta += int(after[0]) - int(before[0])
+        low_stock_delta += int(after[1]) - int(before[1])
+
+    stmt = dialect_insert(db)(Product).values(rows)
+    updated_columns = {name: stmt.excluded[name] for name in columns - NOT_UPDATED}
+    updated_columns["updated_at"] = stmt.excluded.updated_at
+    if "name_en" in columns:
+        updated_columns["search_text"] = stmt.excluded.search_text
+    db.execute(stmt.on_conflict_do_update(index_elements=[Product.barcode], set_=updated_columns))
+
+    if "name_en" not in columns and existing:
+        # Updated products keep their name_en, so their text is rebuilt from
+        # the stored values
+        refreshed = [
+            {"product_id": product.id, "search_text": product_search.product_search_text(product)}
+            for product in db.query(Product.id, Product.name, Product.name_en, Product.barcode)
+            .filter(Product.id.in_([row.id for row in existing.values()]))
+        ]
+        table = Product.__table__
+        db.execute(
+            update(table).where(table.c.id == bindparam("product_id")).values(search_text=bindparam("search_text")),
+            refreshed
+        )
+    if movement_rows:
+        db.execute(insert(InventoryMovement), movement_rows)
+
+    stats.bump(db, stats.ACTIVE_PRODUCTS, active_delta)
+    stats.bump(db, stats.LOW_STOCK_PRODUCTS, low_stock_delta)
+    cache.invalidate_barcodes(db, list(by_barcode))
+    response_cache.invalidate(db, [f"product:{row.id}" for row in existing.values()])
+    return len(by_barcode) - len(existing), len(existing)
+
+def _apply(chunk: List[Tuple[int, dict]], columns: set, progress: dict):
+    db = SessionLocal()
+    try:
+        created, updated = _write_chunk(db, chunk, columns)
+        db.commit()
+    except Exception as error:
+        db.rollback()
+        if len(chunk) == 1:
+            number, values = chunk[0]
+            _add_error(progress, number, values.get("barcode"), _describe(error))
+            return
+        # Find the rows at fault one by one
+        for row in chunk:
+            _apply([row], columns, progress)
+        return
+    finally:
+        db.close()
+    progress["created_count"] += created
+    progress["updated_count"] += updated
+
+# ============= JOBS =============
+def _add_error(progress: dict, number: Optional[int], barcode, message: str):
+    progress["error_count"] += 1
+    if len(progress["errors"]) < MAX_REPORTED_ERRORS:
+        progress["errors"].append({"row": number, "barcode": barcode, "error": message})
+
+def _save(job_id: str, progress: dict, **fields):
+    db = SessionLocal()
+    try:
+        values = {**progress, **fields, "errors": json.dumps(progress["errors"], ensure_ascii=False)}
+        db.query(ImportJob).filter(ImportJob.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def _run(job_id: str, path: str, filename: str):
+    progress = {"processed_rows": 0, "created_count": 0, "updated_count": 0, "error_count": 0, "errors": []}
+    try:
+        _save(job_id, progress, status="running", total_rows=_estimate_rows(path, filename))
+        db = SessionLocal()
+        try:
+            categories, category_ids = _categories(db)
+        finally:
+            db.close()
+
+        rows = _open_rows(path, filename)
+        try:
+            header = _header(next(rows, ()))
+            columns = {name for name in header if name in FIELDS}
+            if CATEGORY_NAME in header:
+                columns.add("category_id")
+
+            chunk = []
+            for number, cells in enumerate(rows, start=2):
+                record = _record(header, cells)
+                if not record:
+                    continue
+                progress["processed_rows"] += 1
+                try:
+                    chunk.append((number, _validate(record, categories, category_ids)))
+                except (ValidationError, ValueError) as error:
+                    _add_error(progress, number, record.get("barcode"), _describe(error))
+                if len(chunk) >= PRODUCT_IMPORT_CHUNK_SIZE:
+                    _apply(chunk, columns, progress)
+                    chunk = []
+                    _save(job_id, progress)
+            if chunk:
+                _apply(chunk, columns, progress)
+        finally:
+            rows.close()
+        _save(job_id, progress, status="completed", total_rows=progress["processed_rows"], finished_at=datetime.now(timezone.utc))
+    except Exception as error:
+        logger.exception("Product import %s failed", job_id)
+        _add_error(progress, None, None, _describe(error))
+        _save(job_id, progress, status="failed", finished_at=datetime.now(timezone.utc))
+    finally:
+        os.remove(path)
+
+def submit(db: Session, upload: UploadFile, user_id: str) -> ImportJob:
+    filename = upload.filename or ""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Upload a .csv or .xlsx file")
+    if extension == ".xlsx" and openpyxl is None:
+        raise HTTPException(status_code=400, detail="Excel import needs the openpyxl package, upload a CSV file instead")
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as handle:
+        shutil.copyfileobj(upload.file, handle)
+        path = handle.name
+
+    job = ImportJob(user_id=user_id, filename=filename, status="pending")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _get_executor().submit(_run, job.id, path, filename)
+    return job
+
+def job_status(job: ImportJob) -> schemas.ImportJob:
+    return schemas.ImportJob(
+        id=job.id,
+        filename=job.filename,
+        status=job.status,
+        total_rows=job.total_rows,
+        processed_rows=job.processed_rows or 0,
+        created_count=job.created_count or 0,
+        updated_count=job.updated_count or 0,
+        error_count=job.error_count or 0,
+        errors=json.loads(job.errors) if job.errors else [],
+        created_at=job.created_at,
+        finished_at=job.finished_at
+    )
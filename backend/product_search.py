@@ -0,0 +1,97 @@
+import re
+from typing import Optional
+
+from sqlalchemy import case, event, func, inspect, and_, or_
+from sqlalchemy.orm import Session
+
+from models import Product
+
+# Product search. Every product keeps a normalized search_text (name,
+# name_en and barcode) maintained by the mapper events below. On PostgreSQL
+# it is served by a pg_trgm GIN index and ranked with similarity(); other
+# databases (SQLite in development and tests) filter with LIKE on the same
+# column and rank the candidates in process.
+# Harakat, Quranic annotation marks, superscript alef and tatweel
+ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+CHARACTER_MAP = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ى": "ي",
+    "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)},  # Persian digits
+})
+WHITESPACE = re.compile(r"\s+")
+SEARCHED_FIELDS = ("name", "name_en", "barcode")
+
+# How many LIKE matches the in-process ranker looks at
+FALLBACK_CANDIDATES = 500
+
+def normalize(text: Optional[str]) -> str:
+    if not text:
+        return ""
+    text = ARABIC_DIACRITICS.sub("", text.lower()).translate(CHARACTER_MAP)
+    return WHITESPACE.sub(" ", text).strip()
+
+def product_search_text(product) -> str:
+    return normalize(" ".join(filter(None, (getattr(product, field) for field in SEARCHED_FIELDS))))
+
+@event.listens_for(Product, "before_insert")
+def _set_search_text(mapper, connection, product):
+    product.search_text = product_search_text(product)
+
+@event.listens_for(Product, "before_update")
+def _update_search_text(mapper, connection, product):
+    # Stock updates at checkout leave the text alone
+    state = inspect(product)
+    if any(state.attrs[field].history.has_changes() for field in SEARCHED_FIELDS):
+        product.search_text = product_search_text(product)
+
+def backfill(db: Session, batch_size: int = 1000):
+    # Products written before search_text existed
+    while True:
+        products = db.query(Product).filter(Product.search_text == None).limit(batch_size).all()
+        if not products:
+            return
+        for product in products:
+            product.search_text = product_search_text(product)
+        db.commit()
+
+def _like_escape(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _fallback_score(product, terms, barcode: str):
+    if product.barcode == barcode:
+        return (0, 0)
+    if product.barcode.startswith(barcode):
+        return (1, len(product.barcode))
+    text = product.search_text or ""
+    position = min(text.find(term) for term in terms)
+    return (2 if text.startswith(terms[0]) else 3, position)
+
+def search_products(db: Session, query, search: str, limit: int):
+    terms = normalize(search).split(" ")
+    barcode = search.strip()
+    barcode_prefix = _like_escape(barcode) + "%"
+
+    # Every word must appear somewhere in the product's text, or the input is
+    # the start of a barcode
+    text_match = and_(*[Product.search_text.like(f"%{_like_escape(term)}%", escape="\\") for term in terms])
+    query = query.filter(or_(text_match, Product.barcode.like(barcode_prefix, escape="\\")))
+
+    if db.bind.dialect.name == "postgresql":
+        barcode_rank = case((Product.barcode == barcode, 0), (Product.barcode.like(barcode_prefix, escape="\\"), 1), else_=2)
+        return query.order_by(
+            barcode_rank,
+            func.similarity(Product.search_text, " ".join(terms)).desc(),
+            Product.name,
+            Product.id
+        ).limit(limit).all()
+
+    candidates = query.limit(FALLBACK_CANDIDATES).all()
+    candidates.sort(key=lambda product: (_fallback_score(product, terms, barcode), product.name, product.id))
+    return candidates[:limit]
@@ -0,0 +1,208 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, Numeric, String, bindparam, cast, column, func, insert, update, values
+from sqlalchemy.orm import Session
+
+from models import Product, Invoice, InvoiceItem, InventoryMovement, Supplier, InvoiceType
+import schemas
+import sequencer
+import cache
+import response_cache
+import stats
+
+# Bulk stock changes: a supplier delivery, a stock count, write-offs. All
+# lines are applied in the caller's transaction. On PostgreSQL each chunk is
+# one UPDATE ... FROM (VALUES ...) RETURNING statement; other databases get
+# an executemany UPDATE. Products are locked in id order first, as checkout
+# does, so a delivery and a till never deadlock each other.
+CHUNK_SIZE = 1000
+PRODUCTS = Product.__table__
+
+def _chunks(items: list, size: int = CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _resolve(db: Session, lines: List[schemas.StockLine]) -> Dict[str, Tuple[int, object]]:
+    # {product_id: (quantity, cost_price or None)}, lines for the same
+    # product added up (the last cost given wins), in first-seen order
+    barcodes = {line.barcode for line in lines if line.barcode and not line.product_id}
+    by_barcode = {}
+    for chunk in _chunks(sorted(barcodes)):
+        by_barcode.update(db.query(Product.barcode, Product.id).filter(Product.barcode.in_(chunk)).all())
+    product_ids = {line.product_id for line in lines if line.product_id}
+    known = set()
+    for chunk in _chunks(sorted(product_ids)):
+        known.update(product_id for (product_id,) in db.query(Product.id).filter(Product.id.in_(chunk)))
+
+    missing = sorted(barcodes - set(by_barcode)) + sorted(product_ids - known)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Unknown products: {', '.join(missing[:20])}")
+
+    totals = OrderedDict()
+    for line in lines:
+        product_id = line.product_id or by_barcode[line.barcode]
+        quantity, cost_price = totals.get(product_id, (0, None))
+        totals[product_id] = (quantity + line.quantity, line.cost_price if line.cost_price is not None else cost_price)
+    return totals
+
+def _lock(db: Session, product_ids: List[str]) -> Dict[str, int]:
+    # Current stock per product, locked until the transaction ends
+    stock = {}
+    for chunk in _chunks(sorted(product_ids)):
+        stock.update(
+            db.query(Product.id, Product.stock_quantity).filter(Product.id.in_(chunk)).order_by(Product.id).with_for_update().all()
+        )
+    return stock
+
+def _apply_postgresql(db: Session, chunk: List[Tuple[str, int, object]], now: datetime) -> list:
+    changes = values(
+        column("product_id", String), column("delta", Integer), column("cost_price", Numeric(10, 2)),
+        name="changes"
+    ).data(chunk)
+    stmt = (
+        update(PRODUCTS)
+        .where(PRODUCTS.c.id == changes.c.product_id)
+        .values(
+            stock_quantity=func.coalesce(PRODUCTS.c.stock_quantity, 0) + changes.c.delta,
+            # A chunk without any cost would otherwise type the column as text
+            cost_price=func.coalesce(cast(changes.c.cost_price, Numeric(10, 2)), PRODUCTS.c.cost_price),
+            updated_at=now
+        )
+        .returning(PRODUCTS.c.id, PRODUCTS.c.barcode, PRODUCTS.c.stock_quantity, PRODUCTS.c.min_stock_level, PRODUCTS.c.is_active)
+    )
+    return db.execute(stmt).all()
+
+def _apply_executemany(db: Session, chunk: List[Tuple[str, int, object]], now: datetime) -> list:
+    stmt = (
+        update(PRODUCTS)
+        .where(PRODUCTS.c.id == bindparam("product_id"))
+        .values(
+            stock_quantity=func.coalesce(PRODUCTS.c.stock_quantity, 0) + bindparam("delta", type_=Integer),
+            cost_price=func.coalesce(bindparam("cost_price", type_=Numeric(10, 2)), PRODUCTS.c.cost_price),
+            updated_at=now
+        )
+    )
+    db.execute(stmt, [
+        {"product_id": product_id, "delta": delta, "cost_price": cost_price}
+        for product_id, delta, cost_price in chunk
+    ])
+    return db.query(
+        Product.id, Product.barcode, Product.stock_quantity, Product.min_stock_level, Product.is_active
+    ).filter(Product.id.in_([product_id for product_id, _, _ in chunk])).all()
+
+def _is_low(stock_quantity, min_stock_level, is_active) -> bool:
+    return bool(is_active) and stock_quantity <= (min_stock_level or 0)
+
+def apply_receipt(db: Session, receipt: schemas.StockReceipt, user_id: str) -> schemas.StockReceiptResult:
+    for line in receipt.lines:
+        if bool(line.product_id) == bool(line.barcode):
+            raise HTTPException(status_code=400, detail="Each line needs either a product_id or a barcode")
+        if receipt.movement_type == "purchase" and line.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Received quantities must be positive")
+        if receipt.movement_type == "damage" and line.quantity >= 0:
+            raise HTTPException(status_code=400, detail="Written-off quantities must be negative")
+    if receipt.create_invoice:
+        if receipt.movement_type != "purchase":
+            raise HTTPException(status_code=400, detail="Only purchases can create an invoice")
+        if not receipt.supplier_id or not db.query(Supplier.id).filter(Supplier.id == receipt.supplier_id).first():
+            raise HTTPException(status_code=404, detail="Supplier not found")
+
+    totals = _resolve(db, receipt.lines)
+    stock = _lock(db, list(totals))
+    negative = [product_id for product_id, (quantity, _) in totals.items() if (stock[product_id] or 0) + quantity < 0]
+    if negative:
+        raise HTTPException(status_code=400, detail=f"Stock would go below zero for: {', '.join(negative[:20])}")
+
+    # Numbered before this transaction writes anything (the sequence is
+    # advanced in a session of its own)
+    invoice_number = sequencer.next_invoice_number() if receipt.create_invoice else None
+
+    now = datetime.now(timezone.utc)
+    apply = _apply_postgresql if db.bind.dialect.name == "postgresql" else _apply_executemany
+    rows = {}
+    for chunk in _chunks([(product_id, quantity, cost_price) for product_id, (quantity, cost_price) in totals.items()]):
+        for row in apply(db, chunk, now):
+            rows[row.id] = row
+
+    notes = receipt.notes or f"Bulk {receipt.movement_type}"
+    movement_rows = []
+    low_stock_delta = 0
+    for product_id, (quantity, _) in totals.items():
+        row = rows[product_id]
+        previous_quantity = row.stock_quantity - quantity
+        low_stock_delta += int(_is_low(row.stock_quantity, row.min_stock_level, row.is_active))
+        low_stock_delta -= int(_is_low(previous_quantity, row.min_stock_level, row.is_active))
+        movement_rows.append({
+            "product_id": product_id,
+            "movement_type": receipt.movement_type,
+            "quantity": Decimal(quantity),
+            "previous_quantity": Decimal(previous_quantity),
+            "new_quantity": Decimal(row.stock_quantity),
+            "notes": notes,
+            "created_at": now,
+        })
+    for chunk in _chunks(movement_rows):
+        db.execute(insert(InventoryMovement), chunk)
+
+    invoice = _purchase_invoice(db, receipt, invoice_number, user_id, totals, now) if receipt.create_invoice else None
+
+    stats.bump(db, stats.LOW_STOCK_PRODUCTS, low_stock_delta)
+    cache.invalidate_barcodes(db, [row.barcode for row in rows.values()])
+    response_cache.invalidate(db, [f"product:{product_id}" for product_id in rows])
+    return schemas.StockReceiptResult(
+        product_count=len(rows),
+        movement_count=len(movement_rows),
+        invoice_id=invoice.id if invoice else None,
+        invoice_number=invoice.invoice_number if invoice else None
+    )
+
+def _purchase_invoice(db: Session, receipt: schemas.StockReceipt, invoice_number: str, user_id: str, totals, now: datetime) -> Invoice:
+    products = {}
+    for chunk in _chunks(list(totals)):
+        products.update(
+            (product_id, (name, cost_price))
+            for product_id, name, cost_price in db.query(Product.id, Product.name, Product.cost_price).filter(Product.id.in_(chunk))
+        )
+
+    item_rows = []
+    subtotal = Decimal("0.00")
+    for product_id, (quantity, _) in totals.items():
+        name, cost_price = products[product_id]
+        line_total = cost_price * quantity
+        subtotal += line_total
+        item_rows.append({
+            "product_id": product_id,
+            "product_name": name,
+            "quantity": Decimal(quantity),
+            "unit_price": cost_price,
+            "tax_rate": Decimal("0.00"),
+            "discount": Decimal("0.00"),
+            "total_price": line_total,
+        })
+
+    invoice = Invoice(
+        invoice_number=invoice_number,
+        invoice_type=InvoiceType.PURCHASE,
+        user_id=user_id,
+        supplier_id=receipt.supplier_id,
+        subtotal=subtotal,
+        tax_amount=Decimal("0.00"),
+        discount_amount=Decimal("0.00"),
+        total_amount=subtotal,
+        payment_method=receipt.payment_method,
+        paid_amount=subtotal,
+        change_amount=Decimal("0.00"),
+        notes=receipt.notes,
+        created_at=now
+    )
+    db.add(invoice)
+    db.flush()
+    for row in item_rows:
+        row["invoice_id"] = invoice.id
+    for chunk in _chunks(item_rows):
+        db.execute(insert(InvoiceItem), chunk)
+    return invoice
@@ -0,0 +1,249 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import and_, case, func, literal_column, not_, or_, select, union_all
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from models import Invoice, InvoiceItem, Product, InvoiceType, PaymentMethod, DailySalesRollup, DailyProductRollup
+import rollups
+
+BUCKETS = ("hour", "day", "week", "month")
+DIMENSIONS = {
+    "cashier": Invoice.user_id,
+    "shift": Invoice.shift_id,
+}
+
+# SQLite has no date_trunc; these strftime/date() forms give the same buckets
+# (weeks start on Monday, like PostgreSQL's date_trunc('week', ...))
+_SQLITE_BUCKETS = {
+    "hour": lambda column: func.strftime("%Y-%m-%d %H:00:00", column),
+    "day": lambda column: func.date(column),
+    "week": lambda column: func.date(column, "weekday 0", "-6 days"),
+    "month": lambda column: func.strftime("%Y-%m-01", column),
+}
+
+def bucket_expression(db: Session, bucket: str, column=Invoice.created_at):
+    if db.bind.dialect.name == "postgresql":
+        # Inline the unit so SELECT and GROUP BY render the identical expression
+        return func.date_trunc(literal_column(f"'{bucket}'"), column)
+    return _SQLITE_BUCKETS[bucket](column)
+
+def bucket_label(value, bucket: str) -> str:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if bucket == "hour":
+        return value.strftime("%Y-%m-%dT%H:00")
+    return value.strftime("%Y-%m-%d")
+
+def _sales_columns(total, count, payment_method):
+    def method_total(method):
+        return func.coalesce(func.sum(case((payment_method == method, total), else_=0)), 0)
+
+    return [
+        func.coalesce(func.sum(total), 0).label("total_sales"),
+        count.label("total_invoices"),
+        method_total(PaymentMethod.CASH).label("cash_sales"),
+        method_total(PaymentMethod.CARD).label("card_sales"),
+        method_total(PaymentMethod.ELECTRONIC).label("electronic_sales"),
+        method_total(PaymentMethod.MIXED).label("mixed_sales"),
+    ]
+
+RAW_COLUMNS = _sales_columns(Invoice.total_amount, func.count(Invoice.id), Invoice.payment_method)
+ROLLUP_COLUMNS = _sales_columns(
+    DailySalesRollup.total_sales,
+    func.coalesce(func.sum(DailySalesRollup.invoice_count), 0),
+    DailySalesRollup.payment_method
+)
+ROLLUP_DIMENSIONS = {
+    "cashier": DailySalesRollup.user_id,
+    "shift": func.nullif(DailySalesRollup.shift_id, ""),
+}
+AMOUNT_FIELDS = ("total_sales", "cash_sales", "card_sales", "electronic_sales", "mixed_sales")
+
+def _day_range(column, first_day, last_day):
+    return and_(column >= rollups.day_start(first_day), column < rollups.day_start(last_day + timedelta(days=1)))
+
+def _raw_conditions(start: datetime, end: datetime, coverage) -> list:
+    conditions = [
+        Invoice.created_at >= start,
+        Invoice.created_at <= end,
+        Invoice.invoice_type == InvoiceType.SALE,
+        Invoice.is_void == False
+    ]
+    if coverage:
+        # Days served from rollups are skipped, except those still waiting
+        # to be re-rolled
+        first_day, last_day, dirty = coverage
+        conditions.append(or_(
+            not_(_day_range(Invoice.created_at, first_day, last_day)),
+            *[_day_range(Invoice.created_at, day, day) for day in dirty]
+        ))
+    return conditions
+
+def _raw_query(db: Session, columns, start: datetime, end: datetime, coverage):
+    return db.query(*columns).filter(*_raw_conditions(start, end, coverage))
+
+def _rollup_query(db: Session, columns, coverage):
+    first_day, last_day, dirty = coverage
+    query = db.query(*columns).filter(DailySalesRollup.day >= first_day, DailySalesRollup.day <= last_day)
+    if dirty:
+        query = query.filter(DailySalesRollup.day.notin_(dirty))
+    return query
+
+def _add(entry: dict, row):
+    for field in AMOUNT_FIELDS:
+        entry[field] += Decimal(str(getattr(row, field)))
+    entry["total_invoices"] += int(row.total_invoices)
+
+def _empty() -> dict:
+    entry = {field: Decimal("0.00") for field in AMOUNT_FIELDS}
+    entry["total_invoices"] = 0
+    return entry
+
+def sales_totals(db: Session, start: datetime, end: datetime) -> dict:
+    # Closed days come from daily_sales_rollups, the rest from invoices
+    coverage = rollups.covered_days(db, start, end)
+    totals = _empty()
+    _add(totals, _raw_query(db, RAW_COLUMNS, start, end, coverage).one())
+    if coverage:
+        _add(totals, _rollup_query(db, ROLLUP_COLUMNS, coverage).one())
+    return totals
+
+def sales_by_bucket(db: Session, start: datetime, end: datetime, bucket: str, dimension: Optional[str] = None) -> list:
+    # Rollups have day granularity, so hourly buckets always use raw invoices
+    coverage = rollups.covered_days(db, start, end) if bucket != "hour" else None
+
+    queries = []
+    raw_group = [bucket_expression(db, bucket, Invoice.created_at).label("bucket")]
+    if dimension:
+        raw_group.append(DIMENSIONS[dimension].label("dimension"))
+    queries.append(_raw_query(db, raw_group + RAW_COLUMNS, start, end, coverage).group_by(*raw_group))
+
+    if coverage:
+        rollup_group = [bucket_expression(db, bucket, DailySalesRollup.day).label("bucket")]
+        if dimension:
+            rollup_group.append(ROLLUP_DIMENSIONS[dimension].label("dimension"))
+        queries.append(_rollup_query(db, rollup_group + ROLLUP_COLUMNS, coverage).group_by(*rollup_group))
+
+    merged = {}
+    for query in queries:
+        for row in query.all():
+            key = (bucket_label(row.bucket, bucket), row.dimension if dimension else None)
+            _add(merged.setdefault(key, _empty()), row)
+
+    report = []
+    for (label, dimension_value), entry in sorted(merged.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+        entry["date"] = label
+        if dimension == "cashier":
+            entry["user_id"] = dimension_value
+        elif dimension == "shift":
+            entry["shift_id"] = dimension_value
+        report.append(entry)
+    return report
+
+PRODUCT_SORT_KEYS = ("quantity", "revenue", "profit")
+
+def _encode_product_cursor(value, product_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([str(value), product_id]).encode()).decode()
+
+def _decode_product_cursor(cursor: str):
+    try:
+        value, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return Decimal(value), product_id
+    except (ValueError, TypeError, ArithmeticError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _product_lines(db: Session, start: datetime, end: datetime, category_id: Optional[str]):
+    # Sold quantity, revenue and cost per product: closed days from
+    # daily_product_rollups, the rest of the range from invoice_items
+    coverage = rollups.covered_days(db, start, end)
+    raw = (
+        select(
+            InvoiceItem.product_id.label("product_id"),
+            InvoiceItem.quantity.label("quantity"),
+            InvoiceItem.total_price.label("revenue"),
+            (InvoiceItem.quantity * Product.cost_price).label("cost")
+        )
+        .join(Invoice, InvoiceItem.invoice_id == Invoice.id)
+        .join(Product, InvoiceItem.product_id == Product.id)
+        .where(*_raw_conditions(start, end, coverage))
+    )
+    if category_id:
+        raw = raw.where(Product.category_id == category_id)
+    if not coverage:
+        return raw.subquery("lines")
+
+    first_day, last_day, dirty = coverage
+    rolled = select(
+        DailyProductRollup.product_id,
+        DailyProductRollup.quantity_sold,
+        DailyProductRollup.total_revenue,
+        DailyProductRollup.total_cost
+    ).where(DailyProductRollup.day >= first_day, DailyProductRollup.day <= last_day)
+    if dirty:
+        rolled = rolled.where(DailyProductRollup.day.notin_(dirty))
+    if category_id:
+        rolled = rolled.where(DailyProductRollup.category_id == category_id)
+    return union_all(raw, rolled).subquery("lines")
+
+def product_sales(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    category_id: Optional[str] = None,
+    sort_by: str = "revenue",
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    # One aggregate per product over _product_lines(), joined to products
+    # for the name and barcode. Pages are keyset-paginated on (sort metric
+    # desc, product id), so deep pages cost the same as the first.
+    lines = _product_lines(db, start, end, category_id)
+    quantity = func.coalesce(func.sum(lines.c.quantity), 0)
+    revenue = func.coalesce(func.sum(lines.c.revenue), 0)
+    profit = revenue - func.coalesce(func.sum(lines.c.cost), 0)
+    metric = {"quantity": quantity, "revenue": revenue, "profit": profit}[sort_by]
+
+    query = (
+        db.query(
+            Product.id.label("product_id"),
+            Product.name.label("product_name"),
+            Product.barcode.label("barcode"),
+            quantity.label("quantity_sold"),
+            revenue.label("total_revenue"),
+            profit.label("total_profit")
+        )
+        .select_from(lines)
+        .join(Product, lines.c.product_id == Product.id)
+    )
+
+    query = query.group_by(Product.id, Product.name, Product.barcode)
+    if cursor:
+        value, product_id = _decode_product_cursor(cursor)
+        query = query.having(or_(metric < value, and_(metric == value, Product.id > product_id)))
+
+    # One extra row tells whether another page exists
+    rows = query.order_by(metric.desc(), Product.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    metric_field = {"quantity": "quantity_sold", "revenue": "total_revenue", "profit": "total_profit"}[sort_by]
+    items = [
+        {
+            "product_id": row.product_id,
+            "product_name": row.product_name,
+            "barcode": row.barcode,
+            "quantity_sold": Decimal(str(row.quantity_sold)),
+            "total_revenue": Decimal(str(row.total_revenue)),
+            "total_profit": Decimal(str(row.total_profit)),
+        }
+        for row in rows
+    ]
+    next_cursor = None
+    if has_more:
+        next_cursor = _encode_product_cursor(items[-1][metric_field], items[-1]["product_id"])
+    return items, next_cursor
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+import notify
+from cache import LRUCache
+
+# Read-through cache of whole JSON responses for reference data. Entries are
+# keyed by the request path and query under the current version of every
+# namespace the response depends on ("categories", "suppliers",
+# "product:<id>"). Writes bump those versions (through the notify channel, so
+# every worker does), which makes the old entries unreachable; LRU eviction
+# then reclaims them. Each entry carries a content ETag, so unchanged
+# responses can be answered with 304.
+response_cache = LRUCache(maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "2000")))
+
+_versions = defaultdict(int)
+_versions_lock = threading.Lock()
+
+def _bump(namespaces: Optional[list]):
+    with _versions_lock:
+        if namespaces is None:
+            _versions["*"] += 1
+            return
+        for namespace in namespaces:
+            _versions[namespace] += 1
+
+notify.subscribe("response", _bump)
+
+def invalidate(db: Session, namespaces: Iterable[str]):
+    # Takes effect when db commits
+    notify.publish(db, "response", list(namespaces))
+
+def _versioned_key(request: Request, namespaces) -> str:
+    # .get() so reads never add namespaces; only writes do
+    with _versions_lock:
+        versions = ",".join(f"{namespace}={_versions.get(namespace, 0)}" for namespace in ("*", *namespaces))
+    return f"{request.url.path}?{request.url.query}|{versions}"
+
+def _etag(content: bytes) -> str:
+    return '"' + hashlib.blake2b(content, digest_size=12).hexdigest() + '"'
+
+def _respond(request: Request, content: bytes, etag: str, headers: Dict[str, str]) -> Response:
+    headers = {**headers, "ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def serialize(adapter: TypeAdapter, value) -> bytes:
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+def cached(request: Request, namespaces, build: Callable[[Response], bytes]) -> Response:
+    # build(response) returns the serialized body and runs only on a miss;
+    # headers it sets on response (such as X-Next-Cursor) are cached with it
+    key = _versioned_key(request, namespaces)
+    entry = response_cache.get(key)
+    if entry is None:
+        scratch = Response()
+        content = build(scratch)
+        headers = {
+            name: value for name, value in scratch.headers.items()
+            if name not in ("content-length", "content-type")
+        }
+        entry = (content, _etag(content), headers)
+        response_cache.set(key, entry)
+    return _respond(request, *entry)
@@ -0,0 +1,202 @@
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import Date, event, func, insert, literal, literal_column, select, text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, dialect_insert
+from models import (
+    Invoice, InvoiceItem, Product, InvoiceType,
+    DailySalesRollup, DailyProductRollup, RollupState, RollupDirtyDay
+)
+
+# Daily rollups of closed days, so historical reports do not re-scan
+# invoices and invoice_items. rollup_state.high_water is the first day that
+# has not been rolled up yet; rollup_dirty_days lists closed days whose raw
+# rows changed afterwards (voids, late offline uploads) and must be re-rolled.
+ROLLUP_INTERVAL_SECONDS = int(os.getenv("ROLLUP_INTERVAL_SECONDS", "300"))
+# A day is rolled up only once it has been over for this long, so sales that
+# were still committing around midnight are not missed
+ROLLUP_GRACE = timedelta(minutes=int(os.getenv("ROLLUP_GRACE_MINUTES", "10")))
+ROLLUP_LOCK_ID = 7_300_001
+STATE_NAME = "daily"
+
+logger = logging.getLogger(__name__)
+
+_worker = None
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def day_start(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+def closed_until() -> date:
+    # Days strictly before this one are closed
+    return (_utcnow() - ROLLUP_GRACE).date()
+
+def mark_dirty(db: Session, day: date):
+    stmt = dialect_insert(db)(RollupDirtyDay).values(day=day, created_at=_utcnow())
+    db.execute(stmt.on_conflict_do_update(index_elements=[RollupDirtyDay.day], set_={"created_at": _utcnow()}))
+
+@event.listens_for(SessionLocal, "before_flush")
+def _mark_touched_days(session, flush_context, instances):
+    # Any invoice written or changed for an already closed day (a void, an
+    # offline sale uploaded late) makes that day's rollup stale
+    limit = closed_until()
+    days = set()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Invoice) and obj.created_at is not None:
+            created_at = obj.created_at
+            if created_at.tzinfo is not None:
+                created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+            if created_at.date() < limit:
+                days.add(created_at.date())
+    for day in days:
+        mark_dirty(session, day)
+
+def _roll_day(db: Session, day: date):
+    start = day_start(day)
+    end = start + timedelta(days=1)
+    in_day = [
+        Invoice.created_at >= start,
+        Invoice.created_at < end,
+        Invoice.invoice_type == InvoiceType.SALE,
+        Invoice.is_void == False
+    ]
+
+    db.query(DailySalesRollup).filter(DailySalesRollup.day == day).delete(synchronize_session=False)
+    db.query(DailyProductRollup).filter(DailyProductRollup.day == day).delete(synchronize_session=False)
+
+    shift_key = func.coalesce(Invoice.shift_id, literal_column("''"))
+    sales = (
+        select(
+            literal(day, Date),
+            Invoice.user_id,
+            shift_key,
+            Invoice.payment_method,
+            func.sum(Invoice.total_amount),
+            func.count(Invoice.id)
+        )
+        .where(*in_day)
+        .group_by(Invoice.user_id, shift_key, Invoice.payment_method)
+    )
+    db.execute(insert(DailySalesRollup).from_select(
+        ["day", "user_id", "shift_id", "payment_method", "total_sales", "invoice_count"], sales
+    ))
+
+    products = (
+        select(
+            literal(day, Date),
+            InvoiceItem.product_id,
+            Product.category_id,
+            func.sum(InvoiceItem.quantity),
+            func.sum(InvoiceItem.total_price),
+            func.sum(InvoiceItem.quantity * Product.cost_price)
+        )
+        .join(Invoice, InvoiceItem.invoice_id == Invoice.id)
+        .join(Product, InvoiceItem.product_id == Product.id)
+        .where(*in_day)
+        .group_by(InvoiceItem.product_id, Product.category_id)
+    )
+    db.execute(insert(DailyProductRollup).from_select(
+        ["day", "product_id", "category_id", "quantity_sold", "total_revenue", "total_cost"], products
+    ))
+
+def _roll_next_day(db: Session) -> Optional[date]:
+    # One day per transaction. On PostgreSQL the transaction-scoped advisory
+    # lock keeps several workers from rolling at the same time.
+    if db.bind.dialect.name == "postgresql":
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": ROLLUP_LOCK_ID}).scalar():
+            return None
+
+    limit = closed_until()
+    state = db.get(RollupState, STATE_NAME)
+    if state is None:
+        first_invoice = db.query(func.min(Invoice.created_at)).scalar()
+        state = RollupState(name=STATE_NAME, high_water=first_invoice.date() if first_invoice else limit)
+        db.add(state)
+
+    if state.high_water < limit:
+        day = state.high_water
+        marked_at = db.query(RollupDirtyDay.created_at).filter(RollupDirtyDay.day == day).scalar()
+        _roll_day(db, day)
+        state.high_water = day + timedelta(days=1)
+        _clear_dirty(db, day, marked_at)
+        return day
+
+    dirty = db.query(RollupDirtyDay).filter(RollupDirtyDay.day < limit).order_by(RollupDirtyDay.day).first()
+    if dirty is None:
+        return None
+    marked_at = dirty.created_at
+    _roll_day(db, dirty.day)
+    _clear_dirty(db, dirty.day, marked_at)
+    return dirty.day
+
+def _clear_dirty(db: Session, day: date, marked_at: Optional[datetime]):
+    # marked_at: the day's mark as read before rolling it, None if there was
+    # none. Keep the mark if the day was touched again while we were rolling it.
+    if marked_at is None:
+        return
+    db.query(RollupDirtyDay).filter(
+        RollupDirtyDay.day == day,
+        RollupDirtyDay.created_at <= marked_at
+    ).delete(synchronize_session=False)
+
+def refresh() -> list:
+    rolled = []
+    while True:
+        db = SessionLocal()
+        try:
+            day = _roll_next_day(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        if day is None:
+            return rolled
+        rolled.append(day)
+
+def high_water(db: Session) -> Optional[date]:
+    state = db.get(RollupState, STATE_NAME)
+    return state.high_water if state else None
+
+def dirty_days(db: Session) -> set:
+    return {day for (day,) in db.query(RollupDirtyDay.day).all()}
+
+def covered_days(db: Session, start: datetime, end: datetime):
+    # The whole days inside [start, end] that can be read from rollups, as
+    # (first_day, last_day, dirty_days_in_between), or None
+    hw = high_water(db)
+    if hw is None:
+        return None
+    first_day = start.date() if start == day_start(start.date()) else start.date() + timedelta(days=1)
+    last_day = (end + timedelta(microseconds=1)).date() - timedelta(days=1)
+    last_day = min(last_day, hw - timedelta(days=1))
+    if first_day > last_day:
+        return None
+    dirty = {day for day in dirty_days(db) if first_day <= day <= last_day}
+    return first_day, last_day, dirty
+
+def _run_forever():
+    while True:
+        time.sleep(ROLLUP_INTERVAL_SECONDS)
+        try:
+            rolled = refresh()
+            if rolled:
+                logger.info("Rolled up %d day(s) of sales", len(rolled))
+        except Exception:
+            logger.exception("Sales rollup failed")
+
+def start_worker():
+    global _worker
+    if _worker is not None or ROLLUP_INTERVAL_SECONDS <= 0:
+        return
+    _worker = threading.Thread(target=_run_forever, name="sales-rollup", daemon=True)
+    _worker.start()
@@ -77,6 +77,24 @@ class ProductBase(BaseModel):
 class ProductCreate(ProductBase):
     pass
 
+class ProductImportError(BaseModel):
+    row: Optional[int] = None  # line in the file, None for file-level errors
+    barcode: Optional[str] = None
+    error: str
+
+class ImportJob(BaseModel):
+    id: str
+    filename: Optional[str] = None
+    status: str  # pending, running, completed, failed
+    total_rows: Optional[int] = None
+    processed_rows: int
+    created_count: int
+    updated_count: int
+    error_count: int
+    errors: List[ProductImportError] = []
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
 class ProductUpdate(BaseModel):
     barcode: Optional[str] = None
     name: Optional[str] = None
@@ -99,6 +117,12 @@ class Product(ProductBase):
     updated_at: datetime
     category: Optional[Category] = None
 
+class ProductSyncPage(BaseModel):
+    columns: List[str]
+    rows: List[list]
+    cursor: Optional[str] = None
+    has_more: bool
+
 # Customer Schemas
 class CustomerBase(BaseModel):
     name: str
@@ -178,16 +202,27 @@ class InvoiceBase(BaseModel):
     payment_method: PaymentMethod
     notes: Optional[str] = None
 
+class PaymentCreate(BaseModel):
+    payment_method: PaymentMethod
+    amount: Decimal = Field(gt=0)
+    reference_number: Optional[str] = None
+
 class InvoiceCreate(InvoiceBase):
     items: List[InvoiceItemCreate]
     paid_amount: Decimal = Field(ge=0)
+    # The parts of a mixed payment, adding up to paid_amount
+    payments: List[PaymentCreate] = []
     discount_amount: Decimal = Field(default=Decimal("0.00"), ge=0)
+    invoice_number: Optional[str] = None  # from a reserved number block
+    # Client-generated; posting the same key again returns the first invoice
+    idempotency_key: Optional[str] = Field(default=None, min_length=1, max_length=100)
 
-class Invoice(InvoiceBase):
+class InvoiceSummary(InvoiceBase):
     model_config = ConfigDict(from_attributes=True)
     id: str
     invoice_number: str
     user_id: str
+    supplier_id: Optional[str] = None
     shift_id: Optional[str] = None
     subtotal: Decimal
     tax_amount: Decimal
@@ -197,10 +232,39 @@ class Invoice(InvoiceBase):
     change_amount: Decimal
     is_void: bool
     created_at: datetime
-    items: List[InvoiceItem] = []
     user: Optional[User] = None
     customer: Optional[Customer] = None
 
+class Invoice(InvoiceSummary):
+    items: List[InvoiceItem] = []
+
+# Offline Sale Upload Schemas
+class OfflineSale(InvoiceCreate):
+    idempotency_key: str = Field(min_length=1, max_length=100)
+    created_at: Optional[datetime] = None  # when the sale was made at the till
+    shift_id: Optional[str] = None  # the shift that was open at the till
+
+class InvoiceBatch(BaseModel):
+    sales: List[OfflineSale] = Field(min_length=1, max_length=500)
+
+class InvoiceBatchResult(BaseModel):
+    idempotency_key: str
+    status: str  # created, duplicate, error
+    invoice_id: Optional[str] = None
+    invoice_number: Optional[str] = None
+    error: Optional[str] = None
+
+# Invoice Number Block Schemas
+class InvoiceNumberBlockRequest(BaseModel):
+    count: int = Field(default=50, ge=1, le=1000)
+
+class InvoiceNumberBlock(BaseModel):
+    day: str
+    first: int
+    last: int
+    first_number: str
+    last_number: str
+
 # Shift Schemas
 class ShiftOpen(BaseModel):
     opening_balance: Decimal = Field(default=Decimal("0.00"), ge=0)
@@ -225,6 +289,35 @@ class Shift(BaseModel):
     closed_at: Optional[datetime] = None
     user: Optional[User] = None
 
+class CashMovementCreate(BaseModel):
+    transaction_type: str = Field(pattern="^(expense|deposit|withdrawal)$")
+    amount: Decimal = Field(gt=0)
+    description: Optional[str] = None
+
+class CashMovement(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: str
+    shift_id: str
+    transaction_type: str
+    amount: Decimal  # negative for money taken out of the drawer
+    description: Optional[str] = None
+    created_at: datetime
+
+class ShiftTotal(BaseModel):
+    entry: str
+    amount: Decimal
+    count: int
+
+class ShiftReport(BaseModel):
+    shift_id: str
+    status: ShiftStatus
+    opening_balance: Decimal
+    payments: List[ShiftTotal]  # takings per payment method
+    cash_movements: List[ShiftTotal]  # expenses, deposits, withdrawals
+    expected_cash: Decimal
+    opened_at: datetime
+    closed_at: Optional[datetime] = None
+
 # Inventory Movement Schemas
 class InventoryMovementBase(BaseModel):
     product_id: str
@@ -242,6 +335,34 @@ class InventoryMovement(InventoryMovementBase):
     new_quantity: Decimal
     created_at: datetime
 
+# Bulk Stock Schemas
+class StockLine(BaseModel):
+    # Either product_id or barcode
+    product_id: Optional[str] = None
+    barcode: Optional[str] = None
+    quantity: int  # positive for purchases, negative for damage, signed for adjustments
+    cost_price: Optional[Decimal] = Field(default=None, ge=0)
+
+class StockReceipt(BaseModel):
+    movement_type: str = Field(default="purchase", pattern="^(purchase|adjustment|damage)$")
+    lines: List[StockLine] = Field(min_length=1, max_length=10000)
+    notes: Optional[str] = None
+    # Record the delivery as a purchase invoice from supplier_id
+    create_invoice: bool = False
+    supplier_id: Optional[str] = None
+    payment_method: PaymentMethod = PaymentMethod.CASH
+
+class StockReceiptResult(BaseModel):
+    product_count: int
+    movement_count: int
+    invoice_id: Optional[str] = None
+    invoice_number: Optional[str] = None
+
+class StockAt(BaseModel):
+    product_id: str
+    at: datetime
+    quantity: Decimal
+
 # Offer Schemas
 class OfferBase(BaseModel):
     name: str
@@ -286,6 +407,9 @@ class SalesReport(BaseModel):
     cash_sales: Decimal
     card_sales: Decimal
     electronic_sales: Decimal
+    mixed_sales: Decimal = Decimal("0.00")
+    user_id: Optional[str] = None
+    shift_id: Optional[str] = None
 
 class ProductSalesReport(BaseModel):
     product_id: str
@@ -0,0 +1,103 @@
+import heapq
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from database import SequenceSessionLocal, dialect_insert
+from models import Invoice, InvoiceSequence, InvoiceNumberBlock
+
+# Numbers a worker reserves per round trip. 1 keeps numbering strictly
+# sequential; larger blocks trade gaps after a restart for fewer writes.
+INVOICE_NUMBER_BLOCK_SIZE = max(1, int(os.getenv("INVOICE_NUMBER_BLOCK_SIZE", "1")))
+
+INVOICE_NUMBER_PATTERN = re.compile(r"^INV-(\d{8})-(\d{4,})$")
+
+_lock = threading.Lock()
+_blocks = {}
+_returned = {}
+
+def format_invoice_number(day: str, value: int) -> str:
+    return f"INV-{day}-{value:04d}"
+
+def today_key(now: Optional[datetime] = None) -> str:
+    return (now or datetime.now(timezone.utc)).strftime("%Y%m%d")
+
+def reserve(day: str, count: int = 1) -> int:
+    # Increment the day's counter in its own short transaction so the row lock
+    # is held only for the upsert, never for the rest of a checkout. Returns
+    # the last value of the reserved range.
+    db = SequenceSessionLocal()
+    try:
+        stmt = dialect_insert(db)(InvoiceSequence).values(day=day, last_value=count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[InvoiceSequence.day],
+            set_={"last_value": InvoiceSequence.last_value + count}
+        ).returning(InvoiceSequence.last_value)
+        last_value = db.execute(stmt).scalar_one()
+        db.commit()
+        return last_value
+    finally:
+        db.close()
+
+def next_invoice_number(now: Optional[datetime] = None) -> str:
+    day = today_key(now)
+    with _lock:
+        returned = _returned.get(day)
+        if returned:
+            return format_invoice_number(day, heapq.heappop(returned))
+        if INVOICE_NUMBER_BLOCK_SIZE > 1:
+            block = _blocks.get(day)
+            if block is None or block[0] > block[1]:
+                last_value = reserve(day, INVOICE_NUMBER_BLOCK_SIZE)
+                block = [last_value - INVOICE_NUMBER_BLOCK_SIZE + 1, last_value]
+                # Blocks from previous days can never be used again
+                _blocks.clear()
+                _blocks[day] = block
+            value = block[0]
+            block[0] += 1
+            return format_invoice_number(day, value)
+    return format_invoice_number(day, reserve(day))
+
+def release(invoice_number: str):
+    # A number taken for a sale that was then turned away is handed out
+    # again before any new one, so rejected sales leave no gap
+    match = INVOICE_NUMBER_PATTERN.match(invoice_number)
+    if not match:
+        return
+    day, value = match.group(1), int(match.group(2))
+    with _lock:
+        if day != today_key():
+            return
+        for stale in [key for key in _returned if key != day]:
+            del _returned[stale]
+        heapq.heappush(_returned.setdefault(day, []), value)
+
+def reserve_block(db: Session, user_id: str, count: int, now: Optional[datetime] = None) -> InvoiceNumberBlock:
+    # Numbers for a till to use offline, recorded against the user so no
+    # other till can claim them
+    day = today_key(now)
+    last_value = reserve(day, count)
+    block = InvoiceNumberBlock(day=day, first_value=last_value - count + 1, last_value=last_value, user_id=user_id)
+    db.add(block)
+    return block
+
+def is_reserved(db: Session, invoice_number: str, user_id: str) -> bool:
+    # A client-supplied number is accepted only from a block that
+    # reserve_block() handed to the same user
+    match = INVOICE_NUMBER_PATTERN.match(invoice_number)
+    if not match:
+        return False
+    day, value = match.group(1), int(match.group(2))
+    return db.query(InvoiceNumberBlock.id).filter(
+        InvoiceNumberBlock.user_id == user_id,
+        InvoiceNumberBlock.day == day,
+        InvoiceNumberBlock.first_value <= value,
+        InvoiceNumberBlock.last_value >= value
+    ).first() is not None
+
+def is_used(db: Session, invoice_number: str) -> bool:
+    return db.query(Invoice.id).filter(Invoice.invoice_number == invoice_number).first() is not None
@@ -1,21 +1,43 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
-from decimal import Decimal
 import os
 from dotenv import load_dotenv
+from pydantic import TypeAdapter
 
-from database import engine, get_db, Base
-from models import User, Category, Product, Customer, Supplier, Invoice, InvoiceItem, Shift, InventoryMovement, Offer, AuditLog, UserRole, InvoiceType, ShiftStatus, PaymentMethod
+from database import get_db, get_async_db, get_report_db, run_db, sync_schema, pool_stats
+from models import User, Category, Product, Customer, Supplier, Invoice, Shift, Offer, ImportJob, UserRole, InvoiceType, ShiftStatus
 import schemas
-from auth import get_password_hash, verify_password, create_access_token, get_current_active_user
+import checkout
+import sequencer
+import cache
+import notify
+import catalog
+import stats
+import reports
+import rollups
+import pagination
+import product_search
+import customers
+import passwords
+import audit
+import response_cache
+import shift_ledger
+import inventory_ledger
+import receiving
+import product_import
+from auth import get_password_hash, create_access_token, create_stream_token, get_current_active_user, get_stream_user, token_claims
 
 load_dotenv()
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Create tables and any columns or indexes missing from existing tables
+sync_schema()
 
 app = FastAPI(title="Supermarket Management System API", version="1.0.0")
 
@@ -26,6 +48,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Sync-Cursor", "X-Next-Cursor", "X-Total-Count-Estimate", "ETag"],
 )
 
 # Initialize database with default admin user
@@ -44,14 +67,41 @@ def init_db():
         db.add(admin_user)
         db.commit()
         print("✅ Default admin user created: username=admin, password=admin123")
+    
+    stats.ensure_seeded(db)
+    product_search.backfill(db)
+    customers.backfill(db)
+    shift_ledger.backfill(db)
 
 init_db()
 
+@app.on_event("startup")
+def start_background_workers():
+    passwords.start()
+    notify.start_listener()
+    rollups.start_worker()
+    inventory_ledger.start_worker()
+    audit.start_worker()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    audit.stop()
+    passwords.shutdown()
+
 # ============= AUTH ROUTES =============
+def load_login_user(db: Session, username: str) -> Optional[User]:
+    return db.query(User).filter(User.username == username).first()
+
+def store_password_hash(db: Session, user: User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+
 @app.post("/api/auth/login", response_model=schemas.Token)
-def login(user_login: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == user_login.username).first()
-    if not user or not verify_password(user_login.password, user.hashed_password):
+async def login(user_login: schemas.UserLogin, request: Request, db=Depends(get_async_db)):
+    # Async so the bcrypt check is awaited rather than holding a threadpool thread
+    user = await run_db(db, load_login_user, user_login.username)
+    valid, new_hash = await passwords.verify_and_update_async(user_login.password, user.hashed_password) if user else (False, None)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
@@ -59,42 +109,46 @@ def login(user_login: schemas.UserLogin, db: Session = Depends(get_db)):
     if not user.is_active:
         raise HTTPException(status_code=400, detail="User account is disabled")
     
-    access_token = create_access_token(data={"sub": user.username})
+    profile = schemas.User.model_validate(user)
+    access_token = create_access_token(data=token_claims(user))
     
-    # Create audit log
-    audit_log = AuditLog(
-        user_id=user.id,
-        action="login",
-        entity_type="auth",
-        details="User logged in successfully"
+    # Re-hash with the current cost settings while we have the password
+    if new_hash:
+        await run_db(db, store_password_hash, user, new_hash)
+    
+    audit.record(
+        profile.id,
+        "login",
+        "auth",
+        details="User logged in successfully",
+        ip_address=request.client.host if request.client else None
     )
-    db.add(audit_log)
-    db.commit()
     
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user": user
+        "user": profile
     }
 
 @app.get("/api/auth/me", response_model=schemas.User)
-def get_me(current_user: User = Depends(get_current_active_user)):
-    return current_user
+def get_me(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    user = db.query(User).filter(User.id == current_user.id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 # ============= USER ROUTES =============
-@app.post("/api/users", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
-    existing_user = db.query(User).filter((User.username == user.username) | (User.email == user.email)).first()
+def check_user_unique(db: Session, username: str, email: str):
+    existing_user = db.query(User).filter((User.username == username) | (User.email == email)).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Username or email already exists")
-    
+
+def insert_user(db: Session, user: schemas.UserCreate, hashed_password: str) -> schemas.User:
+    check_user_unique(db, user.username, user.email)
     db_user = User(
         username=user.username,
         email=user.email,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=hashed_password,
         full_name=user.full_name,
         role=user.role,
         is_active=user.is_active
@@ -102,14 +156,23 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db), current
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
+    return schemas.User.model_validate(db_user)
+
+@app.post("/api/users", response_model=schemas.User)
+async def create_user(user: schemas.UserCreate, db=Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # Checked before hashing so a duplicate does not cost a bcrypt round
+    await run_db(db, check_user_unique, user.username, user.email)
+    hashed_password = await passwords.hash_password_async(user.password)
+    return await run_db(db, insert_user, user, hashed_password)
 
 @app.get("/api/users", response_model=List[schemas.User])
-def get_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+def get_users(response: Response, cursor: Optional[str] = None, limit: int = Query(default=100, ge=1, le=500), with_total: bool = False, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
     if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
         raise HTTPException(status_code=403, detail="Not authorized")
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+    return pagination.paginate(db.query(User), [User.username, User.id], cursor, limit, response, with_total=with_total)
 
 @app.get("/api/users/{user_id}", response_model=schemas.User)
 def get_user(user_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
@@ -120,15 +183,12 @@ def get_user(user_id: str, db: Session = Depends(get_db), current_user: User = D
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-@app.put("/api/users/{user_id}", response_model=schemas.User)
-def update_user(user_id: str, user_update: schemas.UserUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
+def apply_user_update(db: Session, user_id: str, user_update: schemas.UserUpdate, hashed_password: Optional[str]) -> schemas.User:
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    old_claims = (user.role, user.is_active)
     if user_update.email:
         user.email = user_update.email
     if user_update.full_name:
@@ -137,13 +197,26 @@ def update_user(user_id: str, user_update: schemas.UserUpdate, db: Session = Dep
         user.role = user_update.role
     if user_update.is_active is not None:
         user.is_active = user_update.is_active
-    if user_update.password:
-        user.hashed_password = get_password_hash(user_update.password)
+    if hashed_password:
+        user.hashed_password = hashed_password
+    
+    # Outstanding tokens carry the old role / active flag, so revoke them
+    if (user.role, user.is_active) != old_claims or hashed_password:
+        user.token_version = (user.token_version or 0) + 1
+        cache.invalidate_principals(db, [user.id])
     
     user.updated_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(user)
-    return user
+    return schemas.User.model_validate(user)
+
+@app.put("/api/users/{user_id}", response_model=schemas.User)
+async def update_user(user_id: str, user_update: schemas.UserUpdate, db=Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    hashed_password = await passwords.hash_password_async(user_update.password) if user_update.password else None
+    return await run_db(db, apply_user_update, user_id, user_update, hashed_password)
 
 @app.delete("/api/users/{user_id}")
 def delete_user(user_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
@@ -155,29 +228,44 @@ def delete_user(user_id: str, db: Session = Depends(get_db), current_user: User
         raise HTTPException(status_code=404, detail="User not found")
     
     db.delete(user)
+    cache.invalidate_principals(db, [user.id])
     db.commit()
     return {"message": "User deleted successfully"}
 
 # ============= CATEGORY ROUTES =============
+def invalidate_category_barcodes(db: Session, category_id: str):
+    # Cached barcode lookups embed the product's category
+    barcodes = db.query(Product.barcode).filter(Product.category_id == category_id)
+    cache.invalidate_barcodes(db, [barcode for (barcode,) in barcodes])
+
 @app.post("/api/categories", response_model=schemas.Category)
 def create_category(category: schemas.CategoryCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
     db_category = Category(**category.model_dump())
     db.add(db_category)
+    response_cache.invalidate(db, ["categories"])
     db.commit()
     db.refresh(db_category)
     return db_category
 
+CATEGORY_LIST = TypeAdapter(List[schemas.Category])
+SUPPLIER_LIST = TypeAdapter(List[schemas.Supplier])
+
 @app.get("/api/categories", response_model=List[schemas.Category])
-def get_categories(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    categories = db.query(Category).filter(Category.is_active == True).offset(skip).limit(limit).all()
-    return categories
+def get_categories(request: Request, cursor: Optional[str] = None, limit: int = Query(default=100, ge=1, le=500), with_total: bool = False, db: Session = Depends(get_db)):
+    def build(response: Response) -> bytes:
+        query = db.query(Category).filter(Category.is_active == True)
+        categories = pagination.paginate(query, [Category.name, Category.id], cursor, limit, response, with_total=with_total)
+        return response_cache.serialize(CATEGORY_LIST, categories)
+    return response_cache.cached(request, ["categories"], build)
 
 @app.get("/api/categories/{category_id}", response_model=schemas.Category)
-def get_category(category_id: str, db: Session = Depends(get_db)):
-    category = db.query(Category).filter(Category.id == category_id).first()
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
-    return category
+def get_category(category_id: str, request: Request, db: Session = Depends(get_db)):
+    def build(response: Response) -> bytes:
+        category = db.query(Category).filter(Category.id == category_id).first()
+        if not category:
+            raise HTTPException(status_code=404, detail="Category not found")
+        return schemas.Category.model_validate(category).model_dump_json().encode()
+    return response_cache.cached(request, ["categories"], build)
 
 @app.put("/api/categories/{category_id}", response_model=schemas.Category)
 def update_category(category_id: str, category_update: schemas.CategoryUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
@@ -188,6 +276,8 @@ def update_category(category_id: str, category_update: schemas.CategoryUpdate, d
     for key, value in category_update.model_dump(exclude_unset=True).items():
         setattr(category, key, value)
     
+    response_cache.invalidate(db, ["categories"])
+    invalidate_category_barcodes(db, category_id)
     db.commit()
     db.refresh(category)
     return category
@@ -199,6 +289,8 @@ def delete_category(category_id: str, db: Session = Depends(get_db), current_use
         raise HTTPException(status_code=404, detail="Category not found")
     
     category.is_active = False
+    response_cache.invalidate(db, ["categories"])
+    invalidate_category_barcodes(db, category_id)
     db.commit()
     return {"message": "Category deleted successfully"}
 
@@ -211,39 +303,88 @@ def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)
     
     db_product = Product(**product.model_dump())
     db.add(db_product)
+    db.flush()
+    inventory_ledger.record_adjustment(db, db_product, 0, "Opening stock")
+    cache.invalidate_barcodes(db, [db_product.barcode])
+    stats.track_product(db, None, db_product)
     db.commit()
     db.refresh(db_product)
     return db_product
 
+@app.post("/api/products/import", response_model=schemas.ImportJob, status_code=202)
+def import_products(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    # Runs in the background; poll GET /api/products/import/{job_id}
+    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return product_import.job_status(product_import.submit(db, file, current_user.id))
+
+@app.get("/api/products/import/{job_id}", response_model=schemas.ImportJob)
+def get_product_import(job_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = db.query(ImportJob).filter(ImportJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return product_import.job_status(job)
+
 @app.get("/api/products", response_model=List[schemas.Product])
-def get_products(skip: int = 0, limit: int = 100, search: Optional[str] = None, category_id: Optional[str] = None, db: Session = Depends(get_db)):
+def get_products(response: Response, cursor: Optional[str] = None, limit: int = Query(default=100, ge=1, le=500), with_total: bool = False, search: Optional[str] = None, category_id: Optional[str] = None, db: Session = Depends(get_db)):
     query = db.query(Product).filter(Product.is_active == True)
     
-    if search:
-        query = query.filter(
-            (Product.name.ilike(f"%{search}%")) |
-            (Product.barcode.ilike(f"%{search}%"))
-        )
-    
     if category_id:
         query = query.filter(Product.category_id == category_id)
     
-    products = query.offset(skip).limit(limit).all()
-    return products
+    if search and search.strip():
+        # Ranked results: the best `limit` matches, no further pages
+        return product_search.search_products(db, query, search, limit)
+    
+    return pagination.paginate(query, [Product.name, Product.id], cursor, limit, response, with_total=with_total)
+
+@app.get("/api/products/sync", response_model=schemas.ProductSyncPage)
+def sync_products(cursor: Optional[str] = None, limit: int = Query(default=1000, ge=1, le=5000), db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    return catalog.changes_since(db, cursor, limit)
+
+@app.get("/api/products/export")
+def export_products(current_user: User = Depends(get_current_active_user)):
+    return StreamingResponse(
+        catalog.export_ndjson_gzip(),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Encoding": "gzip",
+            "Content-Disposition": "attachment; filename=products.ndjson",
+            "X-Sync-Cursor": catalog.current_cursor()
+        }
+    )
 
-@app.get("/api/products/barcode/{barcode}", response_model=schemas.Product)
-def get_product_by_barcode(barcode: str, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.barcode == barcode, Product.is_active == True).first()
+def load_product_json(db: Session, barcode: str) -> Optional[bytes]:
+    product = db.query(Product).options(joinedload(Product.category)).filter(Product.barcode == barcode, Product.is_active == True).first()
     if not product:
+        return None
+    return schemas.Product.model_validate(product).model_dump_json().encode()
+
+@app.get("/api/products/barcode/{barcode}", response_model=schemas.Product)
+async def get_product_by_barcode(barcode: str, db=Depends(get_async_db)):
+    cached = cache.barcode_cache.get(barcode)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    
+    generation = cache.barcode_cache.generation
+    content = await run_db(db, load_product_json, barcode)
+    if content is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    
+    cache.barcode_cache.set(barcode, content, generation=generation)
+    return Response(content=content, media_type="application/json")
 
 @app.get("/api/products/{product_id}", response_model=schemas.Product)
-def get_product(product_id: str, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
+def get_product(product_id: str, request: Request, db: Session = Depends(get_db)):
+    def build(response: Response) -> bytes:
+        product = db.query(Product).options(joinedload(Product.category)).filter(Product.id == product_id).first()
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return schemas.Product.model_validate(product).model_dump_json().encode()
+    # The embedded category makes the response depend on categories too
+    return response_cache.cached(request, ["categories", f"product:{product_id}"], build)
 
 @app.put("/api/products/{product_id}", response_model=schemas.Product)
 def update_product(product_id: str, product_update: schemas.ProductUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
@@ -251,10 +392,21 @@ def update_product(product_id: str, product_update: schemas.ProductUpdate, db: S
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    for key, value in product_update.model_dump(exclude_unset=True).items():
+    old_barcode = product.barcode
+    old_flags = stats.product_flags(product)
+    old_stock = product.stock_quantity
+    update_data = product_update.model_dump(exclude_unset=True)
+    # Stock is never unknown; a null stock_quantity leaves it as it is
+    if "stock_quantity" in update_data and update_data["stock_quantity"] is None:
+        del update_data["stock_quantity"]
+    for key, value in update_data.items():
         setattr(product, key, value)
     
+    inventory_ledger.record_adjustment(db, product, old_stock, "Stock edited")
     product.updated_at = datetime.now(timezone.utc)
+    cache.invalidate_barcodes(db, [old_barcode, product.barcode])
+    response_cache.invalidate(db, [f"product:{product.id}"])
+    stats.track_product(db, old_flags, product)
     db.commit()
     db.refresh(product)
     return product
@@ -265,14 +417,23 @@ def delete_product(product_id: str, db: Session = Depends(get_db), current_user:
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    old_flags = stats.product_flags(product)
     product.is_active = False
+    cache.invalidate_barcodes(db, [product.barcode])
+    response_cache.invalidate(db, [f"product:{product.id}"])
+    stats.track_product(db, old_flags, product)
     db.commit()
     return {"message": "Product deleted successfully"}
 
 # ============= CUSTOMER ROUTES =============
 @app.post("/api/customers", response_model=schemas.Customer)
 def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    existing_customer = db.query(Customer).filter(Customer.phone == customer.phone).first()
+    # Phones without digits ("n/a") have no normalized form to compare
+    same_phone = Customer.phone == customer.phone
+    normalized = customers.normalize_phone(customer.phone)
+    if normalized:
+        same_phone = same_phone | (Customer.phone_normalized == normalized)
+    existing_customer = db.query(Customer).filter(same_phone).first()
     if existing_customer:
         raise HTTPException(status_code=400, detail="Customer with this phone already exists")
     
@@ -283,7 +444,7 @@ def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_
     return db_customer
 
 @app.get("/api/customers", response_model=List[schemas.Customer])
-def get_customers(skip: int = 0, limit: int = 100, search: Optional[str] = None, db: Session = Depends(get_db)):
+def get_customers(response: Response, cursor: Optional[str] = None, limit: int = Query(default=100, ge=1, le=500), with_total: bool = False, search: Optional[str] = None, db: Session = Depends(get_db)):
     query = db.query(Customer).filter(Customer.is_active == True)
     
     if search:
@@ -292,8 +453,27 @@ def get_customers(skip: int = 0, limit: int = 100, search: Optional[str] = None,
             (Customer.phone.ilike(f"%{search}%"))
         )
     
-    customers = query.offset(skip).limit(limit).all()
-    return customers
+    return pagination.paginate(query, [Customer.name, Customer.id], cursor, limit, response, with_total=with_total)
+
+@app.get("/api/customers/phone", response_model=List[schemas.Customer])
+def get_customers_by_phone_prefix(prefix: str = Query(..., min_length=1), limit: int = Query(default=10, ge=1, le=50), db: Session = Depends(get_db)):
+    return customers.phone_prefix_matches(db, prefix, limit)
+
+@app.get("/api/customers/phone/{phone}", response_model=schemas.Customer)
+def get_customer_by_phone(phone: str, db: Session = Depends(get_db)):
+    key = customers.normalize_phone(phone)
+    cached = cache.customer_phone_cache.get(key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    
+    generation = cache.customer_phone_cache.generation
+    customer = customers.find_by_phone(db, phone)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    content = schemas.Customer.model_validate(customer).model_dump_json().encode()
+    cache.customer_phone_cache.set(key, content, generation=generation)
+    return Response(content=content, media_type="application/json")
 
 @app.get("/api/customers/{customer_id}", response_model=schemas.Customer)
 def get_customer(customer_id: str, db: Session = Depends(get_db)):
@@ -308,9 +488,17 @@ def update_customer(customer_id: str, customer_update: schemas.CustomerUpdate, d
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    for key, value in customer_update.model_dump(exclude_unset=True).items():
+    update_data = customer_update.model_dump(exclude_unset=True)
+    old_phone = customer.phone_normalized
+    new_phone = customers.normalize_phone(update_data.get("phone"))
+    if new_phone and new_phone != old_phone:
+        if db.query(Customer).filter(Customer.phone_normalized == new_phone, Customer.id != customer.id).first():
+            raise HTTPException(status_code=400, detail="Customer with this phone already exists")
+    
+    for key, value in update_data.items():
         setattr(customer, key, value)
     
+    cache.invalidate_customer_phones(db, [old_phone, customers.normalize_phone(customer.phone)])
     db.commit()
     db.refresh(customer)
     return customer
@@ -320,121 +508,110 @@ def update_customer(customer_id: str, customer_update: schemas.CustomerUpdate, d
 def create_supplier(supplier: schemas.SupplierCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
     db_supplier = Supplier(**supplier.model_dump())
     db.add(db_supplier)
+    response_cache.invalidate(db, ["suppliers"])
     db.commit()
     db.refresh(db_supplier)
     return db_supplier
 
 @app.get("/api/suppliers", response_model=List[schemas.Supplier])
-def get_suppliers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    suppliers = db.query(Supplier).filter(Supplier.is_active == True).offset(skip).limit(limit).all()
-    return suppliers
+def get_suppliers(request: Request, cursor: Optional[str] = None, limit: int = Query(default=100, ge=1, le=500), with_total: bool = False, db: Session = Depends(get_db)):
+    def build(response: Response) -> bytes:
+        query = db.query(Supplier).filter(Supplier.is_active == True)
+        suppliers = pagination.paginate(query, [Supplier.name, Supplier.id], cursor, limit, response, with_total=with_total)
+        return response_cache.serialize(SUPPLIER_LIST, suppliers)
+    return response_cache.cached(request, ["suppliers"], build)
 
 # ============= INVOICE ROUTES =============
-@app.post("/api/invoices", response_model=schemas.Invoice)
-def create_invoice(invoice_data: schemas.InvoiceCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    # Get current active shift
-    current_shift = db.query(Shift).filter(
-        Shift.user_id == current_user.id,
-        Shift.status == ShiftStatus.OPEN
-    ).first()
-    
-    # Calculate totals
-    subtotal = Decimal("0.00")
-    tax_amount = Decimal("0.00")
-    
-    for item in invoice_data.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-        
-        if product.stock_quantity < float(item.quantity):
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product.name}")
-        
-        item_total = item.unit_price * item.quantity
-        item_tax = (item_total * item.tax_rate) / Decimal("100")
-        item_total_with_tax = item_total + item_tax - item.discount
-        
-        subtotal += item_total
-        tax_amount += item_tax
-    
-    total_amount = subtotal + tax_amount - invoice_data.discount_amount
-    change_amount = invoice_data.paid_amount - total_amount
-    
-    # Generate invoice number
-    today = datetime.now(timezone.utc)
-    invoice_count = db.query(Invoice).filter(
-        Invoice.created_at >= datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
-    ).count()
-    invoice_number = f"INV-{today.strftime('%Y%m%d')}-{invoice_count + 1:04d}"
-    
-    # Create invoice
-    db_invoice = Invoice(
-        invoice_number=invoice_number,
-        invoice_type=invoice_data.invoice_type,
-        user_id=current_user.id,
-        customer_id=invoice_data.customer_id,
-        shift_id=current_shift.id if current_shift else None,
-        subtotal=subtotal,
-        tax_amount=tax_amount,
-        discount_amount=invoice_data.discount_amount,
-        total_amount=total_amount,
-        payment_method=invoice_data.payment_method,
-        paid_amount=invoice_data.paid_amount,
-        change_amount=change_amount,
-        notes=invoice_data.notes
-    )
-    db.add(db_invoice)
-    db.flush()
+def find_invoice_by_key(db: Session, idempotency_key: Optional[str]) -> Optional[Invoice]:
+    if not idempotency_key:
+        return None
+    return db.query(Invoice).filter(Invoice.idempotency_key == idempotency_key).first()
+
+def place_invoice(db: Session, invoice_data: schemas.InvoiceCreate, user_id: str, invoice_number: Optional[str] = None) -> schemas.Invoice:
+    # invoice_number: taken by the caller beforehand for a sale the till did
+    # not number. A retried request returns the invoice the first attempt created.
+    existing = find_invoice_by_key(db, invoice_data.idempotency_key)
+    if existing:
+        return schemas.Invoice.model_validate(existing)
     
-    # Create invoice items and update inventory
-    for item in invoice_data.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        
-        item_total = item.unit_price * item.quantity
-        item_tax = (item_total * item.tax_rate) / Decimal("100")
-        item_total_price = item_total + item_tax - item.discount
-        
-        db_item = InvoiceItem(
-            invoice_id=db_invoice.id,
-            product_id=product.id,
-            product_name=product.name,
-            quantity=item.quantity,
-            unit_price=item.unit_price,
-            tax_rate=item.tax_rate,
-            discount=item.discount,
-            total_price=item_total_price
-        )
-        db.add(db_item)
-        
-        # Update inventory
-        previous_quantity = product.stock_quantity
-        product.stock_quantity -= int(float(item.quantity))
-        
-        inventory_movement = InventoryMovement(
-            product_id=product.id,
-            movement_type="sale",
-            quantity=-item.quantity,
-            previous_quantity=Decimal(str(previous_quantity)),
-            new_quantity=Decimal(str(product.stock_quantity)),
-            notes=f"Sale invoice {invoice_number}"
+    # Get current active shift
+    current_shift = checkout.load_open_shift(db, user_id)
+    
+    # A till may number the invoice from a block it reserved earlier
+    if invoice_data.invoice_number:
+        if not sequencer.is_reserved(db, invoice_data.invoice_number, user_id):
+            raise HTTPException(status_code=400, detail="Invoice number was not reserved")
+        if sequencer.is_used(db, invoice_data.invoice_number):
+            raise HTTPException(status_code=409, detail="Invoice number already used")
+    elif invoice_number:
+        invoice_data = invoice_data.model_copy(update={"invoice_number": invoice_number})
+    
+    # Lock the basket's products, validate stock and write items/movements in bulk
+    try:
+        db_invoice = checkout.create_invoice(
+            db,
+            invoice_data,
+            user_id=user_id,
+            shift_id=current_shift.id if current_shift else None
         )
-        db.add(inventory_movement)
+        db.commit()
+    except IntegrityError:
+        # A concurrent retry of the same sale got in first, or the number
+        # was taken after the check above
+        db.rollback()
+        existing = find_invoice_by_key(db, invoice_data.idempotency_key)
+        if existing:
+            return schemas.Invoice.model_validate(existing)
+        if invoice_data.invoice_number and sequencer.is_used(db, invoice_data.invoice_number):
+            raise HTTPException(status_code=409, detail="Invoice number already used")
+        raise
     
-    db.commit()
     db.refresh(db_invoice)
-    return db_invoice
+    return schemas.Invoice.model_validate(db_invoice)
 
-@app.get("/api/invoices", response_model=List[schemas.Invoice])
-def get_invoices(
-    skip: int = 0,
-    limit: int = 100,
-    invoice_type: Optional[InvoiceType] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-):
-    query = db.query(Invoice).filter(Invoice.is_void == False)
+@app.post("/api/invoices", response_model=schemas.Invoice)
+async def create_invoice(invoice_data: schemas.InvoiceCreate, db=Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    if invoice_data.invoice_number or not isinstance(db, AsyncSession):
+        return await run_db(db, place_invoice, invoice_data, current_user.id)
+    
+    # run_sync runs on the event loop, where reserving a number (a session
+    # of its own and a thread lock) would stall every request, so the
+    # number is taken on the threadpool first and handed back if the sale
+    # is turned away
+    invoice_number = await run_in_threadpool(sequencer.next_invoice_number)
+    try:
+        invoice = await run_db(db, place_invoice, invoice_data, current_user.id, invoice_number)
+    except HTTPException as error:
+        # 409: the number turned out to be taken already, so it is not reused
+        if error.status_code != 409:
+            sequencer.release(invoice_number)
+        raise
+    if invoice.invoice_number != invoice_number:
+        # A retry answered with the invoice its first attempt created
+        sequencer.release(invoice_number)
+    return invoice
+
+@app.post("/api/invoices/batch", response_model=List[schemas.InvoiceBatchResult])
+def upload_invoice_batch(batch: schemas.InvoiceBatch, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    # Drains a till's offline sale queue; see checkout.ingest_batch
+    results = checkout.ingest_batch(db, batch.sales, current_user.id)
+    db.commit()
+    return results
+
+@app.post("/api/invoices/number-blocks", response_model=schemas.InvoiceNumberBlock)
+def reserve_invoice_numbers(block_request: schemas.InvoiceNumberBlockRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    block = sequencer.reserve_block(db, current_user.id, block_request.count)
+    db.commit()
+    return {
+        "day": block.day,
+        "first": block.first_value,
+        "last": block.last_value,
+        "first_number": sequencer.format_invoice_number(block.day, block.first_value),
+        "last_number": sequencer.format_invoice_number(block.day, block.last_value)
+    }
+
+def filter_invoices(query, invoice_type: Optional[InvoiceType], start_date: Optional[str], end_date: Optional[str]):
+    query = query.filter(Invoice.is_void == False)
     
     if invoice_type:
         query = query.filter(Invoice.invoice_type == invoice_type)
@@ -447,12 +624,52 @@ def get_invoices(
         end = datetime.fromisoformat(end_date)
         query = query.filter(Invoice.created_at <= end)
     
-    invoices = query.order_by(Invoice.created_at.desc()).offset(skip).limit(limit).all()
-    return invoices
+    return query
+
+@app.get("/api/invoices", response_model=List[schemas.Invoice])
+def get_invoices(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=500),
+    with_total: bool = False,
+    invoice_type: Optional[InvoiceType] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    query = db.query(Invoice).options(
+        selectinload(Invoice.items),
+        joinedload(Invoice.user),
+        joinedload(Invoice.customer)
+    )
+    query = filter_invoices(query, invoice_type, start_date, end_date)
+    return pagination.paginate(query, [Invoice.created_at, Invoice.id], cursor, limit, response, descending=True, with_total=with_total)
+
+@app.get("/api/invoices/summary", response_model=List[schemas.InvoiceSummary])
+def get_invoice_summaries(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=500),
+    with_total: bool = False,
+    invoice_type: Optional[InvoiceType] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    # List view: cashier and customer are joined in, line items are not loaded
+    query = db.query(Invoice).options(joinedload(Invoice.user), joinedload(Invoice.customer))
+    query = filter_invoices(query, invoice_type, start_date, end_date)
+    return pagination.paginate(query, [Invoice.created_at, Invoice.id], cursor, limit, response, descending=True, with_total=with_total)
 
 @app.get("/api/invoices/{invoice_id}", response_model=schemas.Invoice)
 def get_invoice(invoice_id: str, db: Session = Depends(get_db)):
-    invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+    invoice = db.query(Invoice).options(
+        selectinload(Invoice.items),
+        joinedload(Invoice.user),
+        joinedload(Invoice.customer)
+    ).filter(Invoice.id == invoice_id).first()
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     return invoice
@@ -476,27 +693,29 @@ def open_shift(shift_data: schemas.ShiftOpen, db: Session = Depends(get_db), cur
         notes=shift_data.notes
     )
     db.add(db_shift)
+    # The unique index on open shifts turns away a concurrent second open
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="User already has an open shift")
+    stats.bump(db, stats.OPEN_SHIFTS, 1)
+    cache.invalidate_open_shifts(db, [current_user.id])
     db.commit()
     db.refresh(db_shift)
     return db_shift
 
 @app.post("/api/shifts/{shift_id}/close", response_model=schemas.Shift)
 def close_shift(shift_id: str, shift_close: schemas.ShiftClose, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    shift = db.query(Shift).filter(Shift.id == shift_id, Shift.user_id == current_user.id).first()
+    shift = db.query(Shift).filter(Shift.id == shift_id, Shift.user_id == current_user.id).with_for_update().first()
     if not shift:
         raise HTTPException(status_code=404, detail="Shift not found")
     
     if shift.status == ShiftStatus.CLOSED:
         raise HTTPException(status_code=400, detail="Shift already closed")
     
-    # Calculate expected cash
-    cash_sales = db.query(Invoice).filter(
-        Invoice.shift_id == shift_id,
-        Invoice.payment_method == PaymentMethod.CASH,
-        Invoice.is_void == False
-    ).all()
-    
-    expected_cash = shift.opening_balance + sum([sale.total_amount for sale in cash_sales])
+    # Running total kept by the shift ledger
+    expected_cash = shift_ledger.expected_cash(db, shift)
     
     shift.status = ShiftStatus.CLOSED
     shift.expected_cash = expected_cash
@@ -507,16 +726,40 @@ def close_shift(shift_id: str, shift_close: schemas.ShiftClose, db: Session = De
     if shift_close.notes:
         shift.notes = shift_close.notes
     
+    stats.bump(db, stats.OPEN_SHIFTS, -1)
+    cache.invalidate_open_shifts(db, [current_user.id])
     db.commit()
     db.refresh(shift)
     return shift
 
+@app.post("/api/shifts/{shift_id}/cash-movements", response_model=schemas.CashMovement)
+def create_cash_movement(shift_id: str, movement: schemas.CashMovementCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    shift = db.query(Shift).filter(Shift.id == shift_id, Shift.user_id == current_user.id).first()
+    if not shift:
+        raise HTTPException(status_code=404, detail="Shift not found")
+    
+    db_movement = shift_ledger.record_movement(db, shift, movement)
+    db.commit()
+    db.refresh(db_movement)
+    return db_movement
+
+@app.get("/api/shifts/{shift_id}/x-report", response_model=schemas.ShiftReport)
+def get_shift_x_report(shift_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    # Mid-shift totals straight from the ledger; nothing is closed or reset
+    query = db.query(Shift).filter(Shift.id == shift_id)
+    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        query = query.filter(Shift.user_id == current_user.id)
+    shift = query.first()
+    if not shift:
+        raise HTTPException(status_code=404, detail="Shift not found")
+    return shift_ledger.x_report(db, shift)
+
 @app.get("/api/shifts/current", response_model=schemas.Shift)
-def get_current_shift(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    shift = db.query(Shift).filter(
-        Shift.user_id == current_user.id,
-        Shift.status == ShiftStatus.OPEN
-    ).first()
+async def get_current_shift(db=Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    # Answered from the open shift cache when possible, without a query
+    shift = cache.open_shift_cache.get(current_user.id)
+    if shift is None:
+        shift = await run_db(db, checkout.load_open_shift, current_user.id)
     
     if not shift:
         raise HTTPException(status_code=404, detail="No active shift found")
@@ -524,78 +767,91 @@ def get_current_shift(db: Session = Depends(get_db), current_user: User = Depend
     return shift
 
 @app.get("/api/shifts", response_model=List[schemas.Shift])
-def get_shifts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    shifts = db.query(Shift).order_by(Shift.opened_at.desc()).offset(skip).limit(limit).all()
-    return shifts
+def get_shifts(response: Response, cursor: Optional[str] = None, limit: int = Query(default=100, ge=1, le=500), with_total: bool = False, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    return pagination.paginate(db.query(Shift), [Shift.opened_at, Shift.id], cursor, limit, response, descending=True, with_total=with_total)
 
 # ============= DASHBOARD & REPORTS =============
 @app.get("/api/dashboard/stats", response_model=schemas.DashboardStats)
-def get_dashboard_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    today = datetime.now(timezone.utc)
-    today_start = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
-    
-    # Total sales today
-    today_invoices = db.query(Invoice).filter(
-        Invoice.created_at >= today_start,
-        Invoice.invoice_type == InvoiceType.SALE,
-        Invoice.is_void == False
-    ).all()
-    
-    total_sales_today = sum([inv.total_amount for inv in today_invoices])
-    total_invoices_today = len(today_invoices)
-    
-    # Total products
-    total_products = db.query(Product).filter(Product.is_active == True).count()
-    
-    # Low stock products
-    low_stock_products = db.query(Product).filter(
-        Product.is_active == True,
-        Product.stock_quantity <= Product.min_stock_level
-    ).count()
-    
-    # Active shifts
-    active_shifts = db.query(Shift).filter(Shift.status == ShiftStatus.OPEN).count()
-    
-    return {
-        "total_sales_today": total_sales_today,
-        "total_invoices_today": total_invoices_today,
-        "total_products": total_products,
-        "low_stock_products": low_stock_products,
-        "active_shifts": active_shifts
-    }
+async def get_dashboard_stats(db=Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    # Running counters maintained by checkout, product and shift routes
+    return await run_db(db, stats.dashboard_stats)
+
+@app.post("/api/dashboard/stream-token")
+async def get_dashboard_stream_token(current_user: User = Depends(get_current_active_user)):
+    # EventSource cannot send the Authorization header; see auth.create_stream_token
+    return {"token": create_stream_token(current_user)}
+
+@app.get("/api/dashboard/stream")
+async def stream_dashboard_stats(request: Request, current_user: User = Depends(get_stream_user)):
+    return StreamingResponse(
+        stats.event_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.post("/api/dashboard/stats/rebuild", response_model=schemas.DashboardStats)
+def rebuild_dashboard_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    stats.rebuild(db)
+    return stats.dashboard_stats(db)
 
 @app.get("/api/reports/sales")
 def get_sales_report(
     start_date: str,
     end_date: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_report_db),
     current_user: User = Depends(get_current_active_user)
 ):
     start = datetime.fromisoformat(start_date)
     end = datetime.fromisoformat(end_date)
     
-    invoices = db.query(Invoice).filter(
-        Invoice.created_at >= start,
-        Invoice.created_at <= end,
-        Invoice.invoice_type == InvoiceType.SALE,
-        Invoice.is_void == False
-    ).all()
-    
-    total_sales = sum([inv.total_amount for inv in invoices])
-    cash_sales = sum([inv.total_amount for inv in invoices if inv.payment_method == PaymentMethod.CASH])
-    card_sales = sum([inv.total_amount for inv in invoices if inv.payment_method == PaymentMethod.CARD])
-    electronic_sales = sum([inv.total_amount for inv in invoices if inv.payment_method == PaymentMethod.ELECTRONIC])
-    
+    totals = reports.sales_totals(db, start, end)
     return {
         "start_date": start_date,
         "end_date": end_date,
-        "total_sales": total_sales,
-        "total_invoices": len(invoices),
-        "cash_sales": cash_sales,
-        "card_sales": card_sales,
-        "electronic_sales": electronic_sales
+        **totals
     }
 
+@app.get("/api/reports/sales/buckets", response_model=List[schemas.SalesReport])
+def get_sales_report_buckets(
+    start_date: str,
+    end_date: str,
+    bucket: str = Query(default="day", pattern="^(hour|day|week|month)$"),
+    group_by: Optional[str] = Query(default=None, pattern="^(cashier|shift)$"),
+    db: Session = Depends(get_report_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    start = datetime.fromisoformat(start_date)
+    end = datetime.fromisoformat(end_date)
+    return reports.sales_by_bucket(db, start, end, bucket, group_by)
+
+@app.post("/api/reports/rollups/refresh")
+def refresh_rollups(current_user: User = Depends(get_current_active_user)):
+    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    rolled = rollups.refresh()
+    return {"rolled_days": [day.isoformat() for day in rolled]}
+
+@app.get("/api/reports/products/sales", response_model=List[schemas.ProductSalesReport])
+def get_product_sales_report(
+    start_date: str,
+    end_date: str,
+    response: Response,
+    category_id: Optional[str] = None,
+    sort_by: str = Query(default="revenue", pattern="^(quantity|revenue|profit)$"),
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_report_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    start = datetime.fromisoformat(start_date)
+    end = datetime.fromisoformat(end_date)
+    items, next_cursor = reports.product_sales(db, start, end, category_id, sort_by, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
 @app.get("/api/reports/products/low-stock", response_model=List[schemas.Product])
 def get_low_stock_products(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
     products = db.query(Product).filter(
@@ -606,19 +862,51 @@ def get_low_stock_products(db: Session = Depends(get_db), current_user: User = D
 
 @app.get("/api/inventory/movements", response_model=List[schemas.InventoryMovement])
 def get_inventory_movements(
+    response: Response,
     product_id: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=500),
+    with_total: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    query = db.query(InventoryMovement)
-    
-    if product_id:
-        query = query.filter(InventoryMovement.product_id == product_id)
+    # Includes months moved to the archive tables
+    movements = inventory_ledger.movement_history(db, product_id)
+    query = db.query(movements)
+    return pagination.paginate(query, [movements.c.created_at, movements.c.id], cursor, limit, response, descending=True, with_total=with_total)
+
+@app.post("/api/inventory/receipts", response_model=schemas.StockReceiptResult)
+def receive_stock(receipt: schemas.StockReceipt, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    # Deliveries, stock counts and write-offs in one transaction; see receiving.py
+    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    movements = query.order_by(InventoryMovement.created_at.desc()).offset(skip).limit(limit).all()
-    return movements
+    result = receiving.apply_receipt(db, receipt, current_user.id)
+    db.commit()
+    return result
+
+@app.get("/api/inventory/stock-at", response_model=schemas.StockAt)
+def get_stock_at(product_id: str, at: datetime, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    # Stock of a product at a past moment, from the nearest daily snapshot
+    product = db.query(Product).filter(Product.id == product_id).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"product_id": product.id, "at": at, "quantity": inventory_ledger.stock_at(db, product, at)}
+
+@app.get("/api/metrics")
+def get_metrics(current_user: User = Depends(get_current_active_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {
+        "barcode_cache": cache.barcode_cache.stats(),
+        "customer_phone_cache": cache.customer_phone_cache.stats(),
+        "response_cache": response_cache.response_cache.stats(),
+        "principal_cache": cache.principal_cache.stats(),
+        "open_shift_cache": cache.open_shift_cache.stats(),
+        "password_hashing": passwords.stats(),
+        "audit_log": audit.stats(),
+        "db_pool": pool_stats()
+    }
 
 @app.get("/api/health")
 def health_check():
@@ -0,0 +1,180 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Shift, ShiftTotal, CashRegister, Invoice, Payment, InvoiceType, PaymentMethod, ShiftStatus
+import schemas
+
+# Running totals per shift, one shift_totals row per entry: each payment
+# method's takings, each kind of cash_register movement, and DRAWER, the net
+# cash the drawer should hold on top of the opening balance. Checkout and the
+# cash movement route add their deltas with one upsert in the same
+# transaction as the sale or movement, so closing a shift reads a single row
+# and the X-report reads a handful, whatever the shift's length. Every cash
+# change is also journalled in cash_register.
+DRAWER = "drawer"
+MOVEMENT_SIGNS = {"deposit": 1, "expense": -1, "withdrawal": -1}
+
+# Money leaves the drawer for returns and purchases
+INVOICE_SIGNS = {InvoiceType.SALE: 1, InvoiceType.RETURN: -1, InvoiceType.PURCHASE: -1}
+
+def _add(db: Session, shift_id: str, deltas: Dict[str, Tuple[Decimal, int]]):
+    rows = [
+        {"shift_id": shift_id, "entry": entry, "amount": amount, "count": count}
+        for entry, (amount, count) in deltas.items()
+        if amount or count
+    ]
+    if not rows:
+        return
+    stmt = dialect_insert(db)(ShiftTotal).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ShiftTotal.shift_id, ShiftTotal.entry],
+        set_={
+            "amount": ShiftTotal.amount + stmt.excluded.amount,
+            "count": ShiftTotal.count + stmt.excluded.count
+        }
+    )
+    db.execute(stmt)
+
+def split_payments(
+    payment_method: PaymentMethod,
+    total_amount: Decimal,
+    change_amount: Decimal,
+    payments: List[Tuple[PaymentMethod, Decimal]]
+) -> Dict[PaymentMethod, Decimal]:
+    # What each payment method actually took for an invoice. Change is given
+    # in cash, so it comes off the cash part of a mixed payment; a mixed
+    # payment without its parts stays under MIXED.
+    if payment_method != PaymentMethod.MIXED:
+        return {payment_method: total_amount}
+    if not payments:
+        return {PaymentMethod.MIXED: total_amount}
+    parts = defaultdict(Decimal)
+    for method, amount in payments:
+        parts[method] += amount
+    if change_amount > 0:
+        parts[PaymentMethod.CASH] -= change_amount
+    return dict(parts)
+
+def validate_payments(invoice_data: schemas.InvoiceCreate, change_amount: Decimal):
+    if not invoice_data.payments:
+        return
+    if invoice_data.payment_method != PaymentMethod.MIXED:
+        raise HTTPException(status_code=400, detail="Payment parts are only accepted for mixed payments")
+    if any(payment.payment_method == PaymentMethod.MIXED for payment in invoice_data.payments):
+        raise HTTPException(status_code=400, detail="A payment part cannot be mixed")
+    if sum(payment.amount for payment in invoice_data.payments) != invoice_data.paid_amount:
+        raise HTTPException(status_code=400, detail="Payment parts must add up to the paid amount")
+    cash = sum(payment.amount for payment in invoice_data.payments if payment.payment_method == PaymentMethod.CASH)
+    if change_amount > cash:
+        raise HTTPException(status_code=400, detail="Change cannot exceed the cash paid")
+
+def record_invoice(db: Session, invoice: Invoice, payments: List[schemas.PaymentCreate]):
+    if not invoice.shift_id:
+        return
+    parts = split_payments(
+        invoice.payment_method,
+        invoice.total_amount,
+        invoice.change_amount,
+        [(payment.payment_method, payment.amount) for payment in payments]
+    )
+
+    sign = INVOICE_SIGNS[invoice.invoice_type]
+    deltas = {method.value: (sign * amount, 1) for method, amount in parts.items()}
+    cash = sign * parts.get(PaymentMethod.CASH, Decimal("0"))
+    if cash:
+        deltas[DRAWER] = (cash, 0)
+        db.execute(insert(CashRegister), [{
+            "shift_id": invoice.shift_id,
+            "transaction_type": invoice.invoice_type.value,
+            "amount": cash,
+            "description": f"Invoice {invoice.invoice_number}",
+            "created_at": invoice.created_at
+        }])
+    _add(db, invoice.shift_id, deltas)
+
+def record_movement(db: Session, shift: Shift, movement: schemas.CashMovementCreate) -> CashRegister:
+    if shift.status != ShiftStatus.OPEN:
+        raise HTTPException(status_code=400, detail="Shift already closed")
+    signed = MOVEMENT_SIGNS[movement.transaction_type] * movement.amount
+    db_movement = CashRegister(
+        shift_id=shift.id,
+        transaction_type=movement.transaction_type,
+        amount=signed,
+        description=movement.description
+    )
+    db.add(db_movement)
+    _add(db, shift.id, {movement.transaction_type: (signed, 1), DRAWER: (signed, 0)})
+    return db_movement
+
+def drawer_total(db: Session, shift_id: str) -> Decimal:
+    amount = db.query(ShiftTotal.amount).filter(ShiftTotal.shift_id == shift_id, ShiftTotal.entry == DRAWER).scalar()
+    return amount if amount is not None else Decimal("0.00")
+
+def expected_cash(db: Session, shift: Shift) -> Decimal:
+    return shift.opening_balance + drawer_total(db, shift.id)
+
+def x_report(db: Session, shift: Shift) -> schemas.ShiftReport:
+    totals = {
+        entry: (amount, count)
+        for entry, amount, count in db.query(ShiftTotal.entry, ShiftTotal.amount, ShiftTotal.count)
+        .filter(ShiftTotal.shift_id == shift.id)
+    }
+    drawer = totals.pop(DRAWER, (Decimal("0.00"), 0))[0]
+    return schemas.ShiftReport(
+        shift_id=shift.id,
+        status=shift.status,
+        opening_balance=shift.opening_balance,
+        payments=[
+            schemas.ShiftTotal(entry=method.value, amount=totals[method.value][0], count=totals[method.value][1])
+            for method in PaymentMethod if method.value in totals
+        ],
+        cash_movements=[
+            schemas.ShiftTotal(entry=kind, amount=totals[kind][0], count=totals[kind][1])
+            for kind in MOVEMENT_SIGNS if kind in totals
+        ],
+        expected_cash=shift.opening_balance + drawer,
+        opened_at=shift.opened_at,
+        closed_at=shift.closed_at
+    )
+
+def _rebuild(db: Session, shift: Shift):
+    deltas = defaultdict(lambda: [Decimal("0"), 0])
+    invoices = db.query(Invoice).filter(Invoice.shift_id == shift.id, Invoice.is_void == False).all()
+    parts_by_invoice = defaultdict(list)
+    for invoice_id, method, amount in db.query(Payment.invoice_id, Payment.payment_method, Payment.amount).filter(
+        Payment.invoice_id.in_([invoice.id for invoice in invoices])
+    ):
+        parts_by_invoice[invoice_id].append((method, amount))
+    for invoice in invoices:
+        sign = INVOICE_SIGNS[invoice.invoice_type]
+        parts = split_payments(invoice.payment_method, invoice.total_amount, invoice.change_amount, parts_by_invoice[invoice.id])
+        for method, amount in parts.items():
+            deltas[method.value][0] += sign * amount
+            deltas[method.value][1] += 1
+        deltas[DRAWER][0] += sign * parts.get(PaymentMethod.CASH, Decimal("0"))
+    for kind, amount in db.query(CashRegister.transaction_type, CashRegister.amount).filter(
+        CashRegister.shift_id == shift.id,
+        CashRegister.transaction_type.in_(MOVEMENT_SIGNS)
+    ):
+        signed = MOVEMENT_SIGNS[kind] * abs(amount)
+        deltas[kind][0] += signed
+        deltas[kind][1] += 1
+        deltas[DRAWER][0] += signed
+    _add(db, shift.id, {entry: tuple(value) for entry, value in deltas.items()})
+
+def backfill(db: Session):
+    # Shifts left open by a version without the ledger get their totals
+    # from their invoices and cash movements once
+    shifts = db.query(Shift).filter(
+        Shift.status == ShiftStatus.OPEN,
+        ~Shift.id.in_(db.query(ShiftTotal.shift_id))
+    ).all()
+    for shift in shifts:
+        _rebuild(db, shift)
+    db.commit()
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import random
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, dialect_insert
+from models import Product, Invoice, Shift, StatCounter, InvoiceType, ShiftStatus
+import notify
+
+# Running dashboard counters. Every writer adds its delta to one of
+# STAT_COUNTER_SHARDS rows chosen at random, so concurrent checkouts rarely
+# wait on the same row lock; readers sum the handful of shards per key.
+STAT_COUNTER_SHARDS = int(os.getenv("STAT_COUNTER_SHARDS", "8"))
+BASELINE_SHARD = -1
+
+STREAM_POLL_SECONDS = float(os.getenv("DASHBOARD_STREAM_POLL_SECONDS", "1"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("DASHBOARD_STREAM_HEARTBEAT_SECONDS", "30"))
+
+ACTIVE_PRODUCTS = "active_products"
+LOW_STOCK_PRODUCTS = "low_stock_products"
+OPEN_SHIFTS = "open_shifts"
+
+# Bumped whenever any worker commits a counter change; the SSE stream polls it
+_version = 0
+
+def _on_change(keys):
+    global _version
+    _version += 1
+
+notify.subscribe("dashboard", _on_change)
+
+def day_key(now: Optional[datetime] = None) -> str:
+    return (now or datetime.now(timezone.utc)).strftime("%Y%m%d")
+
+def sales_total_key(day: str) -> str:
+    return f"sales_total:{day}"
+
+def invoice_count_key(day: str) -> str:
+    return f"invoice_count:{day}"
+
+def bump(db: Session, key: str, delta):
+    if not delta:
+        return
+    stmt = dialect_insert(db)(StatCounter).values(key=key, shard=random.randrange(STAT_COUNTER_SHARDS), value=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StatCounter.key, StatCounter.shard],
+        set_={"value": StatCounter.value + delta}
+    )
+    db.execute(stmt)
+    notify.publish(db, "dashboard")
+
+def product_flags(product: Product) -> Tuple[bool, bool]:
+    active = bool(product.is_active)
+    low_stock = active and (product.stock_quantity or 0) <= (product.min_stock_level or 0)
+    return active, low_stock
+
+def track_product(db: Session, before: Optional[Tuple[bool, bool]], product: Product):
+    # before is product_flags() taken prior to the change, None for new products
+    before = before or (False, False)
+    after = product_flags(product)
+    bump(db, ACTIVE_PRODUCTS, int(after[0]) - int(before[0]))
+    bump(db, LOW_STOCK_PRODUCTS, int(after[1]) - int(before[1]))
+
+def record_sale(db: Session, invoice: Invoice):
+    if invoice.invoice_type != InvoiceType.SALE:
+        return
+    # Counted on the day of the sale: offline sales can arrive days later
+    created_at = invoice.created_at
+    if created_at is not None and created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    day = day_key(created_at)
+    bump(db, sales_total_key(day), invoice.total_amount)
+    bump(db, invoice_count_key(day), 1)
+
+def _exact_values(db: Session, day: str) -> dict:
+    today = datetime.strptime(day, "%Y%m%d").replace(tzinfo=timezone.utc)
+    sales_total, invoice_count = db.query(
+        func.coalesce(func.sum(Invoice.total_amount), 0),
+        func.count(Invoice.id)
+    ).filter(
+        Invoice.created_at >= today,
+        Invoice.invoice_type == InvoiceType.SALE,
+        Invoice.is_void == False
+    ).one()
+    return {
+        sales_total_key(day): sales_total,
+        invoice_count_key(day): invoice_count,
+        ACTIVE_PRODUCTS: db.query(Product).filter(Product.is_active == True).count(),
+        LOW_STOCK_PRODUCTS: db.query(Product).filter(
+            Product.is_active == True,
+            Product.stock_quantity <= Product.min_stock_level
+        ).count(),
+        OPEN_SHIFTS: db.query(Shift).filter(Shift.status == ShiftStatus.OPEN).count(),
+    }
+
+def ensure_seeded(db: Session):
+    # First start against an existing database: store exact counts as the
+    # baseline shard. ON CONFLICT DO NOTHING makes concurrent workers safe.
+    if db.query(StatCounter).filter(StatCounter.key == ACTIVE_PRODUCTS).first():
+        return
+    insert = dialect_insert(db)
+    for key, value in _exact_values(db, day_key()).items():
+        db.execute(insert(StatCounter).values(key=key, shard=BASELINE_SHARD, value=value).on_conflict_do_nothing())
+    db.commit()
+
+def rebuild(db: Session):
+    day = day_key()
+    values = _exact_values(db, day)
+    db.query(StatCounter).filter(StatCounter.key.in_(list(values))).delete(synchronize_session=False)
+    for key, value in values.items():
+        db.add(StatCounter(key=key, shard=BASELINE_SHARD, value=value))
+    notify.publish(db, "dashboard")
+    db.commit()
+
+def dashboard_stats(db: Session) -> dict:
+    day = day_key()
+    keys = [sales_total_key(day), invoice_count_key(day), ACTIVE_PRODUCTS, LOW_STOCK_PRODUCTS, OPEN_SHIFTS]
+    totals = dict(
+        db.query(StatCounter.key, func.sum(StatCounter.value))
+        .filter(StatCounter.key.in_(keys))
+        .group_by(StatCounter.key)
+        .all()
+    )
+    return {
+        "total_sales_today": Decimal(totals.get(keys[0]) or 0),
+        "total_invoices_today": int(totals.get(keys[1]) or 0),
+        "total_products": int(totals.get(ACTIVE_PRODUCTS) or 0),
+        "low_stock_products": int(totals.get(LOW_STOCK_PRODUCTS) or 0),
+        "active_shifts": int(totals.get(OPEN_SHIFTS) or 0)
+    }
+
+def _read_stats() -> dict:
+    db = SessionLocal()
+    try:
+        return dashboard_stats(db)
+    finally:
+        db.close()
+
+async def event_stream(request):
+    # Server-sent events: push the counters whenever a worker commits a
+    # change, and at least every heartbeat so the day rollover shows up
+    loop = asyncio.get_running_loop()
+    seen_version = None
+    last_sent = 0.0
+    while not await request.is_disconnected():
+        now = loop.time()
+        if seen_version != _version or now - last_sent >= STREAM_HEARTBEAT_SECONDS:
+            seen_version = _version
+            last_sent = now
+            data = await run_in_threadpool(_read_stats)
+            yield f"data: {json.dumps(data, default=str)}\n\n"
+        await asyncio.sleep(STREAM_POLL_SECONDS)
@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+import uuid
+from decimal import Decimal
+
+import pytest
+
+# The app reads its configuration at import time: point it at a throwaway
+# SQLite database and keep the background workers and bcrypt out of the way
+_db_dir = tempfile.mkdtemp(prefix="supermarket-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("DB_ASYNC", "false")
+os.environ["PASSWORD_HASH_WORKERS"] = "0"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["ROLLUP_INTERVAL_SECONDS"] = "0"
+os.environ["INVENTORY_SNAPSHOT_INTERVAL_SECONDS"] = "0"
+os.environ["INVOICE_NUMBER_BLOCK_SIZE"] = "1"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from database import SessionLocal  # noqa: E402
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+def login(client, username: str, password: str) -> dict:
+    response = client.post("/api/auth/login", json={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture(scope="session")
+def admin(client):
+    return login(client, "admin", "admin123")
+
+@pytest.fixture
+def make_user(client, admin):
+    def make(role: str = "cashier") -> dict:
+        username = f"user-{uuid.uuid4().hex[:8]}"
+        response = client.post("/api/users", json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "full_name": username,
+            "role": role,
+            "password": "secret123"
+        }, headers=admin)
+        assert response.status_code == 200, response.text
+        return login(client, username, "secret123")
+    return make
+
+@pytest.fixture
+def cashier(client, make_user):
+    # A fresh user with an open shift
+    headers = make_user()
+    response = client.post("/api/shifts/open", json={"opening_balance": "100"}, headers=headers)
+    assert response.status_code == 200, response.text
+    return headers
+
+@pytest.fixture
+def make_product(client, admin):
+    def make(stock: int = 10, price: str = "2.50", cost: str = "1.00", **fields) -> dict:
+        response = client.post("/api/products", json={
+            "barcode": uuid.uuid4().hex[:12],
+            "name": f"Product {uuid.uuid4().hex[:6]}",
+            "selling_price": price,
+            "cost_price": cost,
+            "stock_quantity": stock,
+            **fields
+        }, headers=admin)
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make
+
+def sale(product: dict, quantity=1, **fields) -> dict:
+    return {
+        "payment_method": "cash",
+        "paid_amount": "1000",
+        "items": [{"product_id": product["id"], "quantity": str(quantity), "unit_price": product["selling_price"]}],
+        **fields
+    }
+
+def stock_of(client, product: dict) -> int:
+    return client.get(f"/api/products/{product['id']}").json()["stock_quantity"]
+
+def money(value) -> Decimal:
+    return Decimal(str(value)).quantize(Decimal("0.01"))
@@ -0,0 +1,37 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.mark.skipif(database.DB_ASYNC, reason="already running with DB_ASYNC=true")
+def test_suite_passes_in_async_mode():
+    # DB_ASYNC is read at import time, so the async run needs a process of
+    # its own (and its own database, set up again by conftest.py)
+    pytest.importorskip("aiosqlite")
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", TESTS_DIR],
+        cwd=os.path.dirname(TESTS_DIR),
+        env={**os.environ, "DB_ASYNC": "true"},
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, result.stdout[-4000:]
+
+@pytest.mark.skipif(not database.DB_ASYNC, reason="needs DB_ASYNC=true")
+def test_async_routes_get_an_async_session():
+    async def check():
+        dependency = database.get_async_db()
+        db = await dependency.__anext__()
+        assert isinstance(db, AsyncSession)
+        assert await database.run_db(db, lambda session: session.bind.dialect.name) == "sqlite"
+        with pytest.raises(StopAsyncIteration):
+            await dependency.__anext__()
+    asyncio.run(check())
+    assert "async" in database.pool_stats()
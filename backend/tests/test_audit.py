@@ -0,0 +1,52 @@
+import queue
+import time
+import uuid
+
+import audit
+from conftest import login
+from models import AuditLog
+
+def test_login_is_written_in_the_background(client, admin, db):
+    username = f"audit-{uuid.uuid4().hex[:8]}"
+    user = client.post("/api/users", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "full_name": username,
+        "role": "cashier",
+        "password": "secret123"
+    }, headers=admin).json()
+    login(client, username, "secret123")
+
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if db.query(AuditLog).filter(AuditLog.user_id == user["id"], AuditLog.action == "login").count():
+            break
+        db.rollback()
+        time.sleep(0.05)
+    else:
+        raise AssertionError("login was never written to audit_logs")
+
+def test_failing_batch_is_written_row_by_row(monkeypatch):
+    inserted = []
+    def insert(rows):
+        if len(rows) > 1 or rows[0]["details"] == "bad":
+            raise ValueError("insert failed")
+        inserted.extend(rows)
+    monkeypatch.setattr(audit, "_insert", insert)
+    before = audit.stats()
+
+    audit._write([{"details": "first"}, {"details": "bad"}, {"details": "last"}])
+    after = audit.stats()
+    assert [row["details"] for row in inserted] == ["first", "last"]
+    assert after["written"] - before["written"] == 2
+    assert after["failed"] - before["failed"] == 1
+    assert after["flushes"] - before["flushes"] == 1
+
+def test_events_are_dropped_when_the_queue_is_full(monkeypatch):
+    class FullQueue(queue.Queue):
+        def put_nowait(self, item):
+            raise queue.Full
+    monkeypatch.setattr(audit, "_queue", FullQueue())
+    dropped = audit.stats()["dropped"]
+    audit.record("user-id", "login", "auth")
+    assert audit.stats()["dropped"] == dropped + 1
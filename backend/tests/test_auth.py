@@ -0,0 +1,62 @@
+import uuid
+from datetime import timedelta
+
+import cache
+from auth import create_access_token
+from conftest import login
+
+def new_user(client, admin, role: str = "cashier"):
+    username = f"auth-{uuid.uuid4().hex[:8]}"
+    user = client.post("/api/users", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "full_name": username,
+        "role": role,
+        "password": "secret123"
+    }, headers=admin).json()
+    return user, username, login(client, username, "secret123")
+
+def me(client, headers) -> int:
+    return client.get("/api/auth/me", headers=headers).status_code
+
+def test_profile_changes_keep_tokens_valid(client, admin):
+    user, _, headers = new_user(client, admin)
+    client.put(f"/api/users/{user['id']}", json={"full_name": "New Name"}, headers=admin)
+    assert me(client, headers) == 200
+
+def test_role_change_revokes_tokens(client, admin):
+    user, username, headers = new_user(client, admin)
+    client.put(f"/api/users/{user['id']}", json={"role": "manager"}, headers=admin)
+    assert me(client, headers) == 401
+    assert me(client, login(client, username, "secret123")) == 200
+
+def test_password_change_revokes_tokens(client, admin):
+    user, username, headers = new_user(client, admin)
+    client.put(f"/api/users/{user['id']}", json={"password": "changed456"}, headers=admin)
+    assert me(client, headers) == 401
+    assert client.post("/api/auth/login", json={"username": username, "password": "secret123"}).status_code == 401
+    assert me(client, login(client, username, "changed456")) == 200
+
+def test_deactivation_revokes_tokens(client, admin):
+    user, username, headers = new_user(client, admin)
+    client.put(f"/api/users/{user['id']}", json={"is_active": False}, headers=admin)
+    assert me(client, headers) == 401
+    assert client.post("/api/auth/login", json={"username": username, "password": "secret123"}).status_code == 400
+
+def test_token_version_is_served_from_cache(client, admin):
+    _, _, headers = new_user(client, admin)
+    me(client, headers)
+    hits = cache.principal_cache.hits
+    assert me(client, headers) == 200
+    assert cache.principal_cache.hits > hits
+
+def test_tokens_without_claims_still_work(client, admin):
+    _, username, _ = new_user(client, admin)
+    legacy = create_access_token(data={"sub": username})
+    assert me(client, {"Authorization": f"Bearer {legacy}"}) == 200
+
+def test_bad_tokens_are_rejected(client, admin):
+    _, username, _ = new_user(client, admin)
+    expired = create_access_token(data={"sub": username}, expires_delta=timedelta(seconds=-1))
+    assert me(client, {"Authorization": f"Bearer {expired}"}) == 401
+    assert me(client, {"Authorization": "Bearer not-a-token"}) == 401
@@ -0,0 +1,37 @@
+import uuid
+
+import cache
+from conftest import sale
+
+def lookup(client, product: dict) -> dict:
+    response = client.get(f"/api/products/barcode/{product['barcode']}")
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_repeated_lookup_is_served_from_cache(client, make_product):
+    product = make_product()
+    lookup(client, product)
+    hits = cache.barcode_cache.hits
+    assert lookup(client, product)["id"] == product["id"]
+    assert cache.barcode_cache.hits == hits + 1
+
+def test_unknown_barcode_is_not_found(client):
+    assert client.get("/api/products/barcode/no-such-barcode").status_code == 404
+
+def test_product_update_and_sale_invalidate_the_lookup(client, admin, cashier, make_product):
+    product = make_product(stock=10)
+    lookup(client, product)
+    client.put(f"/api/products/{product['id']}", json={"selling_price": "3.75"}, headers=admin)
+    assert lookup(client, product)["selling_price"] == "3.75"
+    client.post("/api/invoices", json=sale(product, 4), headers=cashier)
+    assert lookup(client, product)["stock_quantity"] == 6
+
+def test_category_changes_invalidate_the_lookup(client, admin, make_product):
+    category = client.post("/api/categories", json={"name": f"Dairy {uuid.uuid4().hex[:6]}"}, headers=admin).json()
+    product = make_product(category_id=category["id"])
+    assert lookup(client, product)["category"]["name"] == category["name"]
+
+    client.put(f"/api/categories/{category['id']}", json={"name": "Dairy & Eggs"}, headers=admin)
+    assert lookup(client, product)["category"]["name"] == "Dairy & Eggs"
+    client.delete(f"/api/categories/{category['id']}", headers=admin)
+    assert lookup(client, product)["category"]["is_active"] is False
@@ -0,0 +1,62 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from conftest import sale, stock_of
+
+def offline_sale(product: dict, quantity=1, **fields) -> dict:
+    return sale(product, quantity, idempotency_key=str(uuid.uuid4()), **fields)
+
+def test_failing_sale_does_not_affect_the_batch(client, cashier, make_product):
+    product = make_product(stock=5)
+    first = offline_sale(product, 2)
+    too_many = offline_sale(product, 50)
+    sales = [first, too_many, offline_sale(product, 1), first]
+
+    response = client.post("/api/invoices/batch", json={"sales": sales}, headers=cashier)
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["status"] for result in results] == ["created", "error", "created", "duplicate"]
+    assert results[1]["invoice_id"] is None
+    assert results[3]["invoice_id"] == results[0]["invoice_id"]
+    assert stock_of(client, product) == 2
+
+def test_reuploaded_batch_is_reported_as_duplicates(client, cashier, make_product):
+    product = make_product()
+    sales = [offline_sale(product), offline_sale(product)]
+    first = client.post("/api/invoices/batch", json={"sales": sales}, headers=cashier).json()
+    again = client.post("/api/invoices/batch", json={"sales": sales}, headers=cashier).json()
+    assert [result["status"] for result in again] == ["duplicate", "duplicate"]
+    assert [result["invoice_id"] for result in again] == [result["invoice_id"] for result in first]
+    assert stock_of(client, product) == 8
+
+def test_sale_is_dated_when_it_was_made(client, cashier, make_product):
+    made_at = datetime.now(timezone.utc) - timedelta(days=3)
+    body = offline_sale(make_product(), created_at=made_at.isoformat())
+    result = client.post("/api/invoices/batch", json={"sales": [body]}, headers=cashier).json()[0]
+    invoice = client.get(f"/api/invoices/{result['invoice_id']}", headers=cashier).json()
+    assert invoice["created_at"].startswith(made_at.strftime("%Y-%m-%d"))
+
+def test_sale_in_closed_shift_is_rejected(client, make_user, make_product):
+    user = make_user()
+    product = make_product()
+    shift = client.post("/api/shifts/open", json={"opening_balance": "0"}, headers=user).json()
+    closed = client.post(f"/api/shifts/{shift['id']}/close", json={"actual_cash": "0"}, headers=user)
+    assert closed.status_code == 200
+
+    body = offline_sale(product, shift_id=shift["id"])
+    result = client.post("/api/invoices/batch", json={"sales": [body]}, headers=user).json()[0]
+    assert result["status"] == "error"
+    assert result["error"] == "Shift already closed"
+    assert stock_of(client, product) == 10
+
+def test_sale_is_booked_into_its_own_shift(client, cashier, make_user, make_product):
+    shift = client.get("/api/shifts/current", headers=cashier).json()
+    other = make_user()
+    other_shift = client.post("/api/shifts/open", json={"opening_balance": "0"}, headers=other).json()
+    sales = [offline_sale(make_product(), shift_id=shift["id"]), offline_sale(make_product(), shift_id=other_shift["id"])]
+    results = client.post("/api/invoices/batch", json={"sales": sales}, headers=cashier).json()
+
+    # Another user's shift is never taken; that sale goes to the open one
+    for result in results:
+        invoice = client.get(f"/api/invoices/{result['invoice_id']}", headers=cashier).json()
+        assert invoice["shift_id"] == shift["id"]
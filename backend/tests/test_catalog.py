@@ -0,0 +1,67 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+import catalog
+
+def pull(client, headers, cursor=None, limit=1000) -> dict:
+    params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+    response = client.get("/api/products/sync", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def pull_all(client, headers, cursor=None, limit=1000):
+    # (rows as dicts by id, cursor to resume from)
+    rows = {}
+    while True:
+        page = pull(client, headers, cursor, limit)
+        rows.update((row[0], dict(zip(page["columns"], row))) for row in page["rows"])
+        cursor = page["cursor"] or cursor
+        if not page["has_more"]:
+            return rows, cursor
+
+@pytest.fixture
+def no_safety_window(monkeypatch):
+    monkeypatch.setattr(catalog, "SYNC_SAFETY_WINDOW", timedelta(0))
+
+def test_pages_cover_the_whole_catalog(client, admin, make_product, no_safety_window):
+    products = [make_product() for _ in range(3)]
+    rows, _ = pull_all(client, admin, limit=2)
+    assert {product["id"] for product in products} <= set(rows)
+
+def test_delta_pull_returns_only_changes(client, admin, make_product, no_safety_window):
+    kept, changed, removed = make_product(), make_product(), make_product()
+    _, cursor = pull_all(client, admin)
+
+    client.put(f"/api/products/{changed['id']}", json={"selling_price": "9.99"}, headers=admin)
+    client.delete(f"/api/products/{removed['id']}", headers=admin)
+    added = make_product()
+    rows, _ = pull_all(client, admin, cursor)
+    assert kept["id"] not in rows
+    assert rows[changed["id"]]["selling_price"] == "9.99"
+    assert rows[removed["id"]]["is_active"] is False
+    assert added["id"] in rows
+
+def test_recent_changes_are_sent_again(client, admin, make_product):
+    # Rows inside the safety window stay ahead of the cursor
+    product = make_product()
+    _, cursor = pull_all(client, admin)
+    rows, _ = pull_all(client, admin, cursor)
+    assert product["id"] in rows
+
+def test_invalid_cursor_is_rejected(client, admin):
+    assert client.get("/api/products/sync", params={"cursor": "not-a-cursor"}, headers=admin).status_code == 400
+
+def test_export_streams_gzip_ndjson(client, admin, make_product):
+    category = client.post("/api/categories", json={"name": "Exported"}, headers=admin).json()
+    product = make_product(category_id=category["id"])
+    response = client.get("/api/products/export", headers=admin)
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert catalog.decode_cursor(response.headers["x-sync-cursor"])
+
+    # The client undoes the gzip encoding
+    rows = {row["id"]: row for row in map(json.loads, response.text.splitlines())}
+    assert rows[product["id"]]["category_name"] == "Exported"
+    assert rows[product["id"]]["barcode"] == product["barcode"]
@@ -0,0 +1,41 @@
+from conftest import money, sale, stock_of
+
+def test_sale_takes_stock_and_totals_the_basket(client, cashier, make_product):
+    bread = make_product(stock=10, price="1.00")
+    milk = make_product(stock=10, price="2.50")
+    response = client.post("/api/invoices", json={
+        "payment_method": "cash",
+        "paid_amount": "20",
+        "discount_amount": "0.50",
+        "items": [
+            {"product_id": bread["id"], "quantity": "3", "unit_price": "1.00"},
+            {"product_id": milk["id"], "quantity": "2", "unit_price": "2.50", "tax_rate": "10", "discount": "0.25"}
+        ]
+    }, headers=cashier)
+    assert response.status_code == 200, response.text
+    invoice = response.json()
+    assert money(invoice["subtotal"]) == money("8.00")
+    assert money(invoice["tax_amount"]) == money("0.50")
+    assert money(invoice["total_amount"]) == money("8.00")
+    assert money(invoice["change_amount"]) == money("12.00")
+    assert len(invoice["items"]) == 2
+    assert (stock_of(client, bread), stock_of(client, milk)) == (7, 8)
+
+def test_stock_is_checked_across_lines_of_the_same_product(client, cashier, make_product):
+    product = make_product(stock=3)
+    line = sale(product, 2)["items"][0]
+    body = {**sale(product), "items": [line, line]}
+    response = client.post("/api/invoices", json=body, headers=cashier)
+    assert response.status_code == 400
+    assert stock_of(client, product) == 3
+
+def test_rejected_basket_changes_no_stock(client, cashier, make_product):
+    plenty = make_product(stock=10)
+    scarce = make_product(stock=1)
+    body = {**sale(plenty), "items": sale(plenty)["items"] + sale(scarce, 5)["items"]}
+    assert client.post("/api/invoices", json=body, headers=cashier).status_code == 400
+    assert (stock_of(client, plenty), stock_of(client, scarce)) == (10, 1)
+
+def test_unknown_product_is_not_found(client, cashier):
+    body = sale({"id": "no-such-product", "selling_price": "1.00"})
+    assert client.post("/api/invoices", json=body, headers=cashier).status_code == 404
@@ -0,0 +1,43 @@
+import random
+
+import customers
+
+def new_phone() -> str:
+    # A Jordanian mobile number no other test uses
+    return f"079{random.randrange(10 ** 7):07d}"
+
+def create(client, headers, phone: str):
+    return client.post("/api/customers", json={"name": f"Customer {phone}", "phone": phone}, headers=headers)
+
+def test_phone_formats_normalize_to_the_same_key():
+    assert customers.normalize_phone("+962 79 123 4567") == "791234567"
+    assert customers.normalize_phone("00962791234567") == "791234567"
+    assert customers.normalize_phone("079-123-4567") == "791234567"
+    assert customers.normalize_phone("٠٧٩١٢٣٤٥٦٧") == "791234567"
+    assert customers.normalize_phone("+44 20 7946 0018") == "442079460018"
+    assert customers.normalize_phone("n/a") == ""
+
+def test_lookup_finds_customer_in_any_format(client, cashier):
+    phone = new_phone()
+    customer = create(client, cashier, phone).json()
+    international = f"+962 {phone[1:3]} {phone[3:]}"
+    assert client.get(f"/api/customers/phone/{international}").json()["id"] == customer["id"]
+    matches = client.get("/api/customers/phone", params={"prefix": phone[:6]}).json()
+    assert customer["id"] in [match["id"] for match in matches]
+
+def test_same_phone_in_another_format_is_a_duplicate(client, cashier):
+    phone = new_phone()
+    assert create(client, cashier, phone).status_code == 200
+    assert create(client, cashier, f"00962{phone[1:]}").status_code == 400
+
+def test_phones_without_digits_are_not_duplicates(client, cashier):
+    assert create(client, cashier, "unknown").status_code == 200
+    assert create(client, cashier, "n/a").status_code == 200
+
+def test_phone_change_invalidates_the_lookup(client, cashier):
+    old_phone, new = new_phone(), new_phone()
+    customer = create(client, cashier, old_phone).json()
+    assert client.get(f"/api/customers/phone/{old_phone}").status_code == 200
+    client.put(f"/api/customers/{customer['id']}", json={"phone": new}, headers=cashier)
+    assert client.get(f"/api/customers/phone/{old_phone}").status_code == 404
+    assert client.get(f"/api/customers/phone/{new}").json()["id"] == customer["id"]
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import auth
+import stats
+from conftest import money, sale
+
+def dashboard(client, headers) -> dict:
+    return client.get("/api/dashboard/stats", headers=headers).json()
+
+def test_counters_follow_sales_products_and_shifts(client, admin, make_user, make_product):
+    before = dashboard(client, admin)
+    product = make_product(stock=10, price="4.00", min_stock_level=5)
+    user = make_user()
+    client.post("/api/shifts/open", json={"opening_balance": "0"}, headers=user)
+    client.post("/api/invoices", json=sale(product, 6), headers=user)
+
+    after = dashboard(client, admin)
+    assert money(after["total_sales_today"]) - money(before["total_sales_today"]) == money("24.00")
+    assert after["total_invoices_today"] - before["total_invoices_today"] == 1
+    assert after["total_products"] - before["total_products"] == 1
+    assert after["low_stock_products"] - before["low_stock_products"] == 1
+    assert after["active_shifts"] - before["active_shifts"] == 1
+
+def test_counters_match_a_rebuild(client, admin, db):
+    counted = dashboard(client, admin)
+    stats.rebuild(db)
+    assert dashboard(client, admin) == counted
+
+def test_stream_needs_a_stream_token(client, admin, db):
+    access_token = admin["Authorization"].split()[1]
+    assert client.get("/api/dashboard/stream", params={"token": access_token}).status_code == 401
+
+    stream_token = client.post("/api/dashboard/stream-token", headers=admin).json()["token"]
+    # and a stream token is good for nothing else
+    assert client.get("/api/dashboard/stats", headers={"Authorization": f"Bearer {stream_token}"}).status_code == 401
+
+    principal = asyncio.run(auth.authenticate(stream_token, db, scope=auth.STREAM_SCOPE))
+    assert principal.username == "admin"
+
+def test_stream_sends_the_counters(monkeypatch):
+    monkeypatch.setattr(stats, "STREAM_POLL_SECONDS", 0)
+    class Request:
+        # Connected for one round of the loop
+        checks = iter([False])
+        async def is_disconnected(self):
+            return next(self.checks, True)
+
+    async def first_event():
+        return [event async for event in stats.event_stream(Request())]
+    events = asyncio.run(first_event())
+    assert len(events) == 1 and events[0].startswith("data: ")
+    assert "total_sales_today" in json.loads(events[0][len("data: "):])
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import inventory_ledger
+from conftest import sale, stock_of
+from models import InventoryArchive, InventoryMovement, Product, RollupState
+
+def ago(days: int) -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+
+def make_history(db, product: dict):
+    # +20 seventy days ago, -5 forty days ago, -3 three days ago
+    stock = 0
+    for days, quantity in ((70, 20), (40, -5), (3, -3)):
+        db.add(InventoryMovement(
+            product_id=product["id"],
+            movement_type="adjustment",
+            quantity=Decimal(quantity),
+            previous_quantity=Decimal(stock),
+            new_quantity=Decimal(stock + quantity),
+            created_at=ago(days)
+        ))
+        stock += quantity
+    db.query(Product).filter(Product.id == product["id"]).update({"stock_quantity": stock})
+    db.commit()
+
+def snapshot_since(db, days: int):
+    # Have the next refresh snapshot every day from `days` ago
+    db.merge(RollupState(name=inventory_ledger.STATE_NAME, high_water=ago(days).date()))
+    db.commit()
+
+def stock_at(client, headers, product: dict, moment: datetime) -> Decimal:
+    response = client.get("/api/inventory/stock-at", params={"product_id": product["id"], "at": moment.isoformat()}, headers=headers)
+    assert response.status_code == 200, response.text
+    return Decimal(response.json()["quantity"])
+
+def assert_history(client, headers, product: dict):
+    assert stock_at(client, headers, product, ago(80)) == 0
+    assert stock_at(client, headers, product, ago(50)) == 20
+    assert stock_at(client, headers, product, ago(10)) == 15
+    assert stock_at(client, headers, product, ago(0)) == 12
+
+def test_stock_at_before_and_after_snapshots(client, admin, make_product, db):
+    product = make_product(stock=0)
+    make_history(db, product)
+    assert_history(client, admin, product)
+
+    snapshot_since(db, 71)
+    assert inventory_ledger.refresh()
+    assert_history(client, admin, product)
+
+def test_archived_months_are_still_read(client, admin, make_product, db, monkeypatch):
+    product = make_product(stock=0)
+    make_history(db, product)
+    snapshot_since(db, 71)
+
+    monkeypatch.setattr(inventory_ledger, "INVENTORY_ARCHIVE_AFTER_DAYS", 30)
+    steps = inventory_ledger.refresh()
+    assert any(step.startswith("archive") for step in steps)
+    db.expire_all()
+    assert db.query(InventoryArchive).count()
+    assert db.query(InventoryMovement).filter(InventoryMovement.product_id == product["id"], InventoryMovement.created_at < ago(60)).count() == 0
+
+    assert_history(client, admin, product)
+    movements = client.get("/api/inventory/movements", params={"product_id": product["id"]}, headers=admin).json()
+    assert [Decimal(movement["quantity"]) for movement in movements] == [-3, -5, 20]
+
+def test_stock_matches_the_sum_of_movements(client, admin, cashier, make_product):
+    product = make_product(stock=10)
+    client.put(f"/api/products/{product['id']}", json={"stock_quantity": 14}, headers=admin)
+    client.post("/api/invoices", json=sale(product, "1.5"), headers=cashier)
+    client.post("/api/invoices", json=sale(product, 2), headers=cashier)
+
+    movements = client.get("/api/inventory/movements", params={"product_id": product["id"]}, headers=admin).json()
+    assert [movement["movement_type"] for movement in movements] == ["sale", "sale", "adjustment", "adjustment"]
+    assert sum(Decimal(movement["quantity"]) for movement in movements) == stock_of(client, product) == 11
@@ -0,0 +1,77 @@
+import uuid
+
+import sequencer
+import server
+from conftest import sale, stock_of
+
+def test_invoices_are_numbered_in_sequence(client, cashier, make_product):
+    product = make_product()
+    first = client.post("/api/invoices", json=sale(product), headers=cashier).json()
+    second = client.post("/api/invoices", json=sale(product), headers=cashier).json()
+    day, value = sequencer.INVOICE_NUMBER_PATTERN.match(first["invoice_number"]).groups()
+    assert second["invoice_number"] == sequencer.format_invoice_number(day, int(value) + 1)
+
+def test_rejected_sale_leaves_no_gap(client, cashier, make_product):
+    product = make_product(stock=1)
+    first = client.post("/api/invoices", json=sale(product), headers=cashier).json()
+    assert client.post("/api/invoices", json=sale(product), headers=cashier).status_code == 400
+    restocked = make_product()
+    second = client.post("/api/invoices", json=sale(restocked), headers=cashier).json()
+    assert int(second["invoice_number"][-4:]) == int(first["invoice_number"][-4:]) + 1
+
+def test_reserved_number_can_be_used_once(client, cashier, make_product):
+    product = make_product()
+    block = client.post("/api/invoices/number-blocks", json={"count": 2}, headers=cashier).json()
+    body = sale(product, invoice_number=block["first_number"])
+    created = client.post("/api/invoices", json=body, headers=cashier)
+    assert created.status_code == 200
+    assert created.json()["invoice_number"] == block["first_number"]
+
+    again = client.post("/api/invoices", json=body, headers=cashier)
+    assert again.status_code == 409
+    assert stock_of(client, product) == 9
+
+def test_reserved_numbers_belong_to_their_till(client, cashier, make_user, make_product):
+    product = make_product()
+    block = client.post("/api/invoices/number-blocks", json={"count": 1}, headers=cashier).json()
+    other = make_user()
+    response = client.post("/api/invoices", json=sale(product, invoice_number=block["first_number"]), headers=other)
+    assert response.status_code == 400
+
+def test_unreserved_number_is_rejected(client, cashier, make_product):
+    response = client.post("/api/invoices", json=sale(make_product(), invoice_number="INV-20990101-0001"), headers=cashier)
+    assert response.status_code == 400
+
+def test_number_taken_concurrently_is_a_conflict(client, cashier, make_product, monkeypatch):
+    product = make_product()
+    block = client.post("/api/invoices/number-blocks", json={"count": 1}, headers=cashier).json()
+    body = sale(product, invoice_number=block["first_number"])
+    assert client.post("/api/invoices", json=body, headers=cashier).status_code == 200
+
+    # As if the other request inserted between the check and the commit
+    checks = iter([False])
+    monkeypatch.setattr(sequencer, "is_used", lambda db, number: next(checks, True))
+    assert client.post("/api/invoices", json=body, headers=cashier).status_code == 409
+    assert stock_of(client, product) == 9
+
+def test_retry_with_same_idempotency_key_returns_first_invoice(client, cashier, make_product):
+    product = make_product()
+    body = sale(product, idempotency_key=str(uuid.uuid4()))
+    first = client.post("/api/invoices", json=body, headers=cashier).json()
+    second = client.post("/api/invoices", json=body, headers=cashier).json()
+    assert second["id"] == first["id"]
+    assert stock_of(client, product) == 9
+
+def test_concurrent_retry_with_same_idempotency_key(client, cashier, make_product, monkeypatch):
+    product = make_product()
+    body = sale(product, idempotency_key=str(uuid.uuid4()))
+    first = client.post("/api/invoices", json=body, headers=cashier).json()
+
+    # The retry misses the first lookup, as if both attempts raced past it
+    find = server.find_invoice_by_key
+    lookups = iter([None])
+    monkeypatch.setattr(server, "find_invoice_by_key", lambda db, key: next(lookups, find(db, key)))
+    second = client.post("/api/invoices", json=body, headers=cashier)
+    assert second.status_code == 200
+    assert second.json()["id"] == first["id"]
+    assert stock_of(client, product) == 9
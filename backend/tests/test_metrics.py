@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from database import InstrumentedQueuePool
+
+def test_metrics_are_for_admins_only(client, admin, make_user):
+    assert client.get("/api/metrics", headers=make_user("cashier")).status_code == 403
+    assert client.get("/api/metrics", headers=make_user("manager")).status_code == 403
+    metrics = client.get("/api/metrics", headers=admin).json()
+    assert {"primary", "sequence"} <= set(metrics["db_pool"])
+    assert "hit_ratio" in metrics["barcode_cache"]
+
+def test_pool_counts_checkouts_overflow_and_timeouts():
+    engine = create_engine("sqlite://", poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=1, pool_timeout=0.05)
+    first = engine.connect()
+    second = engine.connect()
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    metrics = engine.pool.metrics()
+    assert (metrics["checkouts"], metrics["overflow_checkouts"], metrics["timeouts"]) == (2, 1, 1)
+    assert metrics["checked_out"] == 2
+
+    second.close()
+    first.close()
+    engine.dispose()
+    # Counts carry over to the pool dispose() creates
+    assert engine.pool.metrics()["checkouts"] == 2
@@ -0,0 +1,56 @@
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+import pagination
+from models import Product
+
+def walk(client, path: str, headers: dict, **params) -> list:
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(path, params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append(response.json())
+        cursor = response.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return pages
+
+def test_pages_follow_the_cursor_without_gaps_or_repeats(client, cashier):
+    tag = uuid.uuid4().hex[:8]
+    for number in range(5):
+        # Two customers share each name, so the id breaks the tie
+        for _ in range(2):
+            phone = f"078{uuid.uuid4().int % 10 ** 7:07d}"
+            client.post("/api/customers", json={"name": f"Page {tag} {number}", "phone": phone}, headers=cashier)
+
+    pages = walk(client, "/api/customers", cashier, search=tag, limit=3)
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    rows = [(customer["name"], customer["id"]) for page in pages for customer in page]
+    assert rows == sorted(rows)
+    assert len(set(rows)) == 10
+
+def test_full_last_page_has_no_cursor(client, cashier):
+    tag = uuid.uuid4().hex[:8]
+    for number in range(2):
+        client.post("/api/customers", json={"name": f"Exact {tag} {number}", "phone": f"077{uuid.uuid4().int % 10 ** 7:07d}"}, headers=cashier)
+    assert [len(page) for page in walk(client, "/api/customers", cashier, search=tag, limit=2)] == [2]
+
+def test_total_estimate_header(client, cashier):
+    tag = uuid.uuid4().hex[:8]
+    for number in range(3):
+        client.post("/api/customers", json={"name": f"Count {tag} {number}", "phone": f"076{uuid.uuid4().int % 10 ** 7:07d}"}, headers=cashier)
+    response = client.get("/api/customers", params={"search": tag, "limit": 1, "with_total": True})
+    assert response.headers[pagination.TOTAL_ESTIMATE_HEADER] == "3"
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/api/customers", params={"cursor": "bm90LWpzb24="}).status_code == 400
+
+def test_explain_keeps_filter_values_as_parameters():
+    statement = select(Product.id).where(Product.name == "O'Brien's; DROP TABLE products")
+    compiled = pagination.Explain(statement).compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    assert sql.startswith("EXPLAIN (FORMAT JSON) SELECT")
+    assert "DROP TABLE" not in sql
+    assert "O'Brien's; DROP TABLE products" in compiled.params.values()
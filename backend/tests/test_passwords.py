@@ -0,0 +1,57 @@
+import uuid
+
+import pytest
+from passlib.context import CryptContext
+
+import passwords
+from conftest import login
+from models import User
+
+@pytest.fixture
+def pool(monkeypatch):
+    # One worker process and room for one pending request
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_WORKERS", 1)
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_MAX_PENDING", 1)
+    monkeypatch.setattr(passwords, "_executor", None)
+    yield
+    passwords.shutdown()
+
+def create_user(client, admin) -> str:
+    username = f"pw-{uuid.uuid4().hex[:8]}"
+    response = client.post("/api/users", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "full_name": username,
+        "role": "cashier",
+        "password": "secret123"
+    }, headers=admin)
+    assert response.status_code == 200, response.text
+    return username
+
+def test_hashing_runs_in_the_process_pool(client, admin, pool):
+    completed = passwords.stats()["completed"]
+    username = create_user(client, admin)
+    login(client, username, "secret123")
+    assert passwords.verify_password("secret123", passwords.hash_password("secret123"))
+    assert passwords.stats()["completed"] == completed + 4
+    assert passwords.stats()["pending"] == 0
+
+def test_logins_beyond_the_pending_limit_get_429(client, admin, pool, monkeypatch):
+    username = create_user(client, admin)
+    rejected = passwords.stats()["rejected"]
+    monkeypatch.setattr(passwords, "_pending", passwords.PASSWORD_HASH_MAX_PENDING)
+    response = client.post("/api/auth/login", json={"username": username, "password": "secret123"})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    assert passwords.stats()["rejected"] == rejected + 1
+
+def test_login_upgrades_hashes_with_fewer_rounds(client, admin, db, monkeypatch):
+    username = create_user(client, admin)
+    rounds = passwords.BCRYPT_ROUNDS + 1
+    monkeypatch.setattr(passwords, "pwd_context", CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds, bcrypt__min_desired_rounds=rounds
+    ))
+    login(client, username, "secret123")
+    stored = db.query(User.hashed_password).filter(User.username == username).scalar()
+    assert stored.startswith(f"$2b${rounds:02d}$")
+    login(client, username, "secret123")
@@ -0,0 +1,50 @@
+import time
+import uuid
+
+def upload(client, headers, text: str) -> dict:
+    response = client.post("/api/products/import", files={"file": ("products.csv", text.encode(), "text/csv")}, headers=headers)
+    assert response.status_code == 202, response.text
+    return response.json()
+
+def wait_for(client, headers, job: dict) -> dict:
+    for _ in range(100):
+        job = client.get(f"/api/products/import/{job['id']}", headers=headers).json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Import {job['id']} did not finish")
+
+def test_bad_rows_are_reported_and_the_rest_imported(client, admin):
+    good, bad = uuid.uuid4().hex[:12], uuid.uuid4().hex[:12]
+    job = wait_for(client, admin, upload(client, admin, "\n".join([
+        "barcode,name,selling_price,cost_price,stock_quantity",
+        f"{good},Rice 1kg,3.50,2.10,20",
+        f"{bad},Sugar 1kg,not-a-price,1.00,5",
+        f"{good}-2,Flour 1kg,1.75,1.00,0",
+        f",Nameless,1.00,0.50,0"
+    ])))
+    assert job["status"] == "completed"
+    assert job["processed_rows"] == 4
+    assert job["created_count"] == 2
+    assert job["error_count"] == 2
+    assert sorted(error["row"] for error in job["errors"]) == [3, 5]
+    assert job["errors"][0]["barcode"] == bad
+
+    products = client.get("/api/products", params={"search": good}).json()
+    assert {product["barcode"] for product in products} == {good, f"{good}-2"}
+
+def test_reimport_updates_existing_products(client, admin):
+    barcode = uuid.uuid4().hex[:12]
+    header = "barcode,name,selling_price,cost_price"
+    wait_for(client, admin, upload(client, admin, f"{header}\n{barcode},Tea,2.00,1.00"))
+    job = wait_for(client, admin, upload(client, admin, f"{header}\n{barcode},Tea,2.25,1.00"))
+    assert (job["created_count"], job["updated_count"]) == (0, 1)
+
+def test_missing_required_column_fails_the_job(client, admin):
+    job = wait_for(client, admin, upload(client, admin, "barcode,name\n123,Salt"))
+    assert job["status"] == "failed"
+    assert "selling_price" in job["errors"][0]["error"]
+
+def test_only_csv_and_excel_are_accepted(client, admin):
+    response = client.post("/api/products/import", files={"file": ("products.txt", b"x", "text/plain")}, headers=admin)
+    assert response.status_code == 400
@@ -0,0 +1,40 @@
+import uuid
+
+import product_search
+
+def search(client, text: str) -> list:
+    response = client.get("/api/products", params={"search": text})
+    assert response.status_code == 200, response.text
+    return [product["id"] for product in response.json()]
+
+def test_normalize_folds_arabic_spelling_variants():
+    assert product_search.normalize("  أرزّ   بسمتي ") == "ارز بسمتي"
+    assert product_search.normalize("مـيـاه معدنية") == "مياه معدنيه"
+    assert product_search.normalize("إبريق ١٢") == "ابريق 12"
+    assert product_search.normalize("Olive OIL") == "olive oil"
+
+def test_search_matches_across_spelling_variants(client, make_product):
+    tag = uuid.uuid4().hex[:6]
+    product = make_product(name=f"أرز بسمتي {tag}", name_en=f"Basmati Rice {tag}")
+    assert product["id"] in search(client, f"ارز {tag}")
+    assert product["id"] in search(client, f"rice basmati {tag}")
+    assert product["id"] not in search(client, f"ارز {tag} حليب")
+
+def test_exact_barcode_ranks_first(client, make_product):
+    tag = uuid.uuid4().hex[:10]
+    exact = make_product(barcode=tag, name="Sugar")
+    longer = make_product(barcode=f"{tag}9", name="Sugar cubes")
+    named = make_product(name=f"Brown sugar {tag}")
+    assert search(client, tag)[:3] == [exact["id"], longer["id"], named["id"]]
+
+def test_renamed_product_is_found_by_its_new_name(client, admin, make_product):
+    product = make_product()
+    tag = uuid.uuid4().hex[:8]
+    client.put(f"/api/products/{product['id']}", json={"name": f"Lentils {tag}"}, headers=admin)
+    assert search(client, f"lentils {tag}") == [product["id"]]
+
+def test_like_wildcards_are_taken_literally(client, make_product):
+    tag = uuid.uuid4().hex[:6]
+    product = make_product(name=f"Juice 100% {tag}")
+    assert search(client, f"100% {tag}") == [product["id"]]
+    assert search(client, f"%_{tag}") == []
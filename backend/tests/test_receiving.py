@@ -0,0 +1,66 @@
+from conftest import money, stock_of
+
+def test_purchase_raises_stock_and_records_invoice(client, admin, make_product):
+    first = make_product(stock=5)
+    second = make_product(stock=0)
+    supplier = client.post("/api/suppliers", json={"name": "Wholesale Co"}, headers=admin).json()
+    response = client.post("/api/inventory/receipts", json={
+        "lines": [
+            {"product_id": first["id"], "quantity": 10, "cost_price": "1.20"},
+            {"barcode": second["barcode"], "quantity": 4, "cost_price": "3.00"}
+        ],
+        "create_invoice": True,
+        "supplier_id": supplier["id"]
+    }, headers=admin)
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["product_count"] == 2
+    assert result["movement_count"] == 2
+
+    assert stock_of(client, first) == 15
+    assert stock_of(client, second) == 4
+    invoice = client.get(f"/api/invoices/{result['invoice_id']}", headers=admin).json()
+    assert invoice["invoice_type"] == "purchase"
+    assert money(invoice["total_amount"]) == money("24.00")
+
+    movements = client.get("/api/inventory/movements", params={"product_id": first["id"]}, headers=admin).json()
+    assert [money(movement["quantity"]) for movement in movements][:1] == [money(10)]
+
+def test_adjustment_below_zero_is_rejected(client, admin, make_product):
+    product = make_product(stock=3)
+    response = client.post("/api/inventory/receipts", json={
+        "movement_type": "adjustment",
+        "lines": [{"product_id": product["id"], "quantity": -5}]
+    }, headers=admin)
+    assert response.status_code == 400
+    assert stock_of(client, product) == 3
+
+def test_damage_writes_stock_off(client, admin, make_product):
+    product = make_product(stock=10)
+    response = client.post("/api/inventory/receipts", json={
+        "movement_type": "damage",
+        "lines": [{"product_id": product["id"], "quantity": -3}]
+    }, headers=admin)
+    assert response.status_code == 200, response.text
+    assert stock_of(client, product) == 7
+
+def test_damage_with_positive_quantity_is_rejected(client, admin, make_product):
+    product = make_product(stock=10)
+    response = client.post("/api/inventory/receipts", json={
+        "movement_type": "damage",
+        "lines": [{"product_id": product["id"], "quantity": 3}]
+    }, headers=admin)
+    assert response.status_code == 400
+    assert stock_of(client, product) == 10
+
+def test_unknown_barcode_is_not_found(client, admin):
+    response = client.post("/api/inventory/receipts", json={
+        "lines": [{"barcode": "no-such-barcode", "quantity": 1}]
+    }, headers=admin)
+    assert response.status_code == 404
+
+def test_cashier_cannot_receive_stock(client, cashier, make_product):
+    response = client.post("/api/inventory/receipts", json={
+        "lines": [{"product_id": make_product()["id"], "quantity": 1}]
+    }, headers=cashier)
+    assert response.status_code == 403
@@ -0,0 +1,43 @@
+import uuid
+
+import response_cache
+
+def test_unchanged_response_is_answered_with_304(client):
+    first = client.get("/api/categories")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    again = client.get("/api/categories", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+
+def test_writes_invalidate_the_cached_response(client, admin):
+    etag = client.get("/api/categories").headers["etag"]
+    name = f"Bakery {uuid.uuid4().hex[:6]}"
+    client.post("/api/categories", json={"name": name}, headers=admin)
+    response = client.get("/api/categories", params={"limit": 500}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert name in [category["name"] for category in response.json()]
+
+def test_product_response_follows_product_writes(client, admin, make_product):
+    product = make_product()
+    etag = client.get(f"/api/products/{product['id']}").headers["etag"]
+    client.put(f"/api/products/{product['id']}", json={"name": "Renamed"}, headers=admin)
+    response = client.get(f"/api/products/{product['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Renamed"
+
+def test_reads_do_not_grow_the_version_map(client, make_product):
+    product = make_product()
+    versions = len(response_cache._versions)
+    for _ in range(3):
+        client.get(f"/api/products/{uuid.uuid4()}")
+    client.get(f"/api/products/{product['id']}")
+    assert len(response_cache._versions) == versions
+
+def test_cursor_header_is_cached_with_the_body(client, admin):
+    for _ in range(2):
+        client.post("/api/categories", json={"name": f"Aisle {uuid.uuid4().hex[:6]}"}, headers=admin)
+    first = client.get("/api/categories", params={"limit": 1})
+    again = client.get("/api/categories", params={"limit": 1})
+    assert first.headers["x-next-cursor"]
+    assert again.headers["x-next-cursor"] == first.headers["x-next-cursor"]
@@ -0,0 +1,87 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import reports
+import rollups
+from models import RollupState
+from conftest import money, sale
+
+@pytest.fixture
+def report_range():
+    end = rollups.day_start(datetime.now(timezone.utc).date())
+    return end - timedelta(days=10), end - timedelta(microseconds=1)
+
+def upload_sales(client, headers, product: dict, days_ago: int, count: int):
+    made_at = datetime.now(timezone.utc) - timedelta(days=days_ago)
+    sales = [
+        sale(product, 2, idempotency_key=str(uuid.uuid4()), created_at=made_at.isoformat(), payment_method=method)
+        for method in ["cash", "card"][:count]
+    ]
+    results = client.post("/api/invoices/batch", json={"sales": sales}, headers=headers).json()
+    assert {result["status"] for result in results} == {"created"}
+
+def raw_reports(db, start, end, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(rollups, "covered_days", lambda db, start, end: None)
+        return reports.sales_totals(db, start, end), reports.product_sales(db, start, end, limit=500)[0]
+
+def assert_reports_match(db, start, end, monkeypatch):
+    raw_totals, raw_products = raw_reports(db, start, end, monkeypatch)
+    assert rollups.covered_days(db, start, end) is not None
+    totals = reports.sales_totals(db, start, end)
+    assert totals["total_invoices"] == raw_totals["total_invoices"]
+    for field in reports.AMOUNT_FIELDS:
+        assert money(totals[field]) == money(raw_totals[field]), field
+
+    def by_product(items):
+        return {item["product_id"]: (money(item["quantity_sold"]), money(item["total_revenue"]), money(item["total_profit"])) for item in items}
+    assert by_product(reports.product_sales(db, start, end, limit=500)[0]) == by_product(raw_products)
+
+def test_rollups_match_raw_invoices(client, cashier, make_product, db, report_range, monkeypatch):
+    product = make_product(stock=100, price="4.00", cost="2.50")
+    upload_sales(client, cashier, product, 5, 2)
+    upload_sales(client, cashier, product, 2, 1)
+    assert rollups.refresh()
+    db.expire_all()
+    assert_reports_match(db, *report_range, monkeypatch)
+
+def test_late_sale_marks_day_dirty(client, cashier, make_product, db, report_range, monkeypatch):
+    product = make_product(stock=100, price="3.00", cost="1.00")
+    upload_sales(client, cashier, product, 4, 1)
+    rollups.refresh()
+
+    # Uploaded after its day was rolled up: reports stay right until the
+    # next refresh rolls the day again
+    upload_sales(client, cashier, product, 4, 2)
+    db.expire_all()
+    assert (datetime.now(timezone.utc) - timedelta(days=4)).date() in rollups.dirty_days(db)
+    assert_reports_match(db, *report_range, monkeypatch)
+
+    rollups.refresh()
+    db.expire_all()
+    assert not rollups.dirty_days(db)
+    assert_reports_match(db, *report_range, monkeypatch)
+
+def test_mark_made_while_rolling_is_kept(client, cashier, make_product, db, monkeypatch):
+    upload_sales(client, cashier, make_product(), 6, 1)
+    rollups.refresh()
+    day = (datetime.now(timezone.utc) - timedelta(days=6)).date()
+
+    # Walk the high water back so the day is rolled on that path again, and
+    # have a late upload mark it dirty while it is being rolled: the mark
+    # must survive, so the day is rolled once more
+    db.get(RollupState, rollups.STATE_NAME).high_water = day
+    db.commit()
+    roll_day = rollups._roll_day
+    marked = []
+    def roll_and_mark(session, rolled_day):
+        roll_day(session, rolled_day)
+        if rolled_day == day and not marked:
+            marked.append(rolled_day)
+            rollups.mark_dirty(session, day)
+    monkeypatch.setattr(rollups, "_roll_day", roll_and_mark)
+    assert rollups.refresh().count(day) == 2
+    db.expire_all()
+    assert day not in rollups.dirty_days(db)
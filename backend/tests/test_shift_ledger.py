@@ -0,0 +1,50 @@
+import shift_ledger
+from conftest import money, sale
+from models import ShiftTotal
+
+def run_shift(client, user, make_product) -> dict:
+    product = make_product(stock=100, price="2.50")
+    shift = client.post("/api/shifts/open", json={"opening_balance": "100"}, headers=user).json()
+    client.post("/api/invoices", json=sale(product, paid_amount="10"), headers=user)
+    client.post("/api/invoices", json=sale(product, 2, payment_method="card", paid_amount="5"), headers=user)
+    mixed = sale(product, 2, payment_method="mixed", paid_amount="6", payments=[
+        {"payment_method": "cash", "amount": "3"},
+        {"payment_method": "card", "amount": "3"}
+    ])
+    assert client.post("/api/invoices", json=mixed, headers=user).status_code == 200
+    for kind, amount in (("expense", "4"), ("deposit", "10")):
+        response = client.post(f"/api/shifts/{shift['id']}/cash-movements", json={"transaction_type": kind, "amount": amount}, headers=user)
+        assert response.status_code == 200, response.text
+    return shift
+
+def totals(entries: list) -> dict:
+    return {entry["entry"]: (money(entry["amount"]), entry["count"]) for entry in entries}
+
+def test_x_report_keeps_running_totals(client, make_user, make_product):
+    user = make_user()
+    shift = run_shift(client, user, make_product)
+    report = client.get(f"/api/shifts/{shift['id']}/x-report", headers=user).json()
+    # Change from the mixed payment comes off its cash part
+    assert totals(report["payments"]) == {"cash": (money("4.50"), 2), "card": (money("8.00"), 2)}
+    assert totals(report["cash_movements"]) == {"expense": (money("-4"), 1), "deposit": (money("10"), 1)}
+    assert money(report["expected_cash"]) == money("110.50")
+
+    closed = client.post(f"/api/shifts/{shift['id']}/close", json={"actual_cash": "110"}, headers=user).json()
+    assert money(closed["expected_cash"]) == money("110.50")
+    assert money(closed["difference"]) == money("-0.50")
+    movement = {"transaction_type": "expense", "amount": "1"}
+    assert client.post(f"/api/shifts/{shift['id']}/cash-movements", json=movement, headers=user).status_code == 400
+
+def test_mixed_payment_parts_must_add_up(client, cashier, make_product):
+    body = sale(make_product(), payment_method="mixed", paid_amount="6", payments=[{"payment_method": "card", "amount": "5"}])
+    assert client.post("/api/invoices", json=body, headers=cashier).status_code == 400
+
+def test_backfill_rebuilds_totals_from_invoices(client, make_user, make_product, db):
+    user = make_user()
+    shift = run_shift(client, user, make_product)
+    before = client.get(f"/api/shifts/{shift['id']}/x-report", headers=user).json()
+
+    db.query(ShiftTotal).filter(ShiftTotal.shift_id == shift["id"]).delete()
+    db.commit()
+    shift_ledger.backfill(db)
+    assert client.get(f"/api/shifts/{shift['id']}/x-report", headers=user).json() == before
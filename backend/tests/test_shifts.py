@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import cache
+from models import Shift, ShiftStatus
+
+def test_only_one_open_shift_per_user(client, cashier):
+    response = client.post("/api/shifts/open", json={"opening_balance": "0"}, headers=cashier)
+    assert response.status_code == 400
+
+def test_open_shift_index_rejects_a_second_row(client, cashier, db):
+    user_id = client.get("/api/auth/me", headers=cashier).json()["id"]
+    db.add(Shift(user_id=user_id, status=ShiftStatus.OPEN, opening_balance=0))
+    with pytest.raises(IntegrityError):
+        db.flush()
+    db.rollback()
+
+def test_shift_can_be_reopened_after_close(client, make_user):
+    user = make_user()
+    shift = client.post("/api/shifts/open", json={"opening_balance": "50"}, headers=user).json()
+    assert client.post(f"/api/shifts/{shift['id']}/close", json={"actual_cash": "50"}, headers=user).status_code == 200
+    again = client.post(f"/api/shifts/{shift['id']}/close", json={"actual_cash": "50"}, headers=user)
+    assert again.status_code == 400
+    assert client.post("/api/shifts/open", json={"opening_balance": "0"}, headers=user).status_code == 200
+
+def test_current_shift_is_cached_and_follows_open_and_close(client, make_user):
+    user = make_user()
+    user_id = client.get("/api/auth/me", headers=user).json()["id"]
+    assert client.get("/api/shifts/current", headers=user).status_code == 404
+    assert cache.open_shift_cache.get(user_id) is False
+
+    shift = client.post("/api/shifts/open", json={"opening_balance": "0"}, headers=user).json()
+    assert client.get("/api/shifts/current", headers=user).json()["id"] == shift["id"]
+    hits = cache.open_shift_cache.hits
+    assert client.get("/api/shifts/current", headers=user).json()["id"] == shift["id"]
+    assert cache.open_shift_cache.hits > hits
+
+    client.post(f"/api/shifts/{shift['id']}/close", json={"actual_cash": "0"}, headers=user)
+    assert client.get("/api/shifts/current", headers=user).status_code == 404
@@ -0,0 +1,67 @@
+import axios from './axios';
+
+// Sales that could not reach the server are kept in localStorage and
+// uploaded in batches to /invoices/batch. Each sale carries an idempotency
+// key, so a batch that is sent twice (say the response was lost) is not
+// applied twice. Sales also carry the shift they were made in, so the
+// server books them into that shift and turns them away if it has been
+// closed in the meantime.
+const QUEUE_KEY = 'pos_sale_queue';
+const REJECTED_KEY = 'pos_sale_queue_rejected';
+const BATCH_SIZE = 50;
+
+const read = (key) => JSON.parse(localStorage.getItem(key) || '[]');
+const write = (key, sales) => localStorage.setItem(key, JSON.stringify(sales));
+
+export const newIdempotencyKey = () =>
+  (window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`);
+
+export const pendingSales = () => read(QUEUE_KEY).length;
+
+export const rejectedSales = () => read(REJECTED_KEY);
+
+export const enqueueSale = (invoiceData) => {
+  const sale = {
+    ...invoiceData,
+    idempotency_key: invoiceData.idempotency_key || newIdempotencyKey(),
+    created_at: new Date().toISOString(),
+  };
+  write(QUEUE_KEY, [...read(QUEUE_KEY), sale]);
+  return sale;
+};
+
+let draining = false;
+
+// Uploads queued sales; returns { created, rejected } counts
+export const drainSales = async () => {
+  if (draining) return { created: 0, rejected: 0 };
+  draining = true;
+  let created = 0;
+  let rejected = 0;
+  try {
+    let queue = read(QUEUE_KEY);
+    while (queue.length > 0) {
+      const batch = queue.slice(0, BATCH_SIZE);
+      const response = await axios.post('/invoices/batch', { sales: batch });
+      const failed = response.data.filter(r => r.status === 'error');
+      const done = new Set(response.data.map(r => r.idempotency_key));
+
+      if (failed.length > 0) {
+        const errors = Object.fromEntries(failed.map(r => [r.idempotency_key, r.error]));
+        write(REJECTED_KEY, [
+          ...read(REJECTED_KEY),
+          ...batch.filter(s => errors[s.idempotency_key]).map(s => ({ ...s, error: errors[s.idempotency_key] })),
+        ]);
+      }
+      created += response.data.filter(r => r.status === 'created').length;
+      rejected += failed.length;
+
+      // Sales queued while the upload was in flight stay in the queue
+      queue = read(QUEUE_KEY).filter(s => !done.has(s.idempotency_key));
+      write(QUEUE_KEY, queue);
+    }
+  } finally {
+    draining = false;
+  }
+  return { created, rejected };
+};
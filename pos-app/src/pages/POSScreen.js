@@ -1,6 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { FaPlus, FaMinus, FaTrash, FaBarcode, FaUser, FaCashRegister, FaPrint, FaTimes, FaCreditCard, FaMoneyBill, FaMobileAlt } from 'react-icons/fa';
 import axios from '../api/axios';
+import { enqueueSale, drainSales, newIdempotencyKey } from '../api/saleQueue';
 import { toast } from 'react-toastify';
 import { useAuth } from '../contexts/AuthContext';
 
@@ -20,8 +21,21 @@ const POSScreen = () => {
   useEffect(() => {
     fetchProducts();
     checkCurrentShift();
+    syncOfflineSales();
+    const timer = setInterval(syncOfflineSales, 30000);
+    return () => clearInterval(timer);
   }, []);
 
+  const syncOfflineSales = async () => {
+    try {
+      const { created, rejected } = await drainSales();
+      if (created > 0) toast.success(`تمت مزامنة ${created} فاتورة محفوظة دون اتصال`);
+      if (rejected > 0) toast.error(`تعذر ترحيل ${rejected} فاتورة محفوظة دون اتصال`);
+    } catch (error) {
+      // Still offline, try again on the next tick
+    }
+  };
+
   useEffect(() => {
     if (barcodeInputRef.current) {
       barcodeInputRef.current.focus();
@@ -118,16 +132,16 @@ const POSScreen = () => {
   const findCustomerByPhone = async () => {
     if (!customerPhone) return;
     try {
-      const response = await axios.get(`/customers?search=${customerPhone}`);
-      if (response.data.length > 0) {
-        setCustomer(response.data[0]);
-        toast.success(`تم التعرف على العميل: ${response.data[0].name}`);
-      } else {
+      const response = await axios.get(`/customers/phone/${encodeURIComponent(customerPhone)}`);
+      setCustomer(response.data);
+      toast.success(`تم التعرف على العميل: ${response.data.name}`);
+    } catch (error) {
+      if (error.response?.status === 404) {
         setCustomer(null);
         toast.info('عميل جديد - سيتم إنشاء سجل جديد');
+      } else {
+        console.error('Error finding customer:', error);
       }
-    } catch (error) {
-      console.error('Error finding customer:', error);
     }
   };
 
@@ -174,6 +188,7 @@ const POSScreen = () => {
       }
 
       const invoiceData = {
+        idempotency_key: newIdempotencyKey(),
         invoice_type: 'sale',
         payment_method: paymentMethod,
         paid_amount: paid,
@@ -188,11 +203,35 @@ const POSScreen = () => {
         }))
       };
 
-      const response = await axios.post('/invoices', invoiceData);
-      toast.success(`تم إتمام البيع - فاتورة رقم: ${response.data.invoice_number}`);
+      let invoice;
+      try {
+        const response = await axios.post('/invoices', invoiceData);
+        invoice = response.data;
+        toast.success(`تم إتمام البيع - فاتورة رقم: ${invoice.invoice_number}`);
+      } catch (error) {
+        if (error.response) throw error;
+        // لا يوجد اتصال بالخادم: حفظ الفاتورة محلياً وترحيلها لاحقاً
+        // مع وردية البيع، حتى لا تُحسب في وردية أخرى إذا أُغلقت قبل الترحيل
+        const sale = enqueueSale({ ...invoiceData, shift_id: currentShift?.id });
+        invoice = {
+          ...sale,
+          invoice_number: `OFFLINE-${sale.idempotency_key.slice(0, 8)}`,
+          items: cart.map(i => ({
+            product_name: i.name,
+            quantity: i.quantity,
+            unit_price: i.price,
+            total_price: i.price * i.quantity * (1 + i.tax_rate / 100),
+          })),
+          subtotal: calculateSubtotal(),
+          tax_amount: calculateTax(),
+          total_amount: total,
+          change_amount: paid - total,
+        };
+        toast.info('تم حفظ الفاتورة دون اتصال وسيتم ترحيلها تلقائياً');
+      }
       
       // طباعة الإيصال
-      await printReceipt(response.data);
+      await printReceipt(invoice);
       
       // مسح البيانات
       clearCart();
@@ -5,6 +5,9 @@ import axios from '../api/axios';
 import { toast } from 'react-toastify';
 import { useAuth } from '../contexts/AuthContext';
 
+const PAYMENT_LABELS = { cash: 'نقدي', card: 'بطاقة', electronic: 'إلكتروني', mixed: 'مختلط' };
+const MOVEMENT_LABELS = { expense: 'مصروفات', deposit: 'إيداع', withdrawal: 'سحب' };
+
 const ShiftManagement = () => {
   const { user, logout } = useAuth();
   const navigate = useNavigate();
@@ -14,6 +17,7 @@ const ShiftManagement = () => {
   const [notes, setNotes] = useState('');
   const [loading, setLoading] = useState(false);
   const [showCloseModal, setShowCloseModal] = useState(false);
+  const [xReport, setXReport] = useState(null);
 
   useEffect(() => {
     checkCurrentShift();
@@ -51,6 +55,16 @@ const ShiftManagement = () => {
     }
   };
 
+  const openCloseModal = async () => {
+    setShowCloseModal(true);
+    try {
+      const response = await axios.get(`/shifts/${currentShift.id}/x-report`);
+      setXReport(response.data);
+    } catch (error) {
+      setXReport(null);
+    }
+  };
+
   const handleCloseShift = async () => {
     if (!closingCash) {
       toast.error('يرجى إدخال المبلغ الفعلي في الصندوق');
@@ -115,7 +129,7 @@ const ShiftManagement = () => {
             </button>
 
             <button
-              onClick={() => setShowCloseModal(true)}
+              onClick={openCloseModal}
               className="w-full bg-orange-600 text-white py-4 rounded-lg text-xl font-bold hover:bg-orange-700 transition-all"
             >
               إغلاق الوردية
@@ -138,6 +152,27 @@ const ShiftManagement = () => {
               <h2 className="text-2xl font-bold mb-6 text-center">إغلاق الوردية</h2>
               
               <div className="space-y-4">
+                {xReport && (
+                  <div className="bg-gray-50 rounded-lg p-4 space-y-1">
+                    {xReport.payments.map((total) => (
+                      <div key={total.entry} className="flex justify-between text-sm">
+                        <span>{PAYMENT_LABELS[total.entry] || total.entry} ({total.count})</span>
+                        <span>{Number(total.amount).toFixed(2)} د</span>
+                      </div>
+                    ))}
+                    {xReport.cash_movements.map((total) => (
+                      <div key={total.entry} className="flex justify-between text-sm">
+                        <span>{MOVEMENT_LABELS[total.entry] || total.entry} ({total.count})</span>
+                        <span>{Number(total.amount).toFixed(2)} د</span>
+                      </div>
+                    ))}
+                    <div className="flex justify-between font-bold border-t pt-1">
+                      <span>النقد المتوقع</span>
+                      <span>{Number(xReport.expected_cash).toFixed(2)} د</span>
+                    </div>
+                  </div>
+                )}
+
                 <div>
                   <label className="block text-sm font-medium mb-2">المبلغ الفعلي في الصندوق *</label>
                   <input